@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+
+"""
+    Scale benchmark of the supervisor
+
+    Generates N conf.d files with M forwardings each, starts tunman with "ssh" and "sshpass" replaced by local stubs
+    (see ./stubs) that listen on the forwarded ports, then measures:
+      - time until all tunnels are healthy
+      - CPU usage, RSS and thread count of the supervisor in steady state
+      - detection and restart latency after killing a part of the tunnel processes
+      - time of the graceful shutdown
+
+    Usage:
+        python3 benchmarks/supervisor.py --sizes 1x10,10x10,50x20 --engine threads
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Lock, Thread
+from typing import Dict, List, Tuple
+
+import psutil
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARKS_DIR)
+STUBS_DIR = BENCHMARKS_DIR + '/stubs'
+
+CONFIGURATION_TEMPLATE = '''
+REMOTE_USER = 'bench'
+REMOTE_HOST = 'host-%(host)i.benchmark.local'
+REMOTE_PORT = 22
+REMOTE_PASSWORD = %(password)s
+SSH_OPTS = ''
+
+FORWARD = [
+%(forward)s
+]
+'''
+
+FORWARDING_TEMPLATE = '''    {
+        'local': {'gateway': False, 'host': '127.0.0.1', 'port': %(port)i},
+        'remote': {'gateway': False, 'host': '127.0.0.1', 'port': 80},
+        'validate': {
+            'method': 'local_port_ping',
+            'interval': %(interval)i,
+            'wait_time_before_restart': 1,
+            'kill_existing_tunnel_on_failure': True
+        },
+        'mode': 'local',
+        'retries': 10,
+        'health_check_connect_timeout': 2,
+        'warm_up_time': 1,
+        'time_before_restart_at_initialization': 1,
+        'wait_time_after_all_retries_failed': 5
+    },'''
+
+
+def generate_configuration(path: str, hosts: int, forwardings: int, base_port: int, interval: int,
+                           password: bool) -> int:
+    """ Writes conf.d/host-*.py files, returns the number of forwardings """
+
+    os.makedirs(path + '/conf.d', exist_ok=True)
+    port = base_port
+
+    for host in range(hosts):
+        forward = []
+
+        for _ in range(forwardings):
+            forward.append(FORWARDING_TEMPLATE % {'port': port, 'interval': interval})
+            port += 1
+
+        with open('%s/conf.d/host-%04i.py' % (path, host), 'w') as f:
+            f.write(CONFIGURATION_TEMPLATE % {
+                'host': host,
+                'password': "'bench'" if password else 'None',
+                'forward': "\n".join(forward)
+            })
+
+    return port - base_port
+
+
+class EventRecorder(object):
+    """ Follows the /events stream and remembers when each forwarding went up and down """
+
+    states: Dict[str, bool]
+    ports: Dict[int, str]
+    history: List[Tuple[float, str, str]]
+
+    def __init__(self, url: str):
+        self._url = url
+        self._lock = Lock()
+        self.states = {}
+        self.ports = {}
+        self.history = []
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self._follow()
+            except requests.RequestException:
+                time.sleep(0.1)
+
+    def _follow(self):
+        with requests.get(self._url, stream=True, timeout=60) as response:
+            event_type = ''
+
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event: '):
+                    event_type = line[7:]
+                elif line.startswith('data: '):
+                    self._on_event(event_type, json.loads(line[6:]), time.monotonic())
+
+    def _on_event(self, event_type: str, data: dict, at: float):
+        with self._lock:
+            if event_type == 'snapshot':
+                for entry in data['forwardings']:
+                    self._on_entry(entry)
+                return
+
+            self._on_entry(data['forwarding'])
+            self.history.append((at, event_type, data['ident']))
+
+    def _on_entry(self, entry: dict):
+        self.states[entry['ident']] = entry['is_alive']
+        match = re.search(r'-L [0-9.]+:([0-9]+):', entry['signature'] or '')
+
+        if match:
+            self.ports[int(match.group(1))] = entry['ident']
+
+    def count_alive(self) -> int:
+        with self._lock:
+            return len([is_alive for is_alive in self.states.values() if is_alive])
+
+    def first_event_after(self, ident: str, event_type: str, since: float) -> float:
+        with self._lock:
+            for at, recorded_type, recorded_ident in self.history:
+                if recorded_ident == ident and recorded_type == event_type and at >= since:
+                    return at
+
+        return 0
+
+
+class SupervisorUnderTest(object):
+    def __init__(self, config_path: str, http_port: int, engine: str):
+        self._config_path = config_path
+        self._http_port = http_port
+        self._engine = engine
+        self.proc = None
+        self.process = None
+
+    def start(self):
+        env = dict(os.environ)
+        env['PATH'] = STUBS_DIR + os.pathsep + env.get('PATH', '')
+        env['PYTHONPATH'] = PROJECT_ROOT
+
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', 'from tunman import main; main()', 'start',
+             '--config', self._config_path, '--port', str(self._http_port), '--listen', '127.0.0.1',
+             '--engine', self._engine],
+            cwd=self._config_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.process = psutil.Process(self.proc.pid)
+
+    def stop(self) -> float:
+        """ :return: Time the supervisor took to exit """
+
+        children = self.process.children(recursive=True)
+        started_at = time.monotonic()
+        self.proc.send_signal(signal.SIGINT)
+
+        try:
+            self.proc.wait(60)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+        elapsed = time.monotonic() - started_at
+
+        for child in children:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+        return elapsed
+
+    def get_cpu_time(self) -> float:
+        times = self.process.cpu_times()
+
+        return times.user + times.system
+
+    def sample(self) -> dict:
+        return {
+            'rss_mb': round(self.process.memory_info().rss / 1024 / 1024, 1),
+            'threads': self.process.num_threads(),
+            'children': len(self.process.children(recursive=True))
+        }
+
+    def find_tunnel_processes(self, port: int) -> List[psutil.Process]:
+        pattern = ':%i:' % port
+        found = []
+
+        for child in self.process.children(recursive=True):
+            try:
+                if pattern in ' '.join(child.cmdline()):
+                    found.append(child)
+            except psutil.NoSuchProcess:
+                pass
+
+        return found
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], percent: int) -> float:
+    if not values:
+        return 0
+
+    values = sorted(values)
+
+    return round(values[min(int(len(values) * percent / 100), len(values) - 1)], 3)
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+
+        time.sleep(0.1)
+
+    return False
+
+
+def run_scenario(hosts: int, forwardings: int, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix='tunman-bench-') as path:
+        total = generate_configuration(path, hosts, forwardings, args.base_port, args.interval, args.password)
+        http_port = get_free_port()
+        supervisor = SupervisorUnderTest(path, http_port, args.engine)
+        recorder = EventRecorder('http://127.0.0.1:%i/events' % http_port)
+        result = {'hosts': hosts, 'forwardings_per_host': forwardings, 'tunnels': total, 'engine': args.engine}
+
+        started_at = time.monotonic()
+        supervisor.start()
+
+        try:
+            recorder.start()
+
+            all_healthy = wait_until(lambda: recorder.count_alive() == total, args.timeout)
+            result['time_to_all_healthy'] = round(time.monotonic() - started_at, 2) if all_healthy else None
+            result['healthy'] = recorder.count_alive()
+
+            # steady state
+            cpu_before = supervisor.get_cpu_time()
+            time.sleep(args.steady_time)
+            result['steady_cpu_percent'] = round(
+                (supervisor.get_cpu_time() - cpu_before) / args.steady_time * 100, 2)
+            result.update(supervisor.sample())
+
+            result.update(measure_recovery(supervisor, recorder, args))
+        finally:
+            result['shutdown_time'] = round(supervisor.stop(), 2)
+
+        return result
+
+
+def measure_recovery(supervisor: SupervisorUnderTest, recorder: EventRecorder, args) -> dict:
+    """ Kills a part of the tunnels and measures how fast the supervisor notices it and restores the tunnels """
+
+    ports = list(recorder.ports.keys())
+    victims = random.sample(ports, max(1, int(len(ports) * args.kill_fraction))) if ports else []
+    killed_at = time.monotonic()
+
+    for port in victims:
+        for proc in supervisor.find_tunnel_processes(port):
+            try:
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+    idents = [recorder.ports[port] for port in victims]
+
+    wait_until(lambda: all(recorder.first_event_after(ident, 'up', killed_at) for ident in idents), args.timeout)
+
+    detection = [recorder.first_event_after(ident, 'down', killed_at) - killed_at for ident in idents
+                 if recorder.first_event_after(ident, 'down', killed_at)]
+    restart = [recorder.first_event_after(ident, 'up', killed_at) - killed_at for ident in idents
+               if recorder.first_event_after(ident, 'up', killed_at)]
+
+    return {
+        'killed': len(idents),
+        'recovered': len(restart),
+        'detection_p50': percentile(detection, 50),
+        'detection_max': round(max(detection), 3) if detection else None,
+        'restart_p50': percentile(restart, 50),
+        'restart_max': round(max(restart), 3) if restart else None
+    }
+
+
+def parse_sizes(sizes: str) -> List[Tuple[int, int]]:
+    return [tuple(int(part) for part in size.split('x')) for size in sizes.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scale benchmark of the supervisor, using a fake ssh binary')
+    parser.add_argument('--sizes', default='1x10,10x10,50x20', help='Comma separated HOSTSxFORWARDINGS, ex. 1x10,100x20')
+    parser.add_argument('--engine', default='threads', help='Supervisor engine: threads, asyncio')
+    parser.add_argument('--interval', default=5, type=int, help='Health check interval')
+    parser.add_argument('--steady-time', default=10, type=float, help='Seconds of measuring the steady state')
+    parser.add_argument('--kill-fraction', default=0.1, type=float, help='Part of the tunnels to kill')
+    parser.add_argument('--timeout', default=900, type=float, help='Max. seconds to wait for the tunnels to be healthy')
+    parser.add_argument('--base-port', default=30000, type=int, help='First local port to forward')
+    parser.add_argument('--password', action='store_true', help='Use password authentication (goes through sshpass)')
+    parser.add_argument('--output', default='', help='Write results as JSON to the file')
+    args = parser.parse_args()
+
+    results = []
+
+    for hosts, forwardings in parse_sizes(args.sizes):
+        result = run_scenario(hosts, forwardings, args)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
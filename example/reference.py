@@ -16,6 +16,15 @@ REMOTE_PORT = 22
 REMOTE_KEY = '~/.ssh/id_rsa'
 SSH_OPTS = ''
 
+# Multiplexing: open a single master SSH connection to the host and add all forwardings to it
+# via the control socket (ssh -O forward). Restarting a forwarding does not require a new connection then.
+# The "use_autossh" option is not used in this mode.
+SSH_MULTIPLEXING = False
+
+# Seconds after which the template variables ({{ remote_gw }}, {{ remote_docker_host }}...) are resolved again
+# (defaults to TUNMAN_VARIABLES_TTL). A tunnel that keeps failing resolves the variables it uses earlier.
+VARIABLES_TTL = 3600
+
 # ==========================================================================
 #  Defined SSH tunnels that will be forwarded via SSH host specified above
 # ==========================================================================
@@ -12,12 +12,12 @@ from tornado.web import Application, StaticFileHandler
 try:
     from .tunman.settings import Config
     from .tunman.app import TunManApplication
-    from .tunman.views import ServeStatusHandler, ServeJsonStatus
+    from .tunman.views import ServeStatusHandler, ServeJsonStatus, ServeEventStream, ServeMetrics, ServeReload
     from .tunman.settings import ProdConfig, DevConfig
 except ImportError:
     from tunman.settings import Config
     from tunman.app import TunManApplication
-    from tunman.views import ServeStatusHandler, ServeJsonStatus
+    from tunman.views import ServeStatusHandler, ServeJsonStatus, ServeEventStream, ServeMetrics, ServeReload
     from tunman.settings import ProdConfig, DevConfig
 
 
@@ -53,6 +53,9 @@ def spawn_server(tunman: TunManApplication, port: int, address: str = '', secret
     srv = Application([
         (r"" + prefix + "static/(.*)", StaticFileHandler, {'path': os.path.dirname(os.path.abspath(__file__)) + '/tunman/static'}),
         (r"" + prefix + "health", ServeJsonStatus),
+        (r"" + prefix + "events", ServeEventStream),
+        (r"" + prefix + "metrics", ServeMetrics),
+        (r"" + prefix + "reload", ServeReload),
         (r"" + prefix, ServeStatusHandler)
     ])
 
@@ -110,6 +113,11 @@ def main():
         help='Environment: debug, prod',
         default=os.getenv('TUNMAN_ENV', 'prod')
     )
+    parser.add_argument(
+        '--engine',
+        help='Supervisor engine: threads, asyncio',
+        default=os.getenv('TUNMAN_ENGINE', 'threads')
+    )
 
     parsed = parser.parse_args()
     config = ProdConfig() if parsed.env == 'prod' else DevConfig()
@@ -117,6 +125,7 @@ def main():
     config.PORT = parsed.port
     config.LISTEN = parsed.listen
     config.SECRET_PREFIX = parsed.secret_prefix
+    config.ENGINE = parsed.engine
 
     start_application(config, parsed.action)
 
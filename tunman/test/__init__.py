@@ -1,4 +1,25 @@
 
 from .test_model_host_tunnel_definitions import HostTunnelDefinitionsTest
 from .test_manager import ManagerTest
+from .test_manager_aio import AsyncManagerTest
 from .test_ipparser import ParsedNetworkingInformationTest
+from .test_registry import ProcessRegistryTest
+from .test_proctable import ProcessTableSnapshotTest
+from .test_scheduler import SchedulerTest
+from .test_portcheck import PortCheckEngineTest
+from .test_remotecheck import RemotePortCheckBatcherTest
+from .test_ssh import SSHClientTest
+from .test_notify import NotificationDispatcherTest
+from .test_status import StatusBoardTest
+from .test_metrics import MetricsTest
+from .test_healthstats import HealthCheckHistoryTest
+from .test_ratelimit import SpawnRateLimiterTest
+from .test_childwatch import ChildWatcherTest
+from .test_ssherrors import SSHErrorClassifierTest
+from .test_sysprocess import SystemProcessManagerTest
+from .test_prefetch import VariablesPrefetcherTest
+from .test_varcache import VariablesCacheTest
+from .test_resolver import DNSResolverTest
+from .test_reload import ConfigurationDiffTest
+from .test_declarative import DeclarativeLoaderTest
+from .test_multiplex import ControlMasterManagerTest
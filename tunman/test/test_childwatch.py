@@ -0,0 +1,105 @@
+import os
+import sys
+import subprocess
+import unittest
+from threading import Event
+from time import monotonic, sleep
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.childwatch import ChildWatcher
+from ..tunman.logger import setup_dummy_logger
+
+
+class ChildWatcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_exit_is_delivered_without_waiting_for_the_poll_interval(self):
+        watcher = ChildWatcher(poll_interval=0.05 if not hasattr(os, 'pidfd_open') else 30)
+        proc = subprocess.Popen(['sleep', '0.2'])
+        exited = Event()
+        reaped = []
+
+        started_at = monotonic()
+        watcher.watch(proc, 'Forward[:3306]', lambda p: reaped.append(p.returncode) or exited.set())
+
+        self.assertTrue(exited.wait(5))
+        self.assertLess(monotonic() - started_at, 2)
+        self.assertEqual([0], reaped)
+
+    def test_unwatched_process_does_not_notify(self):
+        watcher = ChildWatcher(poll_interval=0.05)
+        proc = subprocess.Popen(['sleep', '0.1'])
+        exited = Event()
+
+        watcher.watch(proc, 'Forward[:3306]', lambda p: exited.set())
+        watcher.unwatch(proc, 'Forward[:3306]')
+        proc.wait()
+
+        self.assertFalse(exited.wait(0.3))
+
+    def test_stderr_is_streamed_before_the_exit_and_replayed_to_late_subscribers(self):
+        watcher = ChildWatcher(poll_interval=0.05)
+        proc = subprocess.Popen('echo "bind [127.0.0.1]:3306: Address already in use" >&2; sleep 0.3; echo last >&2',
+                                shell=True, stderr=subprocess.PIPE)
+        watcher.add(proc)
+        sleep(0.2)
+
+        lines = []
+        exited = Event()
+        watcher.watch(proc, 'Forward[:3306]', lambda p: exited.set(), lines.append)
+
+        self.assertEqual(['bind [127.0.0.1]:3306: Address already in use'], lines)
+        self.assertTrue(exited.wait(5))
+        self.assertEqual(['bind [127.0.0.1]:3306: Address already in use', 'last'], lines)
+
+    def test_process_that_exited_before_watching_delivers_its_output_and_exit(self):
+        watcher = ChildWatcher(poll_interval=0.05)
+        proc = subprocess.Popen('echo "Permission denied (publickey)." >&2; exit 255', shell=True,
+                                stderr=subprocess.PIPE)
+        watcher.add(proc)
+        proc.wait()
+        sleep(0.3)  # collected by the watcher in the meantime
+
+        lines = []
+        exit_codes = []
+        watcher.watch(proc, 'Forward[:3306]', lambda p: exit_codes.append(p.returncode), lines.append)
+
+        self.assertEqual(['Permission denied (publickey).'], lines)
+        self.assertEqual([255], exit_codes)
+
+        # the watcher still supervises other processes
+        other = subprocess.Popen(['sleep', '0.1'])
+        exited = Event()
+        watcher.watch(other, 'Forward[:3307]', lambda p: exited.set())
+
+        self.assertTrue(exited.wait(5))
+        self.assertTrue(watcher._thread.is_alive())
+
+    def test_closed_stderr_does_not_stop_the_watcher(self):
+        watcher = ChildWatcher(poll_interval=0.05)
+        proc = subprocess.Popen(['sleep', '0.1'], stderr=subprocess.PIPE)
+        proc.stderr.close()
+        exited = Event()
+
+        watcher.watch(proc, 'Forward[:3306]', lambda p: exited.set())
+
+        self.assertTrue(exited.wait(5))
+        self.assertTrue(watcher._thread.is_alive())
+
+    def test_only_lines_written_after_the_offset_are_replayed(self):
+        watcher = ChildWatcher(poll_interval=0.05)
+        proc = subprocess.Popen('echo "bind [127.0.0.1]:3306: Address already in use" >&2; sleep 0.3; echo new >&2; '
+                                'sleep 0.3', shell=True, stderr=subprocess.PIPE)
+        watcher.add(proc)
+        sleep(0.2)
+        offset = watcher.get_output_offset(proc)
+        sleep(0.3)
+
+        lines = []
+        watcher.watch(proc, 'Forward[:3307]', lambda p: None, lines.append, since=offset)
+        proc.wait()
+
+        self.assertEqual(1, offset)
+        self.assertEqual(['new'], lines)
@@ -0,0 +1,131 @@
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+from ..tunman.declarative import DeclarativeLoader
+from ..tunman.exceptions import ConfigurationError
+from ..tunman.factory import ConfigurationFactory
+from ..tunman.logger import setup_dummy_logger
+
+YAML_CONFIGURATION = '''
+REMOTE_USER: proxyuser
+REMOTE_HOST: remote-host.org
+REMOTE_PORT: 22
+REMOTE_KEY: ~/.ssh/id_rsa
+VARIABLES_TTL: 600
+
+FORWARD:
+  - local: {gateway: true, host: "", port: 8010}
+    remote: {host: "{{ remote_gw }}", port: 80}
+    validate: {method: local_port_ping, interval: 60}
+    mode: local
+    retries: 15
+'''
+
+TOML_CONFIGURATION = '''
+[[HOSTS]]
+REMOTE_USER = "proxyuser"
+REMOTE_HOST = "first.org"
+REMOTE_PORT = 22
+FORWARD = []
+
+[[HOSTS]]
+REMOTE_USER = "proxyuser"
+REMOTE_HOST = "second.org"
+REMOTE_PORT = 2222
+
+[[HOSTS.FORWARD]]
+mode = "remote"
+local = {port = 80}
+remote = {host = "127.0.0.1", port = 8080}
+'''
+
+
+def create_forwarding(**options) -> dict:
+    return dict({'local': {'port': 8010}, 'remote': {'host': '127.0.0.1', 'port': 80}, 'mode': 'local'}, **options)
+
+
+class DeclarativeLoaderTest(unittest.TestCase):
+    def setUp(self):
+        setup_dummy_logger()
+
+    def _write(self, path: str, content: str):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_yaml_file_is_parsed_into_a_host_definition(self):
+        with TemporaryDirectory() as path:
+            os.mkdir(path + '/conf.d')
+            self._write(path + '/conf.d/host.yaml', YAML_CONFIGURATION)
+
+            config = Mock()
+            config.CONFIG_PATH = path
+            config.VARIABLES_TTL = 3600
+
+            definitions = ConfigurationFactory(config).provide_all_configurations()
+
+        self.assertEqual(1, len(definitions))
+        self.assertEqual('proxyuser@remote-host.org:22', definitions[0].ident)
+        self.assertEqual('', definitions[0].ssh_opts)
+        self.assertEqual(600, definitions[0].variables_ttl)
+        self.assertIsNone(definitions[0].variables_post_processor)
+
+        forwarding = definitions[0].forward[0]
+        self.assertTrue(forwarding.local.gateway)
+        self.assertEqual('{{ remote_gw }}', forwarding.remote.host)
+        self.assertEqual('local_port_ping', forwarding.validate.method)
+        self.assertEqual(10, forwarding.validate.wait_time_before_restart)
+        self.assertEqual(15, forwarding.retries)
+
+    def test_toml_file_describes_multiple_hosts(self):
+        with TemporaryDirectory() as path:
+            self._write(path + '/hosts.toml', TOML_CONFIGURATION)
+            hosts = DeclarativeLoader().load(path + '/hosts.toml')
+
+        self.assertEqual(['first.org', 'second.org'], [host.REMOTE_HOST for host in hosts])
+        self.assertEqual('remote', hosts[1].FORWARD[0]['mode'])
+        self.assertEqual({}, hosts[1].FORWARD[0]['validate'])
+
+    def test_schema_errors_point_at_the_option(self):
+        cases = [
+            ({'REMOTE_HOST': 'a.org', 'REMOTE_PORT': 22, 'FORWARD': []}, 'missing required option "REMOTE_USER"'),
+            ({'REMOTE_USER': 'a', 'REMOTE_HOST': 'a.org', 'REMOTE_PORT': '22', 'FORWARD': []},
+             '"REMOTE_PORT" should be of type int, got str'),
+            ({'REMOTE_USER': 'a', 'REMOTE_HOST': 'a.org', 'REMOTE_PORT': 22, 'FORWARDS': []},
+             'unknown option "FORWARDS"'),
+            ({'REMOTE_USER': 'a', 'REMOTE_HOST': 'a.org', 'REMOTE_PORT': 22,
+              'FORWARD': [create_forwarding(mode='both')]}, 'FORWARD[0]: "mode" should be one of: local, remote'),
+            ({'REMOTE_USER': 'a', 'REMOTE_HOST': 'a.org', 'REMOTE_PORT': 22,
+              'FORWARD': [create_forwarding(), create_forwarding(local={'port': True})]},
+             'FORWARD[1].local: "port" should be of type int or str, got bool'),
+        ]
+
+        with TemporaryDirectory() as path:
+            for num, (data, expected_error) in enumerate(cases):
+                self._write(path + '/%i.json' % num, json.dumps(data))
+
+                with self.assertRaises(ConfigurationError) as context:
+                    DeclarativeLoader().load(path + '/%i.json' % num)
+
+                self.assertIn(expected_error, str(context.exception))
+
+    def test_file_is_parsed_again_only_after_modification(self):
+        loader = DeclarativeLoader()
+        data = {'REMOTE_USER': 'a', 'REMOTE_HOST': 'a.org', 'REMOTE_PORT': 22, 'FORWARD': [create_forwarding()]}
+
+        with TemporaryDirectory() as path:
+            self._write(path + '/host.json', json.dumps(data))
+
+            with patch.object(loader, '_read', wraps=loader._read) as read:
+                loader.load(path + '/host.json')
+                hosts = loader.load(path + '/host.json')
+
+                self.assertEqual(1, read.call_count)
+                self.assertEqual('a.org', hosts[0].REMOTE_HOST)
+
+                self._write(path + '/host.json', json.dumps(dict(data, REMOTE_HOST='b.org')))
+                hosts = loader.load(path + '/host.json')
+
+                self.assertEqual(2, read.call_count)
+                self.assertEqual('b.org', hosts[0].REMOTE_HOST)
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.healthstats import HealthCheckHistory
+
+
+class HealthCheckHistoryTest(unittest.TestCase):
+    def test_oldest_probes_are_overwritten(self):
+        history = HealthCheckHistory(size=3)
+
+        for second in range(5):
+            history.record(second / 1000, True, at=1000 + second)
+
+        self.assertEqual(3, len(history))
+        self.assertEqual([(0.002, True), (0.003, True), (0.004, True)], history.get_window(3600, now=1005))
+
+    def test_percentiles_per_sliding_window(self):
+        history = HealthCheckHistory()
+
+        # an old, slow probe is outside of the shortest window
+        history.record(0.5, True, at=1000)
+
+        for rtt in range(1, 101):
+            history.record(rtt / 1000, True, at=1200)
+
+        history.record(15, False, at=1200)
+
+        summary = history.get_summary(windows=(('1m', 60), ('5m', 300)), now=1230)
+
+        self.assertEqual({'checks': 101, 'failures': 1, 'p50': 50.0, 'p95': 95.0, 'p99': 99.0}, summary['1m'])
+        self.assertEqual(102, summary['5m']['checks'])
+        self.assertEqual(51.0, summary['5m']['p50'])
+
+    def test_empty_window_has_no_percentiles(self):
+        summary = HealthCheckHistory().get_summary(windows=(('1m', 60),))
+
+        self.assertEqual({'checks': 0, 'failures': 0, 'p50': None, 'p95': None, 'p99': None}, summary['1m'])
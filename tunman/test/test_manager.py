@@ -110,3 +110,80 @@ class ManagerTest(unittest.TestCase):
                     manager._tunnel_loop(Mock(), fw, config, '-L 127.0.0.1:3306:192.168.1.5:3306')
 
                     assert manager.spawn_ssh_process.call_count == 0
+
+    def test_signature_is_re_derived_after_failures_in_a_row(self):
+        fw, config = self.prepare_data()
+        fw.remote.host = '{{ remote_gw }}'
+        config.remote_user, config.remote_host, config.remote_port = 'riotkit', 'localhost', 22
+        config.remote_key, config.ssh_opts, config.forward = '', '', [fw]
+        config.variables_post_processor = None
+        config.restore_variables({'get_remote_gateway': '10.1.1.1'})
+
+        manager = TunnelManager(invalidate_after_failures=2)
+        signature = manager._create_signature(fw)
+        manager._proc_manager.registry.register(signature, 12345)
+
+        self.assertIn('10.1.1.1:2222', signature)
+        self.assertEqual(signature, manager._refresh_signature(fw, signature))
+
+        new_signature = manager._refresh_signature(fw, signature)
+
+        self.assertIn('127.0.0.1:2222', new_signature)
+        self.assertEqual([new_signature], manager._signatures)
+        self.assertEqual([], manager._proc_manager.registry.get_pids(signature))
+        self.assertEqual(new_signature, manager.status.get_snapshot()['forwardings'][0]['signature'])
+
+    def test_process_that_failed_at_spawn_is_classified_by_its_stderr(self):
+        fw, config = self.prepare_data()
+        config.remote_user, config.remote_host, config.remote_port = 'riotkit', 'localhost', 22
+        config.forward = [fw]
+        manager = TunnelManager()
+        proc = manager._proc_manager.spawn('echo "Permission denied (publickey)." >&2; exit 255')
+
+        wake_key = manager._watch_process(fw, proc)
+        manager._carefully_sleep(5, wake_key)  # woken up by the exit, as during the warm up
+
+        self.assertEqual('auth_failed', manager._pop_process_error(wake_key))
+        self.assertIn('Permission denied', manager._get_process_output(wake_key))
+        self.assertTrue(manager._child_watcher._thread.is_alive())
+        manager._unwatch_process(fw, proc, wake_key)
+
+    def test_shared_master_output_is_attributed_by_the_listen_port(self):
+        fw, config = self.prepare_data()
+        config.remote_user, config.remote_host, config.remote_port = 'riotkit', 'localhost', 22
+        config.forward, config.multiplexing = [fw], True
+        manager = TunnelManager()
+        pattern = manager._create_listen_port_pattern(fw)
+
+        manager._on_process_output(fw, 'bind [127.0.0.1]:33060: Address already in use', 'key', pattern)
+        self.assertIsNone(manager._pop_process_error('key'))
+
+        manager._on_process_output(fw, 'bind [192.168.1.5]:22: Address already in use', 'key', pattern)
+        self.assertEqual('local_bind_failed', manager._pop_process_error('key'))
+
+    def test_signature_is_replaced_when_revalidated_variables_change(self):
+        fw, config = self.prepare_data()
+        fw.remote.host = '{{ remote_gw }}'
+        config.remote_user, config.remote_host, config.remote_port = 'riotkit', 'localhost', 22
+        config.remote_key, config.ssh_opts, config.forward = '', '', [fw]
+        config.variables_post_processor = None
+        config.restore_variables({'get_remote_gateway': '10.9.9.9'})
+
+        manager = TunnelManager()
+        signature = manager._create_signature(fw)
+        manager._proc_manager.registry.register(signature, 12345)
+        manager._proc_manager.kill_process_by_signature = Mock()
+
+        self.assertEqual(['get_remote_gateway'], config.revalidate_variables())
+        manager.refresh_signatures(config, ['get_remote_gateway'])
+
+        new_signature = manager._signatures[0]
+        self.assertIn('127.0.0.1:2222', new_signature)
+        self.assertEqual([new_signature], manager._signatures)
+        self.assertEqual([], manager._proc_manager.registry.get_pids(signature))
+        self.assertEqual(new_signature, manager.status.get_snapshot()['forwardings'][0]['signature'])
+        manager._proc_manager.kill_process_by_signature.assert_called_once_with(signature)
+
+        # the supervisor, that restarts the killed tunnel, continues with the replaced signature
+        self.assertEqual(new_signature, manager._refresh_signature(fw, signature))
+        self.assertEqual([new_signature], manager._signatures)
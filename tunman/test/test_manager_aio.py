@@ -0,0 +1,120 @@
+import os
+import sys
+import asyncio
+import unittest
+from collections import deque
+from concurrent.futures import Future
+from threading import current_thread
+from time import monotonic
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.aio import AsyncTunnelManager, Validation
+from ..tunman.manager.ssh import SIGNAL_RESTART, SIGNAL_TERMINATE
+from .test_manager import ManagerTest
+
+
+def run_tunnel_loop(manager: AsyncTunnelManager, proc, fw, config) -> int:
+    async def loop():
+        manager._bind_to_loop()
+        return await manager._tunnel_loop(proc, fw, config, '-L 127.0.0.1:3306:192.168.1.5:3306')
+
+    return asyncio.new_event_loop().run_until_complete(loop())
+
+
+class AsyncManagerTest(unittest.TestCase):
+    def prepare_data(self):
+        return ManagerTest.prepare_data(self)
+
+    @staticmethod
+    def create_running_process() -> Mock:
+        proc = Mock()
+        proc.poll.return_value = None
+
+        return proc
+
+    def test_tunnel_loop_spawns_tunnel_on_died_process(self):
+        fw, config = self.prepare_data()
+
+        with patch.object(Validation, 'is_process_alive') as is_process_alive_mock:
+            is_process_alive_mock.return_value = False
+
+            result = run_tunnel_loop(AsyncTunnelManager(), self.create_running_process(), fw, config)
+
+            assert result == SIGNAL_RESTART
+
+    def test_tunnel_loop_spawns_tunnel_on_health_check_failed(self):
+        fw, config = self.prepare_data()
+
+        with patch.object(Validation, 'is_process_alive') as is_process_alive_mock:
+            is_process_alive_mock.return_value = True
+
+            with patch.object(Validation, 'check_tunnel_alive') as check_tunnel_alive_mock:
+                check_tunnel_alive_mock.return_value = False
+
+                result = run_tunnel_loop(AsyncTunnelManager(), self.create_running_process(), fw, config)
+
+                assert result == SIGNAL_RESTART
+
+    def test_tunnel_loop_exits_on_termination(self):
+        fw, config = self.prepare_data()
+        manager = AsyncTunnelManager()
+        manager.is_terminating = True
+
+        result = run_tunnel_loop(manager, self.create_running_process(), fw, config)
+
+        assert result == SIGNAL_TERMINATE
+
+    def test_recovery_wait_does_not_occupy_a_worker(self):
+        fw, config = self.prepare_data()
+        config.restart_all_on_forward_failure = True
+        config.ssh_kill_all_sessions_on_remote = Mock()
+
+        manager = AsyncTunnelManager()
+        manager._recovery_wait_time = 0.3
+        manager._kill_tunnel = Mock()
+        manager._process_errors['key'] = 'remote_bind_failed'
+        manager._process_output['key'] = deque(['Warning: remote port forwarding failed for listen port 2222'])
+
+        recover = manager._recover_from_error
+        time_in_worker = []
+        manager._recover_from_error = lambda *args: time_in_worker.append(monotonic()) or recover(*args) \
+            or time_in_worker.append(monotonic())
+
+        async def loop():
+            manager._bind_to_loop()
+            started_at = monotonic()
+            result = await manager._tunnel_loop(self.create_running_process(), fw, config, '-L 3306', 'key')
+
+            return result, monotonic() - started_at
+
+        result, elapsed = asyncio.new_event_loop().run_until_complete(loop())
+
+        self.assertEqual(SIGNAL_RESTART, result)
+        config.ssh_kill_all_sessions_on_remote.assert_called_once()
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(time_in_worker[-1] - time_in_worker[0], 0.1)
+
+    def test_health_check_is_submitted_outside_of_the_loop(self):
+        fw, config = self.prepare_data()
+        manager = AsyncTunnelManager()
+        threads = []
+
+        def submit_health_check(definition, configuration) -> Future:
+            # parsing the host could resolve an expired variable here
+            threads.append(current_thread().name)
+            future = Future()
+            future.set_result(True)
+
+            return future
+
+        async def check():
+            manager._bind_to_loop()
+            return await manager._check_tunnel_alive(fw, config)
+
+        with patch.object(Validation, 'submit_health_check', side_effect=submit_health_check):
+            self.assertTrue(asyncio.new_event_loop().run_until_complete(check()))
+
+        self.assertEqual(1, len(threads))
+        self.assertTrue(threads[0].startswith('tunman-worker'))
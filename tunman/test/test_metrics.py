@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+class MetricsTest(unittest.TestCase):
+    def test_counter_and_gauge_are_rendered_per_label_set(self):
+        registry = MetricsRegistry()
+        restarts = registry.register(Counter('restarts_total', 'Restarts', ['forwarding', 'host']))
+        processes = registry.register(Gauge('processes', 'Processes'))
+
+        restarts.inc(forwarding='Forward[a]', host='server')
+        restarts.inc(forwarding='Forward[a]', host='server')
+        restarts.inc(forwarding='Forward["b"]', host='server')
+        processes.set(3)
+
+        self.assertEqual(
+            "# HELP restarts_total Restarts\n"
+            "# TYPE restarts_total counter\n"
+            'restarts_total{forwarding="Forward[a]",host="server"} 2\n'
+            'restarts_total{forwarding="Forward[\\"b\\"]",host="server"} 1\n'
+            "# HELP processes Processes\n"
+            "# TYPE processes gauge\n"
+            "processes 3\n",
+            registry.render()
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('check_seconds', 'Checks', ['host'], buckets=(0.1, 1))
+
+        histogram.observe(0.05, host='server')
+        histogram.observe(0.5, host='server')
+        histogram.observe(5, host='server')
+
+        self.assertEqual([
+            '# HELP check_seconds Checks',
+            '# TYPE check_seconds histogram',
+            'check_seconds_bucket{host="server",le="0.1"} 1',
+            'check_seconds_bucket{host="server",le="1"} 2',
+            'check_seconds_bucket{host="server",le="+Inf"} 3',
+            'check_seconds_sum{host="server"} 5.55',
+            'check_seconds_count{host="server"} 3'
+        ], histogram.render())
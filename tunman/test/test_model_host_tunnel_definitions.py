@@ -4,11 +4,13 @@ import sys
 import unittest
 from ipaddress import IPv4Address
 from typing import List
+from unittest.mock import patch
 from unittest_data_provider import data_provider
 
 sys.path.append(os.path.dirname(__file__) + "/../tunman")
 
-from ..tunman.model import HostTunnelDefinitions
+from ..tunman import model
+from ..tunman.model import HostTunnelDefinitions, Forwarding, LocalPortDefinition, RemotePortDefinition
 from ..tunman.logger import setup_dummy_logger
 
 
@@ -124,6 +126,39 @@ class HostTunnelDefinitionsTest(unittest.TestCase):
 
         assert "Local GW is %s" % gw in parsed
 
+    def test_parse_compiles_template_once_and_skips_plain_strings(self):
+        definition = HostTunnelDefinitions()
+        definition.variables_post_processor = None
+        definition.restore_variables({'get_local_gateway': '10.0.0.5'})
+
+        self.assertEqual('127.0.0.1:3306', definition.parse('127.0.0.1:3306'))
+        self.assertEqual({}, definition._templates)
+
+        self.assertEqual('10.0.0.5:3306', definition.parse('{{ local_gw }}:3306'))
+        compiled = definition._templates['{{ local_gw }}:3306']
+
+        self.assertEqual('10.0.0.5:3306', definition.parse('{{ local_gw }}:3306'))
+        self.assertIs(compiled, definition._templates['{{ local_gw }}:3306'])
+
+    def test_create_control_commands_share_the_master_socket(self):
+        definition = HostTunnelDefinitions()
+        definition.remote_host = 'iwa-ait.org'
+        definition.remote_port = 2222
+        definition.remote_user = 'tunman'
+        definition.remote_key = '/tmp/some-key_rsa'
+        definition.remote_password = ''
+        definition.ssh_opts = ''
+
+        socket_path = definition.get_control_socket_path()
+        master = definition.create_control_master_command()
+        forward = definition.create_control_command('forward', '-L 127.0.0.1:3306:db:3306')
+
+        assert '-M -S %s' % socket_path in master
+        assert '-i /tmp/some-key_rsa' in master
+        assert '-S %s -O forward -L 127.0.0.1:3306:db:3306' % socket_path in forward
+        assert '-M ' not in forward
+        assert 'tunman@iwa-ait.org' in forward
+
     def test_create_ssh_keyscan_command(self):
         definition = HostTunnelDefinitions()
         definition.remote_port = 2222
@@ -134,3 +169,97 @@ class HostTunnelDefinitionsTest(unittest.TestCase):
         assert "ssh-keyscan" in out
         assert "-p 2222" in out
         assert "iwa-ait.org" in out
+
+    def test_prefetch_variables_resolves_only_the_used_variables(self):
+        definition = HostTunnelDefinitions()
+        definition.variables_post_processor = None
+        definition.restore_variables({'get_local_gateway': '10.0.0.5', 'get_remote_gateway': '192.168.1.2'})
+
+        local = LocalPortDefinition(gateway=False, host='{{ local_gw }}', port=3306, configuration=definition)
+        remote = RemotePortDefinition(gateway=False, host='{{ remote_gw }}', port=3306, configuration=definition)
+        definition.forward = [
+            Forwarding(configuration=definition, local=local, remote=remote, validate=None, mode='local',
+                       retries=1, use_autossh=False, health_check_connect_timeout=1, warm_up_time=0,
+                       time_before_restart_at_initialization=0, wait_time_after_all_retries_failed=0)
+        ]
+
+        with patch.object(definition, 'get_remote_docker_host_ip') as get_remote_docker_host_ip:
+            self.assertEqual(['local_gw', 'remote_gw'], definition.prefetch_variables())
+            get_remote_docker_host_ip.assert_not_called()
+
+        self.assertIn('-L 10.0.0.5:3306:192.168.1.2:3306', definition.forward[0]._cache['create_ssh_forwarding'])
+
+    def test_revalidate_variables_replaces_changed_values(self):
+        definition = HostTunnelDefinitions()
+        definition.variables_post_processor = None
+        definition.remote_host = 'localhost'
+        definition.restore_variables({'get_remote_gateway': '10.1.1.1',
+                                      'get_local_gateway': HostTunnelDefinitions().get_local_gateway()})
+        local = LocalPortDefinition(gateway=False, host='127.0.0.1', port=3306, configuration=definition)
+        remote = RemotePortDefinition(gateway=False, host='{{ remote_gw }}', port=3306, configuration=definition)
+        forwarding = Forwarding(configuration=definition, local=local, remote=remote, validate=None, mode='local',
+                                retries=1, use_autossh=False, health_check_connect_timeout=1, warm_up_time=0,
+                                time_before_restart_at_initialization=0, wait_time_after_all_retries_failed=0)
+        definition.forward = [forwarding]
+
+        self.assertEqual('10.1.1.1:3306', definition.parse('{{ remote_gw }}:3306'))
+        self.assertIn(':10.1.1.1:3306', forwarding.create_ssh_forwarding_signature())
+
+        self.assertEqual(['get_remote_gateway'], definition.revalidate_variables())
+        self.assertEqual('127.0.0.1:3306', definition.parse('{{ remote_gw }}:3306'))
+
+        # the signature, created before with the restored value, reflects the revalidated one
+        self.assertIn(':127.0.0.1:3306', forwarding.create_ssh_forwarding_signature())
+
+    def test_values_revalidated_before_a_failure_are_reported(self):
+        definition = HostTunnelDefinitions()
+        definition.variables_post_processor = None
+        definition.remote_user, definition.remote_host, definition.remote_port = 'riotkit', 'iwa-ait.org', 22
+        definition.restore_variables({'get_local_gateway': '10.0.0.5', 'get_remote_gateway': '10.1.1.1'})
+        local = LocalPortDefinition(gateway=False, host='{{ local_gw }}', port=3306, configuration=definition)
+        remote = RemotePortDefinition(gateway=False, host='{{ remote_gw }}', port=3306, configuration=definition)
+        forwarding = Forwarding(configuration=definition, local=local, remote=remote, validate=None, mode='local',
+                                retries=1, use_autossh=False, health_check_connect_timeout=1, warm_up_time=0,
+                                time_before_restart_at_initialization=0, wait_time_after_all_retries_failed=0)
+        definition.forward = [forwarding]
+
+        self.assertIn('10.0.0.5:3306:10.1.1.1:3306', forwarding.create_ssh_forwarding_signature())
+
+        with patch.object(definition, '_get_parsed_ip_route') as get_parsed_ip_route, \
+                patch.object(model.RESOLVER, 'resolve', side_effect=OSError('Name or service not known')):
+            get_parsed_ip_route.return_value.gateway_interface_ip = '10.0.0.6'
+
+            self.assertEqual(['get_local_gateway'], definition.revalidate_variables())
+
+        self.assertIn('10.0.0.6:3306:10.1.1.1:3306', forwarding.create_ssh_forwarding_signature())
+
+    def test_expired_values_are_resolved_again_and_kept_on_failure(self):
+        definition = HostTunnelDefinitions()
+        definition.variables_post_processor = None
+        definition.variables_ttl = 0
+        definition.remote_user, definition.remote_host, definition.remote_port = 'riotkit', 'localhost', 22
+        definition.forward = []
+        definition.restore_variables({'get_local_gateway': '10.0.0.5'})
+
+        with patch.object(definition, '_get_parsed_ip_route') as get_parsed_ip_route:
+            get_parsed_ip_route.return_value.gateway_interface_ip = '10.0.0.6'
+            self.assertEqual('10.0.0.6:3306', definition.parse('{{ local_gw }}:3306'))
+
+            get_parsed_ip_route.side_effect = Exception('ip: command not found')
+            self.assertEqual('10.0.0.6:3306', definition.parse('{{ local_gw }}:3306'))
+
+    def test_invalidate_variables_affects_only_the_used_values(self):
+        definition = HostTunnelDefinitions()
+        definition.variables_post_processor = None
+        definition.remote_host = 'localhost'
+        definition.restore_variables({'get_local_gateway': '10.0.0.5', 'get_remote_gateway': '10.1.1.1',
+                                      'get_remote_docker_host_ip': '172.17.0.1'})
+
+        self.assertEqual('10.1.1.1:3306', definition.parse('{{ remote_gw }}:3306'))
+        self.assertEqual(['get_remote_gateway'], definition.invalidate_variables(['{{ remote_gw }}', '3306']))
+
+        with patch.object(definition, 'get_remote_docker_host_ip') as get_remote_docker_host_ip:
+            self.assertEqual('127.0.0.1:3306', definition.parse('{{ remote_gw }}:3306'))
+            get_remote_docker_host_ip.assert_not_called()
+
+        self.assertEqual('172.17.0.1', definition.get_resolved_variables()['get_remote_docker_host_ip'])
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+from threading import Event, Thread
+from time import monotonic, sleep
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.multiplex import ControlMasterManager
+from ..tunman.logger import setup_dummy_logger
+
+
+def create_configuration() -> Mock:
+    configuration = Mock()
+    configuration.ident = 'tunman@iwa-ait.org:22'
+    configuration.get_control_socket_path.return_value = '/tmp/tunman-mux-test-not-existing.sock'
+
+    return configuration
+
+
+class ControlMasterManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_host_is_not_locked_while_the_master_is_starting(self):
+        master = Mock(pid=1234)
+        master.poll.return_value = None
+        proc_manager = Mock()
+        proc_manager.spawn.return_value = master
+        ready = Event()
+
+        multiplexer = ControlMasterManager(proc_manager, timeout=5)
+        multiplexer._control = Mock(side_effect=lambda *args: (ready.is_set(), ''))
+        configuration = create_configuration()
+        masters = []
+
+        def ensure_master():
+            masters.append(multiplexer.ensure_master(configuration))
+
+        threads = [Thread(target=ensure_master), Thread(target=ensure_master)]
+
+        for thread in threads:
+            thread.start()
+            sleep(0.1)
+
+        started_at = monotonic()
+        multiplexer.close_forwarding(Mock(ident='Forward[:3306]'), configuration)
+
+        self.assertLess(monotonic() - started_at, 0.5)
+        self.assertTrue(threads[0].is_alive())
+
+        ready.set()
+
+        for thread in threads:
+            thread.join()
+
+        # the second caller waited for the same master, instead of spawning another one
+        self.assertEqual([master, master], masters)
+        self.assertEqual(1, proc_manager.spawn.call_count)
+
+    def test_not_responding_master_is_killed_with_its_process_group(self):
+        previous = Mock(pid=1234)
+        previous.poll.return_value = None
+        proc_manager = Mock()
+        multiplexer = ControlMasterManager(proc_manager, timeout=0)
+        multiplexer._masters['tunman@iwa-ait.org:22'] = previous
+        multiplexer._control = Mock(return_value=(False, ''))
+
+        multiplexer.ensure_master(create_configuration())
+
+        proc_manager.kill_process_group.assert_called_once_with(previous)
@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import unittest
+from time import sleep
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.notify import NotificationDispatcher
+from ..tunman.logger import setup_dummy_logger
+
+
+class NotificationDispatcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_burst_is_coalesced_per_url(self):
+        dispatcher = NotificationDispatcher(coalesce_window=0.2)
+        dispatcher._session = Mock()
+        dispatcher._session.post.return_value.status_code = 200
+
+        dispatcher.enqueue('http://mattermost/hook-1', 'Tunnel A restarted')
+        dispatcher.enqueue('http://mattermost/hook-1', 'Tunnel B restarted')
+        dispatcher.enqueue('http://mattermost/hook-2', 'Tunnel C restarted')
+
+        sleep(0.5)
+
+        sent = {call[1]['url']: json.loads(call[1]['data'])['text'] for call in dispatcher._session.post.call_args_list}
+
+        self.assertEqual(2, dispatcher._session.post.call_count)
+        self.assertIn('- Tunnel A restarted', sent['http://mattermost/hook-1'])
+        self.assertIn('- Tunnel B restarted', sent['http://mattermost/hook-1'])
+        self.assertEqual('Tunnel C restarted', sent['http://mattermost/hook-2'])
+
+    def test_full_queue_does_not_block(self):
+        dispatcher = NotificationDispatcher(max_queue_size=1)
+        dispatcher._start = Mock()  # no consumer
+
+        dispatcher.enqueue('http://mattermost/hook-1', 'First')
+        dispatcher.enqueue('http://mattermost/hook-1', 'Dropped')
+
+        self.assertEqual(1, dispatcher._queue.qsize())
@@ -0,0 +1,71 @@
+import os
+import sys
+import socket
+import unittest
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.network.portcheck import PortCheckEngine, PortProbe
+from ..tunman.logger import setup_dummy_logger
+
+
+class PortCheckEngineTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.open_port = self.server.getsockname()[1]
+
+        # bind, but do not listen - connections to this port will be refused
+        self.closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.closed.bind(('127.0.0.1', 0))
+        self.closed_port = self.closed.getsockname()[1]
+
+    def tearDown(self) -> None:
+        self.server.close()
+        self.closed.close()
+
+    def test_checks_many_ports_at_once(self):
+        engine = PortCheckEngine()
+
+        results = engine.check_many([
+            ('127.0.0.1', self.open_port, 5),
+            ('127.0.0.1', self.closed_port, 5),
+            ('localhost', self.open_port, 5)
+        ])
+
+        self.assertEqual([True, False, True], results)
+
+    def test_unresolvable_host_is_reported_as_not_responding(self):
+        self.assertFalse(PortCheckEngine().check('host.invalid', 80, 5))
+
+    def test_too_long_hostname_is_reported_as_not_responding(self):
+        # the lookup raises UnicodeError, not OSError
+        self.assertFalse(PortCheckEngine().check('a' * 64 + '.org', 80, 1))
+
+    def test_unexpected_error_fails_pending_checks_and_keeps_the_engine_running(self):
+        engine = PortCheckEngine()
+        engine._start()
+
+        pending = PortProbe('127.0.0.1', 3306, 30)
+        pending.sock, other_end = socket.socketpair()
+        engine._probes[pending.sock.fileno()] = pending
+
+        drain_wakeup = engine._drain_wakeup
+        calls = []
+
+        def broken_drain_wakeup():
+            calls.append(True)
+
+            if len(calls) == 1:
+                raise RuntimeError('Unexpected')
+
+            drain_wakeup()
+
+        engine._drain_wakeup = broken_drain_wakeup
+
+        self.assertTrue(engine.check('127.0.0.1', self.open_port, 5))
+        self.assertFalse(pending.future.result(timeout=1))
+        other_end.close()
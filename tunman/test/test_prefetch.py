@@ -0,0 +1,101 @@
+import os
+import sys
+import unittest
+from threading import Event
+from time import monotonic, sleep
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.prefetch import VariablesPrefetcher
+from ..tunman.logger import setup_dummy_logger
+
+
+def create_configuration(ident: str, resolve) -> Mock:
+    configuration = Mock()
+    configuration.ident = ident
+    configuration.prefetch_variables = resolve
+
+    return configuration
+
+
+def resolve_slowly(seconds: float):
+    def resolve():
+        sleep(seconds)
+        return ['remote_gw']
+
+    return resolve
+
+
+def fail():
+    raise Exception('Name or service not known')
+
+
+class VariablesPrefetcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_hosts_are_resolved_concurrently(self):
+        configurations = [create_configuration('user@host-%i:22' % num, resolve_slowly(0.3)) for num in range(5)]
+
+        started_at = monotonic()
+        results = VariablesPrefetcher(timeout=5).prefetch(configurations)
+
+        self.assertLess(monotonic() - started_at, 1)
+        self.assertEqual(5, len([result for result in results.values() if result.is_ok]))
+        self.assertEqual(['remote_gw'], results['user@host-0:22'].variables)
+
+    def test_slow_and_failing_hosts_do_not_block_the_startup(self):
+        configurations = [
+            create_configuration('user@fast:22', resolve_slowly(0)),
+            create_configuration('user@slow:22', resolve_slowly(2)),
+            create_configuration('user@broken:22', fail)
+        ]
+
+        started_at = monotonic()
+        results = VariablesPrefetcher(timeout=0.3).prefetch(configurations)
+
+        self.assertLess(monotonic() - started_at, 1)
+        self.assertTrue(results['user@fast:22'].is_ok)
+        self.assertEqual('Timed out', results['user@slow:22'].error)
+        self.assertEqual('Name or service not known', results['user@broken:22'].error)
+
+    def test_hosts_queued_behind_hung_ones_get_their_own_timeout(self):
+        configurations = [
+            create_configuration('user@hung:22', resolve_slowly(5)),
+            create_configuration('user@queued:22', resolve_slowly(0.4))
+        ]
+
+        started_at = monotonic()
+        results = VariablesPrefetcher(timeout=0.5, workers=1).prefetch(configurations)
+
+        # the queued host started after the hung one was given up, and had the full timeout for itself
+        self.assertLess(monotonic() - started_at, 1.5)
+        self.assertEqual('Timed out', results['user@hung:22'].error)
+        self.assertTrue(results['user@queued:22'].is_ok)
+
+    def test_restored_hosts_are_revalidated_in_background(self):
+        cache = Mock()
+        cache.load.side_effect = lambda ident: {'get_remote_gateway': '192.168.1.2'} \
+            if ident == 'user@cached:22' else {}
+
+        changed = Event()
+        on_changed = Mock(side_effect=lambda configuration, cache_ids: changed.set())
+        cached = create_configuration('user@cached:22', resolve_slowly(0))
+        cached.revalidate_variables = lambda: ['get_remote_gateway']
+        cached.get_resolved_variables.return_value = {'get_remote_gateway': '192.168.1.2'}
+
+        fresh = create_configuration('user@fresh:22', resolve_slowly(0))
+        fresh.get_resolved_variables.return_value = {'get_remote_gateway': '192.168.1.3'}
+
+        results = VariablesPrefetcher(timeout=5, cache=cache, on_changed=on_changed).prefetch([cached, fresh])
+
+        self.assertTrue(results['user@cached:22'].is_restored)
+        self.assertFalse(results['user@fresh:22'].is_restored)
+        cached.restore_variables.assert_called_once_with({'get_remote_gateway': '192.168.1.2'})
+        fresh.restore_variables.assert_not_called()
+
+        # the tunnels are notified about the changed value
+        self.assertTrue(changed.wait(2))
+        on_changed.assert_called_once_with(cached, ['get_remote_gateway'])
+        cache.save.assert_any_call('user@fresh:22', {'get_remote_gateway': '192.168.1.3'})
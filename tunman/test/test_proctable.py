@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch, Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.proctable import ProcessTableSnapshot, psutil
+from ..tunman.logger import setup_dummy_logger
+
+
+def create_process(pid: int, cmdline: list) -> Mock:
+    proc = Mock()
+    proc.pid = pid
+    proc.info = {'pid': pid, 'cmdline': cmdline}
+
+    return proc
+
+
+class ProcessTableSnapshotTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_process_table_is_scanned_once_per_ttl(self):
+        snapshot = ProcessTableSnapshot(ttl=60)
+
+        with patch.object(psutil, 'process_iter') as process_iter:
+            process_iter.return_value = [
+                create_process(10, ['ssh', '-N', '-T', '-L 127.0.0.1:3306:db:3306']),
+                create_process(11, ['ssh', '-N', '-T', '-L 127.0.0.1:5432:pg:5432']),
+                create_process(12, None)
+            ]
+
+            self.assertEqual([10], snapshot.find_pids('-L 127.0.0.1:3306'))
+            self.assertEqual([11], snapshot.find_pids('-L 127.0.0.1:5432'))
+            self.assertEqual([10, 11], snapshot.find_pids('ssh -N'))
+            self.assertEqual(1, process_iter.call_count)
+
+            snapshot.invalidate()
+            snapshot.find_pids('-L 127.0.0.1:3306')
+
+            self.assertEqual(2, process_iter.call_count)
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.ratelimit import TokenBucket, SpawnRateLimiter
+
+
+def create_configuration(ident: str) -> Mock:
+    configuration = Mock()
+    configuration.ident = ident
+
+    return configuration
+
+
+class SpawnRateLimiterTest(unittest.TestCase):
+    def test_burst_is_free_then_tokens_are_reserved_in_advance(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        delays = [bucket.reserve() for _ in range(5)]
+
+        self.assertEqual([0, 0, 0], delays[0:3])
+        self.assertAlmostEqual(0.5, delays[3], places=1)
+        self.assertAlmostEqual(1.0, delays[4], places=1)
+
+    def test_zero_rate_means_no_limit(self):
+        bucket = TokenBucket(rate=0, burst=1)
+
+        self.assertEqual([0, 0, 0], [bucket.reserve() for _ in range(3)])
+
+    def test_hosts_are_limited_independently(self):
+        limiter = SpawnRateLimiter(rate_per_host=1, burst_per_host=1)
+        first = create_configuration('tunman@first-host:22')
+        second = create_configuration('tunman@second-host:22')
+
+        self.assertEqual(0, limiter.reserve(first))
+        self.assertGreater(limiter.reserve(first), 0.9)
+        self.assertEqual(0, limiter.reserve(second))
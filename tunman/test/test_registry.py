@@ -0,0 +1,50 @@
+import os
+import sys
+import subprocess
+import unittest
+import psutil
+from time import sleep
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.registry import ProcessRegistry
+from ..tunman.logger import setup_dummy_logger
+
+
+class ProcessRegistryTest(unittest.TestCase):
+    signature = '-L 127.0.0.1:65001:registry-test:22'
+
+    def setUp(self) -> None:
+        setup_dummy_logger()
+        self.proc = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)', 'ssh', self.signature])
+
+        # the command line is filled up by the kernel a moment after the fork
+        while not psutil.Process(self.proc.pid).cmdline():
+            sleep(0.01)
+
+    def tearDown(self) -> None:
+        self.proc.kill()
+        self.proc.wait()
+
+    def test_finds_registered_process(self):
+        registry = ProcessRegistry()
+        registry.register(self.signature, self.proc.pid)
+
+        self.assertEqual(self.proc.pid, registry.find(self.signature, adopt=False).pid)
+
+    def test_forgets_exited_process(self):
+        registry = ProcessRegistry()
+        registry.register(self.signature, self.proc.pid)
+
+        self.proc.kill()
+        self.proc.wait()
+
+        self.assertIsNone(registry.find(self.signature, adopt=False))
+        self.assertEqual([], registry.get_pids(self.signature))
+
+    def test_adopts_orphaned_process(self):
+        registry = ProcessRegistry()
+
+        self.assertIsNone(registry.find(self.signature, adopt=False))
+        self.assertEqual(self.proc.pid, registry.find(self.signature).pid)
+        self.assertEqual([self.proc.pid], registry.get_pids(self.signature))
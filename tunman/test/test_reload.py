@@ -0,0 +1,157 @@
+import unittest
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest.mock import Mock
+from ..tunman.model import HostTunnelDefinitions, Forwarding, LocalPortDefinition, RemotePortDefinition
+from ..tunman.reload import ConfigurationDiff, ConfigurationWatcher
+from ..tunman.manager.ssh import TunnelManager, SIGNAL_TERMINATE
+from ..tunman.logger import setup_dummy_logger
+
+
+def create_host() -> HostTunnelDefinitions:
+    config = HostTunnelDefinitions()
+    config.remote_user, config.remote_host, config.remote_port = 'riotkit', 'localhost', 22
+    config.remote_key, config.remote_password, config.remote_passphrase = '', '', ''
+    config.ssh_opts, config.variables_post_processor, config.restart_all_on_forward_failure = '', None, False
+    config.forward = []
+
+    return config
+
+
+def add_forwarding(config: HostTunnelDefinitions, local_port: int, use_autossh: bool = False,
+                   retries: int = 5) -> Forwarding:
+    validate = Mock()
+    validate.interval = 0
+
+    forwarding = Forwarding(
+        configuration=config,
+        local=LocalPortDefinition(gateway=False, host='127.0.0.1', port=local_port, configuration=config),
+        remote=RemotePortDefinition(gateway=False, host='192.168.5.20', port=3306, configuration=config),
+        validate=validate, mode='local', retries=retries, use_autossh=use_autossh, health_check_connect_timeout=0,
+        warm_up_time=0, time_before_restart_at_initialization=0, wait_time_after_all_retries_failed=0
+    )
+    config.forward.append(forwarding)
+
+    return forwarding
+
+
+class ConfigurationDiffTest(unittest.TestCase):
+    def setUp(self):
+        setup_dummy_logger()
+
+    def test_plan_finds_added_removed_changed_and_unchanged_forwardings(self):
+        running = create_host()
+        kept = add_forwarding(running, 3306)
+        changed = add_forwarding(running, 3307)
+        removed = add_forwarding(running, 3308)
+
+        loaded = create_host()
+        add_forwarding(loaded, 3306, retries=10)
+        changed_reloaded = add_forwarding(loaded, 3307, use_autossh=True)
+        added = add_forwarding(loaded, 3309)
+
+        plan = ConfigurationDiff.create_plan([running], [loaded])
+
+        self.assertEqual([kept], plan.unchanged)
+        self.assertEqual([(changed, changed_reloaded)], plan.changed)
+        self.assertEqual([removed], plan.removed)
+        self.assertEqual([added], plan.added)
+        self.assertEqual([removed, changed], plan.get_forwardings_to_stop())
+        self.assertEqual([added, changed_reloaded], plan.get_forwardings_to_start())
+
+        # the running host instance is kept, with the supervision options taken over in place
+        self.assertEqual([running], plan.configurations)
+        self.assertEqual([kept, changed_reloaded, added], running.forward)
+        self.assertIs(running, added.configuration)
+        self.assertEqual(10, kept.retries)
+        self.assertEqual({'added': [added.ident], 'removed': [removed.ident], 'restarted': [changed.ident],
+                          'unchanged': 1}, plan.to_dict())
+
+    def test_all_forwardings_are_restarted_when_the_host_connection_changes(self):
+        running = create_host()
+        forwarding = add_forwarding(running, 3306)
+
+        loaded = create_host()
+        loaded.ssh_opts = '-o Compression=yes'
+        reloaded = add_forwarding(loaded, 3306)
+
+        plan = ConfigurationDiff.create_plan([running], [loaded])
+
+        self.assertEqual([(forwarding, reloaded)], plan.changed)
+        self.assertEqual([running], plan.removed_hosts)
+        self.assertEqual([loaded], plan.configurations)
+
+    def test_removed_host_is_closed_with_all_its_forwardings(self):
+        running = create_host()
+        forwarding = add_forwarding(running, 3306)
+
+        plan = ConfigurationDiff.create_plan([running], [])
+
+        self.assertEqual([forwarding], plan.removed)
+        self.assertEqual([running], plan.removed_hosts)
+        self.assertEqual([], plan.configurations)
+
+    def test_stopped_tunnel_is_forgotten_by_the_manager(self):
+        config = create_host()
+        forwarding = add_forwarding(config, 3306)
+
+        manager = TunnelManager()
+        signature = manager._create_signature(forwarding)
+        manager._proc_manager.registry.register(signature, 12345)
+        manager._kill_tunnel = Mock()
+
+        manager.stop_tunnel(forwarding)
+
+        self.assertEqual([], manager._signatures)
+        self.assertEqual([], manager._proc_manager.registry.get_pids(signature))
+        self.assertEqual([], manager.status.get_snapshot()['forwardings'])
+        self.assertTrue(manager._is_stopped(forwarding))
+        manager._kill_tunnel.assert_called_once_with(forwarding, config, signature)
+
+    def test_supervisor_stopped_during_warm_up_does_not_touch_its_replacement(self):
+        config = create_host()
+        forwarding = add_forwarding(config, 3306)
+        replacement = add_forwarding(config, 3306, use_autossh=True)
+
+        manager = TunnelManager()
+        manager._start_process = Mock(return_value=('ssh ...', Mock(pid=111)))
+        manager._watch_process = Mock(return_value='key')
+        manager._unwatch_process = Mock()
+        manager._is_tunnel_alive = Mock(return_value=True)
+        manager._kill_tunnel = Mock()
+
+        def reload_during_warm_up(*args) -> bool:
+            if not manager._is_stopped(forwarding):
+                manager.stop_tunnel(forwarding)
+                manager.status.register(replacement, '-L 3306')
+                manager.status.on_alive(replacement, 222)
+
+            return True
+
+        manager._carefully_sleep = reload_during_warm_up
+
+        self.assertEqual(SIGNAL_TERMINATE, manager.spawn_ssh_process(forwarding, config, '-L 3306'))
+
+        entry = manager.status.get_snapshot()['forwardings'][0]
+        self.assertEqual((True, 222), (entry['is_alive'], entry['current_pid']))
+
+        # the tunnel of the stopped forwarding is closed by stop_tunnel(), the supervisor does not close it again
+        manager._kill_tunnel.assert_not_called()
+
+    def test_watcher_notices_a_modified_file(self):
+        changed = Event()
+
+        with TemporaryDirectory() as path:
+            with open(path + '/host.py', 'w') as f:
+                f.write('# first')
+
+            watcher = ConfigurationWatcher(path, 0.05, changed.set)
+            watcher.start()
+
+            self.assertFalse(changed.wait(0.2))
+
+            with open(path + '/host.py', 'w') as f:
+                f.write('# second, longer')
+
+            self.assertTrue(changed.wait(2))
+            watcher.stop()
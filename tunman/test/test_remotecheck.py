@@ -0,0 +1,113 @@
+import os
+import socket
+import sys
+import unittest
+from threading import Thread
+from time import sleep
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.network.remotecheck import RemotePortCheckBatcher
+from ..tunman.manager.ssh import TunnelManager
+from ..tunman.logger import setup_dummy_logger
+
+
+def print_lines(output: str, error: Exception = None):
+    """ Simulates a remote command, that prints given lines, then optionally fails """
+
+    def exec_ssh(cmd: str, retries: int = None, timeout: float = None, on_line=None) -> str:
+        for line in output.split("\n"):
+            on_line(line)
+
+        if error:
+            raise error
+
+        return output
+
+    return exec_ssh
+
+
+class RemotePortCheckBatcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_checks_of_a_host_are_sent_in_one_command(self):
+        configuration = Mock()
+        configuration.ident = 'tunman@iwa-ait.org:22'
+        configuration.exec_ssh.side_effect = print_lines("127.0.0.1 3306 0\n127.0.0.1 5432 1\n")
+
+        batcher = RemotePortCheckBatcher(window=0.1)
+        futures = [
+            batcher.submit(configuration, '127.0.0.1', 3306, 5),
+            batcher.submit(configuration, '127.0.0.1', 5432, 5),
+            batcher.submit(configuration, '127.0.0.1', 3306, 10),
+            batcher.submit(configuration, '127.0.0.1', 8080, 5)
+        ]
+
+        self.assertEqual([True, False, True, False], [future.result(timeout=5) for future in futures])
+        self.assertEqual(1, configuration.exec_ssh.call_count)
+
+        cmd = configuration.exec_ssh.call_args[0][0]
+
+        self.assertIn('nc -zw10 127.0.0.1 3306', cmd)
+        self.assertEqual(3, cmd.count('nc -zw'))
+
+        # the command is not retried, and may stay silent as long as the slowest "nc" waits
+        self.assertEqual(0, configuration.exec_ssh.call_args[1]['retries'])
+        self.assertEqual(10 + RemotePortCheckBatcher.EXEC_TIMEOUT_MARGIN,
+                         configuration.exec_ssh.call_args[1]['timeout'])
+
+    def test_ports_reported_before_a_failure_keep_their_result(self):
+        configuration = Mock()
+        configuration.ident = 'tunman@iwa-ait.org:22'
+        configuration.exec_ssh.side_effect = print_lines("127.0.0.1 3306 0", error=socket.timeout())
+
+        batcher = RemotePortCheckBatcher(window=0.1)
+        reported = batcher.submit(configuration, '127.0.0.1', 3306, 5)
+        dropping_packets = batcher.submit(configuration, '10.0.0.5', 5432, 60)
+
+        self.assertTrue(reported.result(timeout=5))
+        self.assertFalse(dropping_packets.result(timeout=5))
+        self.assertEqual(1, configuration.exec_ssh.call_count)
+
+    def test_ssh_failure_marks_all_checks_as_failed(self):
+        configuration = Mock()
+        configuration.ident = 'tunman@iwa-ait.org:22'
+        configuration.exec_ssh.side_effect = Exception('Connection reset by peer')
+
+        batcher = RemotePortCheckBatcher(window=0.1)
+
+        self.assertFalse(batcher.check(configuration, '127.0.0.1', 3306, 5))
+
+    def test_forwardings_started_at_different_moments_are_checked_in_one_batch(self):
+        configuration = Mock()
+        configuration.ident = 'tunman@iwa-ait.org:22'
+        configuration.exec_ssh.side_effect = print_lines("127.0.0.1 3306 0\n127.0.0.1 3307 0\n127.0.0.1 3308 0")
+
+        manager = TunnelManager()
+        batcher = RemotePortCheckBatcher(window=0.1)
+        futures = []
+
+        def supervise(port: int):
+            definition = Mock()
+            definition.validate.method = 'remote_port_ping'
+            definition.validate.interval = 1
+
+            sleep(manager._get_health_check_delay(definition, configuration))
+            futures.append(batcher.submit(configuration, '127.0.0.1', port, 5))
+
+        threads = []
+
+        # spawns of a host are spread by its rate limit
+        for port in [3306, 3307, 3308]:
+            threads.append(Thread(target=supervise, args=[port]))
+            threads[-1].start()
+            sleep(0.3)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([True, True, True], [future.result(timeout=5) for future in futures])
+        self.assertEqual(1, configuration.exec_ssh.call_count)
+        self.assertEqual(3, configuration.exec_ssh.call_args[0][0].count('nc -zw'))
@@ -0,0 +1,72 @@
+import os
+import socket
+import sys
+import unittest
+from threading import Event
+from time import monotonic
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.network.resolver import DNSResolver
+from ..tunman.logger import setup_dummy_logger
+
+
+def create_address_info(address: str) -> list:
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 0))]
+
+
+class DNSResolverTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_ip_addresses_are_not_looked_up(self):
+        with patch('socket.getaddrinfo') as getaddrinfo:
+            self.assertEqual('192.168.1.2', DNSResolver().resolve('192.168.1.2'))
+            getaddrinfo.assert_not_called()
+
+    def test_lookups_are_cached_and_merged(self):
+        resolver = DNSResolver()
+        released = Event()
+
+        def slow_lookup(*args):
+            released.wait(2)
+            return create_address_info('10.0.0.1')
+
+        with patch('socket.getaddrinfo', side_effect=slow_lookup) as getaddrinfo:
+            futures = [resolver.resolve_async('db.example.org') for _ in range(5)]
+            released.set()
+
+            self.assertEqual(['10.0.0.1'] * 5, [future.result(2) for future in futures])
+            self.assertEqual('10.0.0.1', resolver.resolve('db.example.org'))
+            self.assertEqual(1, getaddrinfo.call_count)
+
+    def test_failed_lookups_are_cached(self):
+        resolver = DNSResolver(negative_ttl=60)
+
+        with patch('socket.getaddrinfo', side_effect=socket.gaierror('Name or service not known')) as getaddrinfo:
+            self.assertRaises(OSError, lambda: resolver.resolve('host.invalid'))
+            self.assertRaises(OSError, lambda: resolver.resolve('host.invalid'))
+            self.assertEqual(1, getaddrinfo.call_count)
+
+    def test_stale_address_is_served_while_revalidating(self):
+        resolver = DNSResolver(positive_ttl=0, stale_ttl=60)
+
+        with patch('socket.getaddrinfo', return_value=create_address_info('10.0.0.1')):
+            resolver.resolve('db.example.org')
+
+        released = Event()
+
+        def hanging_lookup(*args):
+            released.wait(2)
+            raise socket.timeout('timed out')
+
+        with patch('socket.getaddrinfo', side_effect=hanging_lookup):
+            started_at = monotonic()
+            self.assertEqual('10.0.0.1', resolver.resolve('db.example.org'))
+            self.assertLess(monotonic() - started_at, 0.5)
+
+            # the failed revalidation keeps the last known address
+            revalidation = resolver._pending['db.example.org']
+            released.set()
+            self.assertEqual('10.0.0.1', revalidation.result(2))
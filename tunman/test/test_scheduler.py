@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+from threading import Thread
+from time import monotonic, sleep
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.scheduler import Scheduler
+from ..tunman.logger import setup_dummy_logger
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_deadlines_are_fired_in_order(self):
+        scheduler = Scheduler()
+        fired = []
+
+        scheduler.call_later(0.2, lambda expired: fired.append('second'))
+        scheduler.call_later(0.1, lambda expired: fired.append('first'))
+        cancelled = scheduler.call_later(0.15, lambda expired: fired.append('cancelled'))
+        scheduler.cancel(cancelled)
+
+        self.assertTrue(scheduler.sleep(0.3))
+        self.assertEqual(['first', 'second'], fired)
+
+    def test_shutdown_interrupts_all_sleeps_at_once(self):
+        scheduler = Scheduler()
+        results = []
+        threads = [Thread(target=lambda: results.append(scheduler.sleep(60))) for _ in range(0, 10)]
+
+        for thread in threads:
+            thread.start()
+
+        sleep(0.1)
+        started_at = monotonic()
+        scheduler.shutdown()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(monotonic() - started_at, 1)
+        self.assertEqual([False] * 10, results)
+        self.assertFalse(scheduler.sleep(1))
+
+    def test_wake_ends_the_sleep_of_the_key(self):
+        scheduler = Scheduler()
+        woken = []
+
+        def sleeper():
+            woken.append(scheduler.sleep(30, key='Forward[:3306]#161'))
+
+        thread = Thread(target=sleeper)
+        thread.start()
+        sleep(0.1)
+
+        started_at = monotonic()
+        scheduler.wake('Forward[:3306]#161')
+        thread.join(5)
+
+        self.assertEqual([True], woken)
+        self.assertLess(monotonic() - started_at, 1)
+
+    def test_wake_before_the_sleep_is_not_lost(self):
+        scheduler = Scheduler()
+        scheduler.wake('Forward[:3306]#161')
+
+        started_at = monotonic()
+        self.assertTrue(scheduler.sleep(30, key='Forward[:3306]#161'))
+        self.assertLess(monotonic() - started_at, 1)
+
+        scheduler.wake('Forward[:5432]#162')
+        scheduler.forget('Forward[:5432]#162')
+
+        started_at = monotonic()
+        self.assertTrue(scheduler.sleep(0.1, key='Forward[:5432]#162'))
+        self.assertGreaterEqual(monotonic() - started_at, 0.1)
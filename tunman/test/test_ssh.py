@@ -0,0 +1,137 @@
+import os
+import sys
+import socket
+import unittest
+from threading import Event, Thread
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.ssh import SSHClient, paramiko, time
+from ..tunman.logger import setup_dummy_logger
+
+
+def create_paramiko_client(exec_side_effect=None) -> Mock:
+    stdout = Mock()
+    stdout.read.return_value = b'default via 192.168.0.1 dev eth0\n'
+    stderr = Mock()
+    stderr.read.return_value = b''
+
+    client = Mock()
+    client.get_transport.return_value.is_active.return_value = True
+    client.exec_command.return_value = (Mock(), stdout, stderr)
+
+    if exec_side_effect:
+        client.exec_command.side_effect = exec_side_effect
+
+    return client
+
+
+class SSHClientTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    @staticmethod
+    def create_client(**kwargs) -> SSHClient:
+        return SSHClient(host='127.0.0.1', port=22, user='tunman', key='', password='', passphrase='', **kwargs)
+
+    def test_session_is_reused_between_commands(self):
+        client = self.create_client()
+
+        with patch.object(paramiko, 'SSHClient') as paramiko_client:
+            paramiko_client.return_value = create_paramiko_client()
+
+            client.exec('ip route')
+            client.exec('ip route')
+
+            self.assertEqual(1, paramiko_client.call_count)
+            self.assertEqual(2, paramiko_client.return_value.exec_command.call_count)
+
+    def test_reconnects_only_when_transport_is_dead(self):
+        client = self.create_client()
+
+        with patch.object(paramiko, 'SSHClient') as paramiko_client:
+            paramiko_client.return_value = create_paramiko_client()
+            client.exec('ip route')
+
+            paramiko_client.return_value.get_transport.return_value.is_active.return_value = False
+            client.exec('ip route')
+
+            self.assertEqual(2, paramiko_client.call_count)
+
+    def test_retries_are_bounded(self):
+        client = self.create_client(retries=2)
+
+        with patch.object(paramiko, 'SSHClient') as paramiko_client, patch.object(time, 'sleep'):
+            paramiko_client.return_value = create_paramiko_client(exec_side_effect=socket.timeout())
+
+            self.assertRaises(socket.timeout, lambda: client.exec('ip route'))
+            self.assertEqual(3, paramiko_client.return_value.exec_command.call_count)
+
+    def test_lines_printed_before_a_timeout_are_delivered(self):
+        client = self.create_client()
+        stdout = Mock()
+        stdout.__iter__ = Mock(return_value=self._print_then_time_out([b'127.0.0.1 3306 0\n']))
+        lines = []
+
+        with patch.object(paramiko, 'SSHClient') as paramiko_client, patch.object(time, 'sleep'):
+            paramiko_client.return_value = create_paramiko_client()
+            paramiko_client.return_value.exec_command.return_value = (Mock(), stdout, Mock())
+
+            self.assertRaises(socket.timeout, lambda: client.exec('nc ...', retries=0, timeout=65,
+                                                                  on_line=lines.append))
+
+            self.assertEqual(['127.0.0.1 3306 0'], lines)
+            self.assertEqual(1, paramiko_client.return_value.exec_command.call_count)
+            self.assertEqual(65, paramiko_client.return_value.exec_command.call_args[1]['timeout'])
+
+    @staticmethod
+    def _print_then_time_out(lines: list):
+        yield from lines
+        raise socket.timeout()
+
+    def test_commands_use_a_live_session_while_another_one_is_connecting(self):
+        client = self.create_client(max_channels=1)
+        first_session, second_session = create_paramiko_client(), create_paramiko_client()
+        first_command_released, handshake_released = Event(), Event()
+        streams = first_session.exec_command.return_value
+
+        def exec_first_command(*args, **kwargs):
+            first_command_released.wait(5)
+            first_session.exec_command.side_effect = None
+            return streams
+
+        def connect(**kwargs):
+            if paramiko.SSHClient.call_count == 2:
+                handshake_released.wait(5)
+
+        first_session.exec_command.side_effect = exec_first_command
+        first_session.connect.side_effect = connect
+        second_session.connect.side_effect = connect
+
+        with patch.object(paramiko, 'SSHClient', side_effect=[first_session, second_session]):
+            threads = [Thread(target=client.exec, args=['ip route'])]
+            threads[0].start()
+
+            # the only session is busy, so the second command makes a new connection
+            while first_session.exec_command.call_count == 0:
+                time.sleep(0.01)
+
+            threads.append(Thread(target=client.exec, args=['ip route']))
+            threads[1].start()
+
+            while paramiko.SSHClient.call_count < 2:
+                time.sleep(0.01)
+
+            first_command_released.set()
+            threads[0].join()
+
+            # the session released meanwhile serves the third command, the handshake is still going on
+            self.assertEqual('default via 192.168.0.1 dev eth0', client.exec('ip route'))
+            self.assertTrue(threads[1].is_alive())
+
+            handshake_released.set()
+            threads[1].join()
+
+            self.assertEqual(2, first_session.exec_command.call_count)
+            self.assertEqual(1, second_session.exec_command.call_count)
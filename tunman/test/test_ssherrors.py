@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+from unittest_data_provider import data_provider
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.ssherrors import SSHErrorClassifier, ERROR_REMOTE_BIND_FAILED, ERROR_LOCAL_BIND_FAILED, \
+    ERROR_HOST_KEY_MISMATCH, ERROR_AUTH_FAILED, ERROR_CONNECTION_REFUSED
+
+
+def provide_lines():
+    return [
+        ['Warning: remote port forwarding failed for listen port 8010', ERROR_REMOTE_BIND_FAILED],
+        ['bind [127.0.0.1]:3306: Address already in use', ERROR_LOCAL_BIND_FAILED],
+        ['channel_setup_fwd_listener_tcpip: cannot listen to port: 3306', ERROR_LOCAL_BIND_FAILED],
+        ['@    WARNING: REMOTE HOST IDENTIFICATION HAS CHANGED!     @', ERROR_HOST_KEY_MISMATCH],
+        ['Host key verification failed.', ERROR_HOST_KEY_MISMATCH],
+        ['tunman@iwa-ait.org: Permission denied (publickey,password).', ERROR_AUTH_FAILED],
+        ['ssh: connect to host iwa-ait.org port 22: Connection refused', ERROR_CONNECTION_REFUSED],
+        ['Warning: Permanently added \'iwa-ait.org\' (ECDSA) to the list of known hosts.', None]
+    ]
+
+
+class SSHErrorClassifierTest(unittest.TestCase):
+    @data_provider(provide_lines)
+    def test_classify(self, line: str, expected):
+        self.assertEqual(expected, SSHErrorClassifier.classify(line))
+
+    def test_classify_output_lists_each_error_once(self):
+        output = "Host key verification failed.\nPermission denied (publickey).\nPermission denied (publickey)."
+
+        self.assertEqual([ERROR_HOST_KEY_MISMATCH, ERROR_AUTH_FAILED], SSHErrorClassifier.classify_output(output))
@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+from time import sleep
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.status import StatusBoard
+
+
+def create_forwarding(ident: str) -> Mock:
+    forwarding = Mock()
+    forwarding.ident = ident
+    forwarding.current_restart_count = 0
+
+    return forwarding
+
+
+class StatusBoardTest(unittest.TestCase):
+    def test_snapshot_follows_pushed_changes(self):
+        board = StatusBoard()
+        first = create_forwarding('Forward[:3306][127.0.0.1:3306]_at_tunman@iwa-ait.org:22')
+        second = create_forwarding('Forward[:5432][127.0.0.1:5432]_at_tunman@iwa-ait.org:22')
+
+        board.register(first)
+        board.register(second, '-L 5432:127.0.0.1:5432')
+        board.on_alive(first, 161)
+
+        snapshot = board.get_snapshot()['forwardings']
+
+        self.assertEqual([first.ident, second.ident], [entry['ident'] for entry in snapshot])
+        self.assertEqual([True, False], [entry['is_alive'] for entry in snapshot])
+        self.assertEqual(161, snapshot[0]['current_pid'])
+        self.assertEqual('-L 5432:127.0.0.1:5432', snapshot[1]['signature'])
+
+    def test_rendered_output_is_reused_until_a_change(self):
+        board = StatusBoard()
+        forwarding = create_forwarding('Forward[:3306][127.0.0.1:3306]_at_tunman@iwa-ait.org:22')
+        renderer = Mock(side_effect=lambda data: str(data['forwardings'][0]['is_alive']))
+
+        board.register(forwarding)
+
+        self.assertEqual('False', board.render('html', renderer))
+        self.assertEqual('False', board.render('html', renderer))
+
+        # no change - same state pushed again
+        board.on_down(forwarding)
+        self.assertEqual('False', board.render('html', renderer))
+        self.assertEqual(1, renderer.call_count)
+
+        board.on_alive(forwarding, 161)
+        self.assertEqual('True', board.render('html', renderer))
+        self.assertEqual(2, renderer.call_count)
+
+    def test_health_checks_are_published_periodically_without_changing_the_version(self):
+        board = StatusBoard(health_refresh_interval=0.2)
+        forwarding = create_forwarding('Forward[:3306][127.0.0.1:3306]_at_tunman@iwa-ait.org:22')
+        renderer = Mock(side_effect=lambda data: str(data['forwardings'][0]['health_check'].get('p50')))
+
+        board.register(forwarding)
+        board.on_alive(forwarding, 161)
+        version = board.version
+
+        self.assertEqual('None', board.render('html', renderer))
+
+        for rtt in range(0, 100):
+            board.on_health_check(forwarding, {'p50': rtt})
+
+        self.assertEqual('None', board.render('html', renderer))
+        self.assertEqual(1, renderer.call_count)
+
+        sleep(0.2)
+
+        self.assertEqual('99', board.render('html', renderer))
+        self.assertEqual(2, renderer.call_count)
+        self.assertEqual(version, board.version)
+
+    def test_subscriber_resumes_from_sequence_number(self):
+        board = StatusBoard(history_size=3)
+        forwarding = create_forwarding('Forward[:3306][127.0.0.1:3306]_at_tunman@iwa-ait.org:22')
+        received = []
+
+        board.register(forwarding)                     # seq=1
+        board.on_alive(forwarding, 161)                # seq=2
+
+        missed, snapshot = board.subscribe(received.append, since=1)
+
+        self.assertEqual(['up'], [event['type'] for event in missed])
+        self.assertEqual(2, snapshot['seq'])
+
+        board.on_alive(forwarding, 162)                # seq=3, pid changed
+        board.on_down(forwarding)                      # seq=4
+        board.on_alive(forwarding, 163)                # seq=5
+
+        self.assertEqual(['pid', 'down', 'up'], [event['type'] for event in received])
+
+        # first events were removed from the history, the subscriber needs a full snapshot
+        self.assertIsNone(board.events_since(1))
+        self.assertEqual([5], [event['seq'] for event in board.events_since(4)])
@@ -0,0 +1,44 @@
+import os
+import psutil
+import sys
+import unittest
+from time import monotonic
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.manager.sysprocess import SystemProcessManager
+from ..tunman.logger import setup_dummy_logger
+
+
+class SystemProcessManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_close_all_tunnels_is_bounded_by_the_timeout(self):
+        manager = SystemProcessManager()
+        polite = manager.spawn('sleep 30', '-L 127.0.0.1:3306:192.168.1.5:3306')
+        stubborn = manager.spawn('trap "" TERM; sleep 30', '-L 127.0.0.1:5432:192.168.1.5:5432')
+
+        # each process leads its own group
+        self.assertEqual(polite.pid, os.getpgid(polite.pid))
+
+        started_at = monotonic()
+        manager.close_all_tunnels(['-L 127.0.0.1:3306:192.168.1.5:3306', '-L 127.0.0.1:5432:192.168.1.5:5432'],
+                                  timeout=0.5)
+
+        self.assertLess(monotonic() - started_at, 3)
+        self.assertIsNotNone(polite.wait(2))
+        self.assertIsNotNone(stubborn.wait(2))
+        self.assertEqual(0, manager.get_procs_count())
+
+    def test_process_group_is_killed_together_with_its_leader(self):
+        manager = SystemProcessManager()
+        proc = manager.spawn('sleep 30 & wait')
+        child = psutil.Process(proc.pid).children()[0]
+
+        manager.kill_process_group(proc)
+
+        self.assertIsNotNone(proc.wait(2))
+        # the child of the shell is gone as well, not left as an orphan
+        child.wait(2)
+        self.assertFalse(child.is_running())
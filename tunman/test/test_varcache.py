@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(__file__) + "/../tunman")
+
+from ..tunman.varcache import VariablesCache
+from ..tunman.logger import setup_dummy_logger
+
+
+class VariablesCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        setup_dummy_logger()
+
+    def test_values_survive_restart(self):
+        with TemporaryDirectory() as directory:
+            path = directory + '/cache/variables.json'
+            VariablesCache(path).save('user@host:22', {'get_remote_gateway': '192.168.1.2'})
+
+            self.assertEqual({'get_remote_gateway': '192.168.1.2'}, VariablesCache(path).load('user@host:22'))
+            self.assertEqual({}, VariablesCache(path).load('user@other-host:22'))
+            self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+
+    def test_expired_values_are_not_restored(self):
+        with TemporaryDirectory() as directory:
+            path = directory + '/variables.json'
+
+            with patch('tunman.tunman.varcache.time', return_value=1000):
+                VariablesCache(path, ttl=60).save('user@host:22', {'get_remote_gateway': '192.168.1.2'})
+
+            with patch('tunman.tunman.varcache.time', return_value=1061):
+                self.assertEqual({}, VariablesCache(path, ttl=60).load('user@host:22'))
+
+    def test_corrupted_file_is_ignored(self):
+        with TemporaryDirectory() as directory:
+            path = directory + '/variables.json'
+
+            with open(path, 'w') as f:
+                f.write('{"user@host:22": ')
+
+            cache = VariablesCache(path)
+            self.assertEqual({}, cache.load('user@host:22'))
+
+            cache.save('user@host:22', {'get_local_gateway': '10.0.0.1'})
+            self.assertEqual({'get_local_gateway': '10.0.0.1'}, VariablesCache(path).load('user@host:22'))
@@ -1,20 +1,34 @@
 
 import threading
 import os
+import signal
+from traceback import format_exc
+from typing import Union
+from tornado.ioloop import IOLoop
 from .manager.ssh import TunnelManager
-from .model import HostTunnelDefinitions
+from .manager.aio import AsyncTunnelManager
+from .model import HostTunnelDefinitions, Forwarding
 from .factory import ConfigurationFactory
+from .exceptions import ConfigurationError
+from .reload import ConfigurationDiff, ConfigurationWatcher, ReloadPlan
+from .prefetch import VariablesPrefetcher
+from .varcache import VariablesCache
+from .network.resolver import RESOLVER
 from .settings import Config
 from .logger import setup_logger, Logger
-from time import sleep
 
 """
-    Application main() - spawns threads managed by TunnelManager()
+    Application main() - spawns threads managed by TunnelManager(), or coroutines managed by AsyncTunnelManager()
 """
 
+ENGINE_THREADS = 'threads'
+ENGINE_ASYNCIO = 'asyncio'
+
 
 class TunManApplication(object):
     _threads: list
+    _loop: Union[IOLoop, None]
+    _reload_lock: threading.Lock
     config: ConfigurationFactory
     settings: Config
     tun_manager: TunnelManager
@@ -23,14 +37,111 @@ class TunManApplication(object):
         setup_logger(config.LOG_PATH, config.LOG_LEVEL)
         self.config = ConfigurationFactory(config)
         self.settings = config
-        self.tun_manager = TunnelManager()
         self._threads = []
+        self._loop = None
+        self._reload_lock = threading.Lock()
+
+        RESOLVER.configure(positive_ttl=config.DNS_TTL, negative_ttl=config.DNS_NEGATIVE_TTL,
+                           stale_ttl=config.DNS_STALE_TTL)
+
+        limits = {
+            'spawn_rate_per_host': config.SPAWN_RATE_PER_HOST,
+            'spawn_burst_per_host': config.SPAWN_BURST_PER_HOST,
+            'max_concurrent_spawns': config.MAX_CONCURRENT_SPAWNS,
+            'shutdown_timeout': config.SHUTDOWN_TIMEOUT,
+            'invalidate_after_failures': config.INVALIDATE_VARIABLES_AFTER_FAILURES
+        }
+
+        if config.ENGINE == ENGINE_ASYNCIO:
+            self.tun_manager = AsyncTunnelManager(process_table_ttl=config.PROCESS_TABLE_TTL,
+                                                  workers=config.ASYNC_WORKERS, **limits)
+        else:
+            self.tun_manager = TunnelManager(process_table_ttl=config.PROCESS_TABLE_TTL, **limits)
 
     def main(self):
-        """ Start tunnelling and the web server """
+        """
+        Start tunnelling and the web server
+
+        All forwardings are started at once, the TunnelManager limits the rate of spawning per host.
+        Before that the template variables of all hosts are resolved concurrently, or restored from the cache.
+
+        The configuration is reloaded on SIGHUP, and on changes in conf.d when TUNMAN_CONFIG_WATCH_INTERVAL is set.
+        """
+
+        self._loop = IOLoop.current()
+
+        cache = None
+
+        if self.settings.VARIABLES_CACHE_PATH:
+            cache = VariablesCache(self.settings.VARIABLES_CACHE_PATH, ttl=self.settings.VARIABLES_CACHE_TTL)
+
+        VariablesPrefetcher(timeout=self.settings.PREFETCH_TIMEOUT, workers=self.settings.PREFETCH_WORKERS,
+                            cache=cache, on_changed=self.tun_manager.refresh_signatures).prefetch(
+            self.config.provide_all_configurations())
+
+        # the status page lists all forwardings from the very beginning, even those not spawned yet
+        for config in self.config.provide_all_configurations():
+            for definition in config.forward:
+                self.tun_manager.status.register(definition)
 
         for config in self.config.provide_all_configurations():
-            self._spawn_threads(config)
+            if self.settings.ENGINE == ENGINE_ASYNCIO:
+                self._spawn_coroutines(config)
+            else:
+                self._spawn_threads(config)
+
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+
+        if self.settings.CONFIG_WATCH_INTERVAL > 0:
+            ConfigurationWatcher(self.settings.CONFIG_PATH + '/conf.d/', self.settings.CONFIG_WATCH_INTERVAL,
+                                 self.request_reload).start()
+
+    def reload(self) -> ReloadPlan:
+        """
+        Loads the configuration again, then stops, starts or restarts only the forwardings whose SSH command
+        has changed. The untouched tunnels keep their processes
+
+        Threads: Any (blocking), one reload at a time
+        :raises ConfigurationError: When the configuration cannot be loaded, the running tunnels are left as they are
+        """
+
+        with self._reload_lock:
+            try:
+                loaded = ConfigurationFactory(self.settings).provide_all_configurations()
+            except Exception as e:
+                raise ConfigurationError('Configuration was not reloaded: %s' % str(e))
+
+            plan = ConfigurationDiff.create_plan(self.config.provide_all_configurations(), loaded)
+
+            for definition in plan.get_forwardings_to_stop():
+                self.tun_manager.stop_tunnel(definition)
+
+            for config in plan.removed_hosts:
+                self.tun_manager.close_host(config)
+
+            self.config.replace_all_configurations(plan.configurations)
+
+            for definition in plan.get_forwardings_to_start():
+                self.tun_manager.status.register(definition)
+                self._start_forwarding(definition, definition.configuration)
+
+            Logger.info('Configuration reloaded: %i added, %i removed, %i restarted, %i unchanged' % (
+                len(plan.added), len(plan.removed), len(plan.changed), len(plan.unchanged)))
+
+            return plan
+
+    def request_reload(self):
+        """ Reloads the configuration in background (for triggers that cannot wait, ex. a signal handler) """
+
+        threading.Thread(target=self._reload_in_background, name='tunman-reload', daemon=True).start()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except ConfigurationError as e:
+            Logger.error(str(e))
+        except Exception:
+            Logger.error(format_exc())
 
     def send_public_key(self):
         """ Execute ssh-copy-id for all configured hosts """
@@ -61,10 +172,27 @@ class TunManApplication(object):
         Logger.info('Spawning thread for %s' % configuration)
 
         for definition in configuration.forward:
-            thr = threading.Thread(target=lambda: self.tun_manager.spawn_tunnel(definition, configuration))
-            thr.start()
-            self._threads.append(thr)
-            sleep(0.5)
+            self._start_forwarding(definition, configuration)
+
+    def _spawn_coroutines(self, configuration: HostTunnelDefinitions):
+        """ Schedules supervising coroutines on the loop shared with the web server """
+
+        Logger.info('Scheduling coroutines for %s' % configuration)
+
+        for definition in configuration.forward:
+            self._start_forwarding(definition, configuration)
+
+    def _start_forwarding(self, definition: Forwarding, configuration: HostTunnelDefinitions):
+        if self.settings.ENGINE == ENGINE_ASYNCIO:
+            # add_callback() is thread-safe, a reload could be performed in any thread
+            self._loop.add_callback(self.tun_manager.spawn_tunnel, definition, configuration)
+            return
+
+        self._threads = [thr for thr in self._threads if thr.is_alive()]
+
+        thr = threading.Thread(target=self.tun_manager.spawn_tunnel, args=(definition, configuration))
+        thr.start()
+        self._threads.append(thr)
 
     def on_application_close(self):
         Logger.debug('Closing the application')
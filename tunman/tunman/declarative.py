@@ -0,0 +1,218 @@
+import json
+import os
+from threading import Lock
+from time import monotonic
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+from .exceptions import ConfigurationError
+from .logger import Logger
+
+NUMBER = (int, float)
+NULLABLE_STRING = (str, type(None))
+
+# option: (accepted types, is required). Names are the same as in the Python configuration files
+HOST_SCHEMA = {
+    'REMOTE_USER': ((str,), True),
+    'REMOTE_HOST': ((str,), True),
+    'REMOTE_PORT': ((int,), True),
+    'REMOTE_KEY': (NULLABLE_STRING, False),
+    'REMOTE_KEY_PASSPHRASE': (NULLABLE_STRING, False),
+    'REMOTE_PASSWORD': (NULLABLE_STRING, False),
+    'SSH_OPTS': ((str,), False),
+    'SSH_MULTIPLEXING': ((bool,), False),
+    'RESTART_ALL_TUNNELS_ON_FORWARDING_FAILURE': ((bool,), False),
+    'VARIABLES_TTL': (NUMBER, False),
+    'FORWARD': ((list,), True)
+}
+
+FORWARDING_SCHEMA = {
+    'local': ((dict,), True),
+    'remote': ((dict,), True),
+    'validate': ((dict,), False),
+    'mode': ((str,), True),
+    'retries': ((int,), False),
+    'use_autossh': ((bool,), False),
+    'health_check_connect_timeout': (NUMBER, False),
+    'warm_up_time': (NUMBER, False),
+    'time_before_restart_at_initialization': (NUMBER, False),
+    'wait_time_after_all_retries_failed': (NUMBER, False)
+}
+
+# ports could be also a template ex. "{{ remote_port }}"
+LOCAL_PORT_SCHEMA = {
+    'gateway': ((bool,), False),
+    'host': ((str,), False),
+    'port': ((int, str), True)
+}
+
+REMOTE_PORT_SCHEMA = {
+    'gateway': ((bool,), False),
+    'host': ((str,), True),
+    'port': ((int, str), True)
+}
+
+VALIDATE_SCHEMA = {
+    'method': ((str,), False),
+    'interval': (NUMBER, False),
+    'wait_time_before_restart': (NUMBER, False),
+    'kill_existing_tunnel_on_failure': ((bool,), False),
+    'notify_url': ((str,), False)
+}
+
+CHOICES = {
+    'mode': ('local', 'remote'),
+    'method': ('none', 'local_port_ping', 'remote_port_ping')
+}
+
+
+class DeclarativeLoader(object):
+    """
+    Loads configuration files written in YAML, JSON or TOML - without executing any code
+
+    A file describes a single host with the same options as the Python configuration files (REMOTE_HOST, FORWARD...),
+    or multiple hosts as a list under "HOSTS". Each file is validated, then kept parsed until its modification time
+    or size changes, so a reload parses only the modified files.
+
+    Callbacks (vars_post_processor, a callable health check) are available only in the Python files.
+    """
+
+    EXTENSIONS = ('.yaml', '.yml', '.json', '.toml')
+
+    _cache: Dict[str, Tuple[Tuple[int, int], List[dict]]]
+    _lock: Lock
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = Lock()
+
+    def is_supported(self, path: str) -> bool:
+        return os.path.splitext(path)[1].lower() in self.EXTENSIONS
+
+    def load(self, path: str) -> List[SimpleNamespace]:
+        """
+        Threads: Any
+
+        :return: Objects with the same attributes as an imported Python configuration file, one per host
+        :raises ConfigurationError: When the file is not readable, or does not match the schema
+        """
+
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise ConfigurationError('Cannot read "%s": %s' % (path, str(e)))
+
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._cache.get(path)
+
+        if cached and cached[0] == version:
+            hosts = cached[1]
+        else:
+            started_at = monotonic()
+            hosts = self._validate_file(path, self._read(path))
+            Logger.debug('Parsed "%s" in %.3fs' % (path, monotonic() - started_at))
+
+            with self._lock:
+                self._cache[path] = (version, hosts)
+
+        return [SimpleNamespace(**host) for host in hosts]
+
+    def _read(self, path: str):
+        extension = os.path.splitext(path)[1].lower()
+
+        try:
+            with open(path, 'rb') as f:
+                content = f.read().decode('utf-8')
+
+            if extension == '.json':
+                return json.loads(content)
+
+            if extension == '.toml':
+                return self._get_toml_parser()(content)
+
+            return self._get_yaml_parser()(content)
+
+        except ConfigurationError:
+            raise
+        except Exception as e:
+            raise ConfigurationError('Error while parsing "%s". %s' % (path, str(e)))
+
+    def _validate_file(self, path: str, data) -> List[dict]:
+        if not isinstance(data, dict):
+            raise ConfigurationError('Error while parsing "%s". Expected a mapping of options' % path)
+
+        if 'HOSTS' not in data:
+            return [self._validate_host(data, path)]
+
+        if not isinstance(data['HOSTS'], list) or len(data) > 1:
+            raise ConfigurationError('Error while parsing "%s". "HOSTS" should be a list, and the only option' % path)
+
+        return [self._validate_host(host, '%s: HOSTS[%i]' % (path, num)) for num, host in enumerate(data['HOSTS'])]
+
+    def _validate_host(self, host, location: str) -> dict:
+        self._validate(host, HOST_SCHEMA, location)
+        host.setdefault('SSH_OPTS', '')
+
+        for num, forwarding in enumerate(host['FORWARD']):
+            forwarding_location = '%s: FORWARD[%i]' % (location, num)
+
+            self._validate(forwarding, FORWARDING_SCHEMA, forwarding_location)
+            self._validate(forwarding['local'], LOCAL_PORT_SCHEMA, forwarding_location + '.local')
+            self._validate(forwarding['remote'], REMOTE_PORT_SCHEMA, forwarding_location + '.remote')
+            self._validate(forwarding.setdefault('validate', {}), VALIDATE_SCHEMA, forwarding_location + '.validate')
+
+        return host
+
+    @staticmethod
+    def _validate(values, schema: dict, location: str):
+        if not isinstance(values, dict):
+            raise ConfigurationError('%s: expected a mapping, got %s' % (location, type(values).__name__))
+
+        for name, value in values.items():
+            if name not in schema:
+                raise ConfigurationError('%s: unknown option "%s"' % (location, name))
+
+            types = schema[name][0]
+
+            # bool is a subclass of int in Python, but "port: true" is most likely a mistake
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                raise ConfigurationError('%s: "%s" should be of type %s, got %s' % (
+                    location, name, ' or '.join(t.__name__ for t in types), type(value).__name__))
+
+            if name in CHOICES and value not in CHOICES[name]:
+                raise ConfigurationError('%s: "%s" should be one of: %s' % (location, name, ', '.join(CHOICES[name])))
+
+        for name, (_, is_required) in schema.items():
+            if is_required and name not in values:
+                raise ConfigurationError('%s: missing required option "%s"' % (location, name))
+
+    @staticmethod
+    def _get_yaml_parser():
+        try:
+            import yaml
+        except ImportError:
+            raise ConfigurationError('PyYAML is required to load YAML configuration files')
+
+        # the C implementation is many times faster, when libyaml is available
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+        return lambda content: yaml.load(content, Loader=loader)
+
+    @staticmethod
+    def _get_toml_parser():
+        try:
+            import tomllib
+            return tomllib.loads
+        except ImportError:
+            pass
+
+        try:
+            import toml
+            return toml.loads
+        except ImportError:
+            raise ConfigurationError('Python 3.11+ or the "toml" package is required to load TOML configuration files')
+
+
+# shared between reloads, so only modified files are parsed again
+LOADER = DeclarativeLoader()
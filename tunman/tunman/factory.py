@@ -4,6 +4,7 @@ from importlib.machinery import SourceFileLoader
 from typing import List
 from .settings import Config
 from .exceptions import ConfigurationError
+from .declarative import LOADER
 from .model import HostTunnelDefinitions, Forwarding, LocalPortDefinition, RemotePortDefinition, ValidationDefinition
 from .logger import Logger
 
@@ -14,9 +15,11 @@ class ConfigurationFactory(object):
     """
 
     _definitions: list
+    _config: Config
 
     def __init__(self, config: Config):
         self._definitions = []
+        self._config = config
         self._load_from_directory(config.CONFIG_PATH + '/conf.d/')
 
     def _load_from_directory(self, path: str):
@@ -33,6 +36,10 @@ class ConfigurationFactory(object):
             if not os.path.isfile(conf_path):
                 continue
 
+            if LOADER.is_supported(conf_path):
+                self._load_declarative(conf_path)
+                continue
+
             raw_cfg = SourceFileLoader("Conf", conf_path).load_module()
 
             try:
@@ -40,9 +47,23 @@ class ConfigurationFactory(object):
             except AttributeError as e:
                 raise ConfigurationError('Error while parsing "%s". %s' % (conf_path, str(e)))
 
+    def _load_declarative(self, conf_path: str):
+        """ YAML, JSON and TOML files are not executed, see: DeclarativeLoader """
+
+        for raw_cfg in LOADER.load(conf_path):
+            try:
+                self._definitions.append(self._parse(raw_cfg))
+            except (AttributeError, TypeError, ValueError) as e:
+                raise ConfigurationError('Error while parsing "%s". %s' % (conf_path, str(e)))
+
     def provide_all_configurations(self) -> List[HostTunnelDefinitions]:
         return self._definitions
 
+    def replace_all_configurations(self, definitions: List[HostTunnelDefinitions]):
+        """ After a reload, see: ConfigurationDiff """
+
+        self._definitions = definitions
+
     def _parse(self, raw) -> HostTunnelDefinitions:
         raw_opts = dir(raw)
 
@@ -58,6 +79,8 @@ class ConfigurationFactory(object):
         definition.restart_all_on_forward_failure = raw.RESTART_ALL_TUNNELS_ON_FORWARDING_FAILURE \
             if 'RESTART_ALL_TUNNELS_ON_FORWARDING_FAILURE' in raw_opts else False
         definition.ssh_opts = raw.SSH_OPTS
+        definition.multiplexing = raw.SSH_MULTIPLEXING if 'SSH_MULTIPLEXING' in raw_opts else False
+        definition.variables_ttl = raw.VARIABLES_TTL if 'VARIABLES_TTL' in raw_opts else self._config.VARIABLES_TTL
 
         return definition
 
@@ -0,0 +1,103 @@
+from array import array
+from threading import Lock
+from time import time
+from typing import Dict, List, Tuple, Union
+
+DEFAULT_WINDOWS = (('1m', 60), ('5m', 300), ('15m', 900))
+PERCENTILES = (50, 95, 99)
+
+
+class HealthCheckHistory(object):
+    """
+    Round-trip times and outcomes of the recent health checks of a single forwarding
+
+    Kept in fixed-size arrays used as a ring buffer - the oldest probe is overwritten, so the memory
+    does not grow with the uptime.
+    """
+
+    _timestamps: array
+    _rtts: array
+    _outcomes: array
+    _position: int
+    _count: int
+    _lock: Lock
+
+    def __init__(self, size: int = 512):
+        self._timestamps = array('d', [0.0]) * size
+        self._rtts = array('d', [0.0]) * size
+        self._outcomes = array('b', [0]) * size
+        self._position = 0
+        self._count = 0
+        self._lock = Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._rtts)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, rtt: float, is_ok: bool, at: Union[float, None] = None):
+        """
+        :param rtt: Duration of the probe in seconds
+        :param is_ok: Outcome of the probe
+        :param at: Unix timestamp of the probe, defaults to now
+        """
+
+        with self._lock:
+            self._timestamps[self._position] = time() if at is None else at
+            self._rtts[self._position] = rtt
+            self._outcomes[self._position] = 1 if is_ok else 0
+            self._position = (self._position + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+
+    def get_window(self, seconds: float, now: Union[float, None] = None) -> List[Tuple[float, bool]]:
+        """ Probes (rtt, is_ok) not older than given number of seconds """
+
+        since = (time() if now is None else now) - seconds
+
+        with self._lock:
+            return [(self._rtts[index], self._outcomes[index] == 1) for index in self._get_indexes()
+                    if self._timestamps[index] >= since]
+
+    def get_summary(self, windows: Tuple[Tuple[str, float], ...] = DEFAULT_WINDOWS,
+                    now: Union[float, None] = None) -> Dict[str, dict]:
+        """
+        Percentiles of round-trip times (in milliseconds) of successful probes, per sliding window
+
+        :return: ex. {'1m': {'checks': 6, 'failures': 0, 'p50': 1.2, 'p95': 3.4, 'p99': 3.4}}
+        """
+
+        summary = {}
+
+        for name, seconds in windows:
+            probes = self.get_window(seconds, now)
+            rtts = sorted([rtt * 1000 for rtt, is_ok in probes if is_ok])
+
+            summary[name] = {
+                'checks': len(probes),
+                'failures': len(probes) - len(rtts)
+            }
+
+            for percentile in PERCENTILES:
+                summary[name]['p%i' % percentile] = self.percentile(rtts, percentile)
+
+        return summary
+
+    @staticmethod
+    def percentile(sorted_values: List[float], percentile: int) -> Union[float, None]:
+        """ Nearest-rank percentile """
+
+        if not sorted_values:
+            return None
+
+        rank = max(int(-(-percentile * len(sorted_values) // 100)), 1)
+
+        return round(sorted_values[rank - 1], 3)
+
+    def _get_indexes(self) -> List[int]:
+        """ Indexes of the recorded probes, from the oldest """
+
+        start = (self._position - self._count) % self.size
+
+        return [(start + offset) % self.size for offset in range(self._count)]
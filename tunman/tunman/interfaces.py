@@ -13,6 +13,7 @@ class ConfigurationInterface(abc.ABC):
     ssh_opts: str
     variables_post_processor: Callable
     restart_all_on_forward_failure: bool
+    variables_ttl: float
 
     @abc.abstractmethod
     def post_process_variables(self, variables: dict) -> dict:
@@ -34,6 +35,26 @@ class ConfigurationInterface(abc.ABC):
     def get_local_gateway(self):
         pass
 
+    @abc.abstractmethod
+    def prefetch_variables(self) -> list:
+        pass
+
+    @abc.abstractmethod
+    def get_resolved_variables(self) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def restore_variables(self, values: dict):
+        pass
+
+    @abc.abstractmethod
+    def revalidate_variables(self) -> list:
+        pass
+
+    @abc.abstractmethod
+    def invalidate_variables(self, conn_strings: list) -> list:
+        pass
+
     @abc.abstractmethod
     def create_ssh_connection_string(self, with_key: bool = True, with_custom_opts: bool = True,
                                      append: str = '') -> str:
@@ -0,0 +1,247 @@
+import asyncio
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from traceback import format_exc
+from typing import Callable, Union
+from ..model import Forwarding, HostTunnelDefinitions
+from ..logger import Logger
+from ..validation import Validation
+from .ssh import TunnelManager, SIGNAL_TERMINATE, SIGNAL_RESTART
+
+
+class AsyncTunnelManager(TunnelManager):
+    """
+    Supervises tunnels as coroutines on a single event loop (the same loop Tornado serves the web interface on)
+
+    An idle tunnel costs only a timer on the loop. Blocking calls (spawning, process lookups, health checks)
+    are delegated to a bounded pool of worker threads.
+    """
+
+    _executor: ThreadPoolExecutor
+    _loop: Union[asyncio.AbstractEventLoop, None]
+    _async_spawn_slots: Union[asyncio.Semaphore, None]
+    _max_concurrent_spawns: int
+
+    def __init__(self, process_table_ttl: float = 2, workers: int = 16, spawn_rate_per_host: float = 2,
+                 spawn_burst_per_host: float = 4, max_concurrent_spawns: int = 32, shutdown_timeout: float = 10,
+                 invalidate_after_failures: int = 3):
+        super().__init__(process_table_ttl=process_table_ttl, spawn_rate_per_host=spawn_rate_per_host,
+                         spawn_burst_per_host=spawn_burst_per_host, max_concurrent_spawns=max_concurrent_spawns,
+                         shutdown_timeout=shutdown_timeout, invalidate_after_failures=invalidate_after_failures)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tunman-worker')
+        self._loop = None
+        self._async_spawn_slots = None
+        self._max_concurrent_spawns = max_concurrent_spawns
+
+    async def spawn_tunnel(self, definition: Forwarding, configuration: HostTunnelDefinitions):
+        """
+        Glues the parameters, restarts the loop on crash, handles application shutdown
+
+        Threads: Event loop
+
+        :param definition:
+        :param configuration:
+        :return:
+        """
+
+        self._bind_to_loop()
+
+        signature = await self._run(self._create_signature, definition)
+        retries_left = definition.retries
+        stop_key = self._get_stop_key(definition)
+
+        while True:
+            if retries_left == 0:
+                retries_left = definition.retries
+                await self._carefully_sleep(definition.wait_time_after_all_retries_failed, stop_key)
+
+            try:
+                signal = await self.spawn_ssh_process(definition, configuration, signature)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                Logger.error(format_exc())
+                await self._carefully_sleep(5, stop_key)
+                continue
+
+            if signal == SIGNAL_TERMINATE or self._is_stopped(definition):
+                self._on_supervision_finished(definition)
+                return
+
+            if signal != SIGNAL_RESTART:
+                raise Exception('Application error, unknown signal "%s"' % str(signal))
+
+            self.status.on_down(definition)
+            self.status.on_health_check(definition, definition.health_history.get_summary())
+            signature = await self._run(self._refresh_signature, definition, signature)
+
+            # should not matter, secures from too much CPU usage
+            await self._carefully_sleep(2, stop_key)
+            retries_left -= 1
+
+    async def spawn_ssh_process(self, forwarding: Forwarding,
+                                configuration: HostTunnelDefinitions, signature: str) -> int:
+        """
+        Spawns a SSH process and delegates supervising
+        After fresh run of SSH tunnel it performs initial check
+
+        Threads: Event loop
+
+        :param forwarding:
+        :param configuration:
+        :param signature:
+        :return:
+        """
+
+        if self.is_terminating or self._is_stopped(forwarding):
+            return SIGNAL_TERMINATE
+
+        if not await self._scheduler.async_sleep(self._get_spawn_delay(configuration)) or self._is_stopped(forwarding):
+            return SIGNAL_TERMINATE
+
+        async with self._async_spawn_slots:
+            cmd, proc = await self._run(self._start_process, forwarding, configuration, signature)
+
+        # in multiplexed mode the listen port is parsed, as in the health checks
+        wake_key = await self._run(self._watch_process, forwarding, proc)
+
+        try:
+            if self._is_stopped(forwarding):
+                # stopped while the process was being spawned
+                await self._run(self._kill_tunnel, forwarding, configuration, signature)
+                return SIGNAL_TERMINATE
+
+            await self._carefully_sleep(forwarding.warm_up_time, wake_key)
+
+            # stopped during the warm up - the tunnel is already closed, a replacement of the same ident
+            # could be running, so neither its status nor its forwarding could be touched
+            if self._is_stopped(forwarding):
+                return SIGNAL_TERMINATE
+
+            error = self._pop_process_error(wake_key)
+
+            # make a delayed retry on start
+            if error or not await self._run(self._is_tunnel_alive, forwarding, configuration, signature):
+                if error:
+                    # ex. the port could not be bound, while the connection itself stays open
+                    await self._run(self._kill_tunnel, forwarding, configuration, signature)
+
+                if await self._run(self._handle_failed_start, forwarding, cmd, configuration, wake_key):
+                    await self._carefully_sleep(self._recovery_wait_time)
+                else:
+                    await self._carefully_sleep(forwarding.time_before_restart_at_initialization)
+
+                return SIGNAL_RESTART
+
+            Logger.info('Process for "%s" survived initialization, got pid=%i' % (signature, proc.pid))
+            self._on_tunnel_alive(forwarding, configuration, proc.pid)
+
+            return await self._tunnel_loop(proc, forwarding, configuration, signature, wake_key)
+        finally:
+            self._unwatch_process(forwarding, proc, wake_key)
+
+    async def _tunnel_loop(self, proc: subprocess.Popen, definition: Forwarding,
+                           configuration: HostTunnelDefinitions, signature: str, wake_key: str = None) -> int:
+        """
+        One tunnel = one coroutine of health monitoring and reacting
+
+        Threads: Event loop
+
+        :param definition:
+        :param configuration:
+        :param signature:
+        :param wake_key: Wakes up the loop before the next check is due, when the process exits or fails
+        :return:
+        """
+
+        Logger.debug('Starting monitoring loop for "%s"' % signature)
+
+        while True:
+            if not await self._carefully_sleep(self._get_health_check_delay(definition, configuration), wake_key) \
+                    or self._is_stopped(definition):
+                return SIGNAL_TERMINATE
+
+            if not self._proc_manager.is_running(proc):
+                Logger.error('The process just exited')
+                self._proc_manager.registry.forget_pid(proc.pid)
+                return SIGNAL_RESTART
+
+            if self._pop_process_error(wake_key):
+                await self._run(self._kill_tunnel, definition, configuration, signature)
+
+                if await self._run(self._recover_from_error, self._get_process_output(wake_key), configuration):
+                    await self._carefully_sleep(self._recovery_wait_time)
+
+                return SIGNAL_RESTART
+
+            Logger.debug('Running checks for signature "%s"' % signature)
+
+            if not await self._run(self._is_tunnel_alive, definition, configuration, signature):
+                Logger.error('The tunnel process exited for signature "%s"' % signature)
+                return SIGNAL_RESTART
+
+            if not await self._check_tunnel_alive(definition, configuration):
+                Logger.error('The health check "%s" failed for signature "%s"' % (
+                    definition.validate.method, signature))
+
+                time_to_wait_on_health_check_failure = definition.validate.wait_time_before_restart
+
+                if not await self._scheduler.async_sleep(time_to_wait_on_health_check_failure) \
+                        or self._is_stopped(definition):
+                    return SIGNAL_TERMINATE
+
+                # check if after given additional short wait time the health is OK
+                if time_to_wait_on_health_check_failure \
+                        and await self._check_tunnel_alive(definition, configuration):
+                    Logger.info('Tunnel "%s" was recovered with restart' % signature)
+                    continue
+
+                if definition.validate.kill_existing_tunnel_on_failure and not self._is_stopped(definition):
+                    await self._run(self._kill_tunnel, definition, configuration, signature)
+
+                return SIGNAL_RESTART
+
+            self._on_tunnel_alive(definition, configuration, proc.pid)
+
+    async def _check_tunnel_alive(self, definition: Forwarding, configuration: HostTunnelDefinitions) -> bool:
+        """
+        Port checks are awaited without occupying a worker thread. The check is submitted from a worker - parsing
+        the host and port could resolve an expired variable (ex. "ip route" via SSH)
+        """
+
+        future = await self._run(Validation.submit_health_check, definition, configuration)
+
+        if future is None:
+            return await self._run(Validation.check_tunnel_alive, definition, configuration)
+
+        return await asyncio.wrap_future(future)
+
+    async def _carefully_sleep(self, sleep_time: int, wake_key: str = None) -> bool:
+        """ Waits for a deadline owned by the scheduler without blocking the loop """
+
+        if self.is_terminating or not await self._scheduler.async_sleep(sleep_time, wake_key):
+            Logger.debug('Careful sleep: got termination signal')
+            return False
+
+        return True
+
+    async def _run(self, callback: Callable, *args):
+        """ Executes a blocking call in the worker pool """
+
+        return await self._loop.run_in_executor(self._executor, callback, *args)
+
+    def _bind_to_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+            self._async_spawn_slots = asyncio.Semaphore(self._max_concurrent_spawns)
+
+    def close_all_tunnels(self):
+        """
+        Wakes up all sleeping coroutines, then kills all processes spawned by the TunnelManager
+
+        Threads: Called from main thread
+        :return:
+        """
+
+        super().close_all_tunnels()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,337 @@
+import os
+import selectors
+import socket
+import subprocess
+from collections import deque
+from threading import Thread, Lock
+from time import sleep
+from typing import Callable, Deque, Dict, List, Tuple, Union
+from ..logger import Logger
+
+
+class WatchedProcess(object):
+    proc: subprocess.Popen
+    fd: Union[int, None]
+    stderr_fd: Union[int, None]
+    on_exit: Dict[str, Callable[[subprocess.Popen], None]]
+    on_output: Dict[str, Callable[[str], None]]
+    output: Deque[Tuple[int, str]]
+    sequence: int
+    partial_line: bytes
+    is_registered: bool
+    is_exited: bool
+
+    def __init__(self, proc: subprocess.Popen, output_size: int):
+        self.proc = proc
+        self.fd = None
+        self.stderr_fd = None
+        self.on_exit = {}
+        self.on_output = {}
+        self.output = deque(maxlen=output_size)
+        self.sequence = 0
+        self.partial_line = b''
+        self.is_registered = False
+        self.is_exited = False
+
+
+class ChildWatcher(object):
+    """
+    Notifies about exits of the spawned processes as soon as they happen, and streams their stderr line by line
+
+    On Linux 5.3+ (Python 3.9+) every process is watched through a pidfd by a single selector thread,
+    which wakes up only when any of the processes exits or writes to stderr. Where pidfd is not available
+    the same thread polls the processes every "poll_interval" seconds.
+
+    The stderr of every added process is drained as long as the process lives, so a full pipe never blocks it.
+    The most recent lines are kept, and replayed to each new subscriber (from a given offset).
+
+    An exited process is kept together with its last output until it is unwatched (at most "exited_size"
+    of them), so a subscriber that comes after the exit (ex. the process died right after the spawn)
+    still gets the output, and the exit notification right away.
+
+    Callbacks are called from the watcher thread, exit callbacks with the already reaped process.
+    """
+
+    _watched: Dict[int, WatchedProcess]
+    _selector: Union[selectors.BaseSelector, None]
+    _thread: Union[Thread, None]
+    _wakeup: tuple
+    _lock: Lock
+    _poll_interval: float
+    _output_size: int
+    _exited_size: int
+
+    def __init__(self, poll_interval: float = 1, output_size: int = 50, exited_size: int = 256):
+        self._watched = {}
+        self._selector = None
+        self._thread = None
+        self._wakeup = ()
+        self._lock = Lock()
+        self._poll_interval = poll_interval
+        self._output_size = output_size
+        self._exited_size = exited_size
+
+    def add(self, proc: subprocess.Popen):
+        """ Starts draining the stderr and watching the exit of the process """
+
+        self._start()
+
+        with self._lock:
+            self._get_or_create(proc)
+
+        self._wakeup[1].send(b'\0')
+
+    def watch(self, proc: subprocess.Popen, key: str, on_exit: Callable[[subprocess.Popen], None],
+              on_output: Callable[[str], None] = None, since: int = 0):
+        """
+        :param proc: Child process
+        :param key: Identifies the subscriber, a process could have many of them (ex. multiplexed forwardings)
+        :param on_exit: Called once, when the process exits (right away, when it has already exited)
+        :param on_output: Called with each line written to the stderr, starting with the recently kept lines
+        :param since: Replay only the kept lines written after this offset, see: get_output_offset()
+        """
+
+        self._start()
+
+        with self._lock:
+            watched = self._get_or_create(proc)
+            watched.on_exit[key] = on_exit
+
+            if on_output:
+                watched.on_output[key] = on_output
+
+                for sequence, line in watched.output:
+                    if sequence >= since:
+                        self._call(on_output, line)
+
+            is_exited = watched.is_exited
+
+        if is_exited:
+            self._call(on_exit, proc)
+            return
+
+        self._wakeup[1].send(b'\0')
+
+    def unwatch(self, proc: subprocess.Popen, key: str):
+        with self._lock:
+            watched = self._watched.get(proc.pid)
+
+            if watched and watched.proc is proc:
+                watched.on_exit.pop(key, None)
+                watched.on_output.pop(key, None)
+
+                if watched.is_exited and not watched.on_exit:
+                    self._watched.pop(proc.pid, None)
+
+    def get_output_offset(self, proc: subprocess.Popen) -> int:
+        """ Count of lines the process has written so far, lines written later are replayed from this offset """
+
+        with self._lock:
+            watched = self._watched.get(proc.pid)
+
+            return watched.sequence if watched and watched.proc is proc else 0
+
+    def _get_or_create(self, proc: subprocess.Popen) -> WatchedProcess:
+        watched = self._watched.get(proc.pid)
+
+        # the pid could be reused by a new process, after the previous one has exited
+        if watched is None or watched.proc is not proc:
+            watched = self._watched[proc.pid] = WatchedProcess(proc, self._output_size)
+
+        return watched
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._selector = selectors.DefaultSelector()
+            self._wakeup = socket.socketpair()
+            self._wakeup[0].setblocking(False)
+            self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+            self._thread = Thread(target=self._run, name='tunman-child-watcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            # a single broken process entry must not stop the supervision of all others
+            try:
+                self._run_once()
+            except Exception as e:
+                Logger.error('Child watcher: unexpected error: %s' % str(e))
+                sleep(self._poll_interval)
+
+    def _run_once(self):
+        is_polling = self._register_new_processes()
+
+        for key, _ in self._selector.select(timeout=self._poll_interval if is_polling else None):
+            if key.fileobj is self._wakeup[0]:
+                self._drain_wakeup()
+            elif key.data is not None:
+                self._read_output(key.data)
+
+        for proc, callbacks in self._collect_exited():
+            for callback in callbacks:
+                self._call(callback, proc)
+
+    def _register_new_processes(self) -> bool:
+        """
+        Opens pidfd and starts reading stderr of newly added processes
+
+        :return: True, when any of the processes has to be polled
+        """
+
+        is_polling = False
+
+        with self._lock:
+            for watched in self._watched.values():
+                if watched.is_exited:
+                    continue
+
+                if not watched.is_registered:
+                    watched.is_registered = True
+                    self._register(watched)
+
+                if watched.fd is None:
+                    is_polling = True
+
+        return is_polling
+
+    def _register(self, watched: WatchedProcess):
+        watched.fd = self._open_pidfd(watched.proc.pid)
+
+        if watched.fd is not None:
+            self._selector.register(watched.fd, selectors.EVENT_READ)
+
+        stderr = watched.proc.stderr
+
+        if stderr is None or stderr.closed:
+            return
+
+        try:
+            watched.stderr_fd = stderr.fileno()
+            os.set_blocking(watched.stderr_fd, False)
+            self._selector.register(watched.stderr_fd, selectors.EVENT_READ, watched)
+        except (OSError, ValueError) as e:
+            Logger.warning('Child watcher: cannot read stderr of pid=%i: %s' % (watched.proc.pid, str(e)))
+            watched.stderr_fd = None
+
+    def _read_output(self, watched: WatchedProcess) -> bool:
+        """
+        Reads what is available (without blocking) and dispatches complete lines
+
+        :return: False when there was nothing to read
+        """
+
+        with self._lock:
+            if watched.stderr_fd is None:
+                return False
+
+            try:
+                chunk = os.read(watched.stderr_fd, 65536)
+            except BlockingIOError:
+                return False
+            except OSError:
+                chunk = b''
+
+            if not chunk:
+                self._close_output(watched)
+                lines = [watched.partial_line] if watched.partial_line else []
+                watched.partial_line = b''
+            else:
+                lines = (watched.partial_line + chunk).split(b'\n')
+                watched.partial_line = lines.pop()
+
+            for raw_line in lines:
+                line = raw_line.decode('utf-8', errors='replace').rstrip()
+
+                if not line:
+                    continue
+
+                watched.output.append((watched.sequence, line))
+                watched.sequence += 1
+
+                for callback in watched.on_output.values():
+                    self._call(callback, line)
+
+            return len(chunk) > 0
+
+    def _collect_exited(self) -> List[Tuple[subprocess.Popen, List[Callable]]]:
+        """
+        :return: Exited processes with the exit callbacks to call
+        """
+
+        exited = []
+
+        with self._lock:
+            candidates = [watched for watched in self._watched.values()
+                          if watched.is_registered and not watched.is_exited and watched.proc.poll() is not None]
+
+        for watched in candidates:
+            # the last words of the process should be known before anyone is notified about the exit
+            while self._read_output(watched):
+                pass
+
+            with self._lock:
+                self._release(watched)
+                exited.append((watched.proc, list(watched.on_exit.values())))
+
+                if not watched.on_exit:
+                    self._forget_oldest_exited()
+
+        return exited
+
+    def _close_output(self, watched: WatchedProcess):
+        try:
+            self._selector.unregister(watched.stderr_fd)
+        except (KeyError, ValueError):
+            pass
+
+        watched.stderr_fd = None
+        watched.proc.stderr.close()
+
+    def _release(self, watched: WatchedProcess):
+        """ Closes the descriptors of an exited process, the output is kept for the late subscribers """
+
+        watched.is_exited = True
+
+        if watched.fd is not None:
+            self._selector.unregister(watched.fd)
+            os.close(watched.fd)
+            watched.fd = None
+
+        if watched.stderr_fd is not None:
+            self._close_output(watched)
+
+    def _forget_oldest_exited(self):
+        exited = [pid for pid, watched in self._watched.items() if watched.is_exited]
+
+        for pid in exited[0:max(0, len(exited) - self._exited_size)]:
+            self._watched.pop(pid, None)
+
+    @staticmethod
+    def _call(callback: Callable, argument):
+        try:
+            callback(argument)
+        except Exception as e:
+            Logger.error('Child watcher: callback raised an error: %s' % str(e))
+
+    @staticmethod
+    def _open_pidfd(pid: int) -> Union[int, None]:
+        if not hasattr(os, 'pidfd_open'):
+            return None
+
+        try:
+            return os.pidfd_open(pid)
+        except OSError as e:
+            # the process could be already gone, then it will be collected by polling right away
+            Logger.debug('Child watcher: cannot open pidfd for pid=%i, falling back to polling: %s' % (pid, str(e)))
+            return None
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup[0].recv(1024):
+                pass
+        except BlockingIOError:
+            pass
@@ -0,0 +1,212 @@
+import os
+import subprocess
+from time import sleep, monotonic
+from threading import Event, RLock
+from typing import Dict, List, Set, Tuple, Union
+from ..model import Forwarding, HostTunnelDefinitions
+from ..logger import Logger
+from .sysprocess import SystemProcessManager
+
+
+class ControlMasterManager:
+    """
+    Multiplexed mode: one master SSH connection per host, carrying all forwardings of the host
+
+    Forwardings are added and removed with control messages (ssh -O forward / ssh -O cancel) sent to the master
+    socket, so a restart of a forwarding does not cost a new TCP connection and key exchange.
+    """
+
+    _proc_manager: SystemProcessManager
+    _masters: Dict[str, subprocess.Popen]
+    _master_signatures: Dict[str, str]
+    _active: Dict[str, Set[str]]
+    _specs: Dict[str, str]
+    _errors: Dict[str, str]
+    _output_offsets: Dict[str, int]
+    _locks: Dict[str, RLock]
+    _starting: Dict[str, Event]
+    _lock: RLock
+    _timeout: int
+
+    def __init__(self, proc_manager: SystemProcessManager, timeout: int = 15):
+        self._proc_manager = proc_manager
+        self._masters = {}
+        self._master_signatures = {}
+        self._active = {}
+        self._specs = {}
+        self._errors = {}
+        self._output_offsets = {}
+        self._locks = {}
+        self._starting = {}
+        self._lock = RLock()
+        self._timeout = timeout
+
+    @staticmethod
+    def get_master_signature(configuration: HostTunnelDefinitions) -> str:
+        return '-M -S %s' % configuration.get_control_socket_path()
+
+    def get_master_signatures(self) -> List[str]:
+        with self._lock:
+            return list(self._master_signatures.values())
+
+    def get_master(self, configuration: HostTunnelDefinitions) -> Union[subprocess.Popen, None]:
+        proc = self._masters.get(configuration.ident)
+
+        return proc if proc and proc.poll() is None else None
+
+    def ensure_master(self, configuration: HostTunnelDefinitions) -> subprocess.Popen:
+        """
+        Returns a living master connection, spawns a new one if the previous has exited
+
+        The new master is awaited without holding the lock of the host, other callers wait for the same master
+        instead of spawning their own.
+
+        Threads: Per thread (worker thread in case of the asyncio engine)
+        """
+
+        while True:
+            with self._get_lock(configuration):
+                starting = self._starting.get(configuration.ident)
+
+                if starting is None:
+                    proc = self.get_master(configuration)
+
+                    if proc and self._control(configuration, 'check')[0]:
+                        return proc
+
+                    proc = self._spawn_master(configuration, proc)
+                    starting = self._starting[configuration.ident] = Event()
+                    break
+
+            starting.wait(self._timeout)
+
+        try:
+            self._wait_for_master(proc, configuration)
+        finally:
+            with self._get_lock(configuration):
+                self._starting.pop(configuration.ident).set()
+
+        return proc
+
+    def _spawn_master(self, configuration: HostTunnelDefinitions,
+                      previous: Union[subprocess.Popen, None]) -> subprocess.Popen:
+        # all forwardings that were carried by the previous master are gone together with it
+        self._active[configuration.ident] = set()
+
+        if previous:
+            Logger.warning('Master connection for %s is not responding, replacing it' % configuration)
+            self._proc_manager.kill_process_group(previous)
+
+        socket_path = configuration.get_control_socket_path()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        signature = self.get_master_signature(configuration)
+        proc = self._proc_manager.spawn(configuration.create_control_master_command(), signature)
+
+        with self._lock:
+            self._masters[configuration.ident] = proc
+            self._master_signatures[configuration.ident] = signature
+
+        return proc
+
+    def open_forwarding(self, forwarding: Forwarding, configuration: HostTunnelDefinitions) \
+            -> Tuple[str, subprocess.Popen]:
+        """
+        Adds (or re-adds in case of a restart) a forwarding on the master connection
+
+        :return: Control command and the master process
+        """
+
+        master = self.ensure_master(configuration)
+        spec = forwarding.create_ssh_forwarding_spec()
+        cmd = configuration.create_control_command('forward', spec)
+
+        with self._get_lock(configuration):
+            active = self._active.setdefault(configuration.ident, set())
+
+            if forwarding.ident in active:
+                self._control(configuration, 'cancel', self._specs.get(forwarding.ident, spec))
+                active.discard(forwarding.ident)
+
+            # the master output written before this point is not about this forwarding
+            self._output_offsets[forwarding.ident] = self._proc_manager.child_watcher.get_output_offset(master)
+
+            Logger.info('Forwarding %s via master connection' % spec)
+            is_success, output = self._control(configuration, 'forward', spec)
+
+            if is_success:
+                active.add(forwarding.ident)
+                self._specs[forwarding.ident] = spec
+                self._errors.pop(forwarding.ident, None)
+            else:
+                self._errors[forwarding.ident] = output
+
+        return cmd, master
+
+    def close_forwarding(self, forwarding: Forwarding, configuration: HostTunnelDefinitions):
+        with self._get_lock(configuration):
+            # the spec it was opened with, the variables could have changed since then
+            spec = self._specs.pop(forwarding.ident, None) or forwarding.create_ssh_forwarding_spec()
+            self._control(configuration, 'cancel', spec)
+            self._active.get(configuration.ident, set()).discard(forwarding.ident)
+
+    def close_master(self, configuration: HostTunnelDefinitions):
+        """ Closes the master connection together with all forwardings it carries """
+
+        with self._get_lock(configuration):
+            proc = self.get_master(configuration)
+
+            if proc:
+                Logger.info('Closing master connection for %s, pid=%i' % (configuration, proc.pid))
+                self._proc_manager.kill_process_group(proc)
+
+            with self._lock:
+                self._masters.pop(configuration.ident, None)
+                self._master_signatures.pop(configuration.ident, None)
+                self._active.pop(configuration.ident, None)
+
+    def is_forwarding_active(self, forwarding: Forwarding, configuration: HostTunnelDefinitions) -> bool:
+        if not self.get_master(configuration):
+            return False
+
+        return forwarding.ident in self._active.get(configuration.ident, set())
+
+    def pop_error(self, forwarding: Forwarding) -> str:
+        return self._errors.pop(forwarding.ident, '')
+
+    def pop_output_offset(self, forwarding: Forwarding) -> int:
+        """ Offset of the master output, from which the output is relevant for the forwarding (see: ChildWatcher) """
+
+        return self._output_offsets.pop(forwarding.ident, 0)
+
+    def _wait_for_master(self, proc: subprocess.Popen, configuration: HostTunnelDefinitions):
+        deadline = monotonic() + self._timeout
+
+        while monotonic() < deadline and proc.poll() is None:
+            if self._control(configuration, 'check')[0]:
+                Logger.info('Master connection for %s is ready, pid=%i' % (configuration, proc.pid))
+                return
+
+            sleep(0.25)
+
+        Logger.error('Master connection for %s did not become ready' % configuration)
+
+    def _control(self, configuration: HostTunnelDefinitions, operation: str, spec: str = '') -> Tuple[bool, str]:
+        cmd = configuration.create_control_command(operation, spec)
+
+        try:
+            result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    timeout=self._timeout)
+        except subprocess.TimeoutExpired:
+            return False, 'Timed out: %s' % cmd
+
+        return result.returncode == 0, result.stdout.decode('utf-8')
+
+    def _get_lock(self, configuration: HostTunnelDefinitions) -> RLock:
+        with self._lock:
+            if configuration.ident not in self._locks:
+                self._locks[configuration.ident] = RLock()
+
+            return self._locks[configuration.ident]
@@ -0,0 +1,64 @@
+import psutil
+from time import monotonic
+from threading import RLock
+from typing import Dict, List, Tuple
+from ..logger import Logger
+
+
+class ProcessTableSnapshot:
+    """
+    Shared copy of the system process table (pid + command line), refreshed at most once per TTL
+
+    All supervisor threads read from the same snapshot, so N lookups in a tick cost one /proc scan.
+    Lookups by a cmdline substring are indexed for the lifetime of a snapshot.
+    """
+
+    _ttl: float
+    _entries: List[Tuple[int, str]]
+    _index: Dict[str, List[int]]
+    _taken_at: float
+    _lock: RLock
+
+    def __init__(self, ttl: float = 2):
+        self._ttl = ttl
+        self._entries = []
+        self._index = {}
+        self._taken_at = 0
+        self._lock = RLock()
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            if not force and self._taken_at and monotonic() - self._taken_at < self._ttl:
+                return
+
+            entries = []
+
+            for proc in psutil.process_iter(['pid', 'cmdline']):
+                if proc.info['cmdline']:
+                    entries.append((proc.pid, " ".join(proc.info['cmdline'])))
+
+            Logger.debug('proctable: took a snapshot of %i processes' % len(entries))
+
+            self._entries = entries
+            self._index = {}
+            self._taken_at = monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._taken_at = 0
+
+    def find_pids(self, needle: str) -> List[int]:
+        """
+        Lists PIDs of processes which command line contains the needle
+
+        :param needle: Substring of a command line, ex. forwarding signature
+        :return:
+        """
+
+        with self._lock:
+            self.refresh()
+
+            if needle not in self._index:
+                self._index[needle] = [pid for pid, cmdline in self._entries if needle in cmdline]
+
+            return list(self._index[needle])
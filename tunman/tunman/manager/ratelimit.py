@@ -0,0 +1,71 @@
+from threading import Lock
+from time import monotonic
+from typing import Dict
+from ..interfaces import ConfigurationInterface
+
+
+class TokenBucket:
+    """
+    Allows "rate" operations per second, with bursts up to "burst" operations
+
+    Tokens are reserved in advance - the caller gets the time it has to wait for its token,
+    so the waiting itself can be done by anyone (a thread, a coroutine, the Scheduler).
+    """
+
+    _rate: float
+    _burst: float
+    _tokens: float
+    _updated_at: float
+    _lock: Lock
+
+    def __init__(self, rate: float, burst: float):
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = self._burst
+        self._updated_at = monotonic()
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token
+
+        :return: Number of seconds to wait before the token may be used
+        """
+
+        if self._rate <= 0:
+            return 0
+
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            self._tokens -= 1
+
+            return 0 if self._tokens >= 0 else -self._tokens / self._rate
+
+
+class SpawnRateLimiter:
+    """
+    Token bucket per SSH host - a host does not get a burst of new connections at startup,
+    or when many of its tunnels are restarting at once, while other hosts are not slowed down
+    """
+
+    _rate: float
+    _burst: float
+    _buckets: Dict[str, TokenBucket]
+    _lock: Lock
+
+    def __init__(self, rate_per_host: float = 2, burst_per_host: float = 4):
+        self._rate = rate_per_host
+        self._burst = burst_per_host
+        self._buckets = {}
+        self._lock = Lock()
+
+    def reserve(self, configuration: ConfigurationInterface) -> float:
+        with self._lock:
+            bucket = self._buckets.get(configuration.ident)
+
+            if bucket is None:
+                bucket = self._buckets[configuration.ident] = TokenBucket(self._rate, self._burst)
+
+        return bucket.reserve()
@@ -0,0 +1,111 @@
+import psutil
+from threading import RLock
+from typing import Dict, List, Set, Union
+from ..logger import Logger
+from .proctable import ProcessTableSnapshot
+
+
+class ProcessRegistry:
+    """
+    Maps each forwarding signature to the PIDs that were spawned for it
+
+    Lookups inspect only the registered PIDs (a single /proc entry each), a full process table scan is performed
+    only when none of the registered processes is alive - to re-adopt orphans, ex. autossh that daemonized itself
+    or tunnels that survived a previous run of the application
+    """
+
+    _pids: Dict[str, Set[int]]
+    _lock: RLock
+    _snapshot: ProcessTableSnapshot
+
+    def __init__(self, snapshot: ProcessTableSnapshot = None):
+        self._pids = {}
+        self._lock = RLock()
+        self._snapshot = snapshot if snapshot else ProcessTableSnapshot()
+
+    def register(self, signature: str, pid: int):
+        """ Spawn event: remember that the process belongs to the signature """
+
+        with self._lock:
+            self._pids.setdefault(signature, set()).add(pid)
+
+    def forget_pid(self, pid: int):
+        """ Exit event: the process is no longer alive """
+
+        with self._lock:
+            for pids in self._pids.values():
+                pids.discard(pid)
+
+    def forget(self, signature: str):
+        with self._lock:
+            self._pids.pop(signature, None)
+
+    def get_pids(self, signature: str) -> List[int]:
+        with self._lock:
+            return list(self._pids.get(signature, []))
+
+    def get_signatures(self) -> List[str]:
+        with self._lock:
+            return list(self._pids.keys())
+
+    def find(self, signature: str, adopt: bool = True) -> Union[psutil.Process, None]:
+        """
+        Finds a living process for given signature
+
+        :param signature:
+        :param adopt: Allow to fall back to a process table scan, when no registered process is alive
+        :return:
+        """
+
+        for pid in self.get_pids(signature):
+            proc = self._inspect(pid, signature)
+
+            if proc:
+                return proc
+
+            Logger.debug('registry: pid=%i of "%s" is no longer alive' % (pid, signature))
+            self.forget_pid(pid)
+
+        if not adopt:
+            return None
+
+        return self.adopt(signature)
+
+    def adopt(self, signature: str) -> Union[psutil.Process, None]:
+        """ Look up the shared process table snapshot for an orphaned process that matches the signature """
+
+        for pid in self._snapshot.find_pids(signature):
+            # the snapshot could be a few seconds old, also the cmdline needs to match more strictly
+            proc = self._inspect(pid, signature)
+
+            if proc:
+                Logger.debug('registry: adopting pid=%i for "%s"' % (proc.pid, signature))
+                self.register(signature, proc.pid)
+
+                return proc
+
+        return None
+
+    def _inspect(self, pid: int, signature: str) -> Union[psutil.Process, None]:
+        try:
+            proc = psutil.Process(pid)
+
+            if proc.status() == psutil.STATUS_ZOMBIE:
+                return None
+
+            if self.matches(proc.cmdline(), signature):
+                return proc
+
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+        return None
+
+    @staticmethod
+    def matches(cmdline: Union[List[str], None], signature: str) -> bool:
+        if not cmdline:
+            return False
+
+        joined = " ".join(cmdline)
+
+        return signature in joined and "ssh" in joined
@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+from itertools import count
+from threading import Condition, Event, Thread
+from time import monotonic
+from typing import Callable, List, Set, Tuple, Union
+from ..logger import Logger
+from ..metrics import SCHEDULER_LAG
+
+
+class Timer:
+    """ Single deadline owned by the Scheduler """
+
+    deadline: float
+    callback: Callable[[bool], None]
+    cancelled: bool
+    key: Union[str, None]
+
+    def __init__(self, deadline: float, callback: Callable[[bool], None], key: Union[str, None] = None):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+        self.key = key
+
+
+class Scheduler:
+    """
+    Owns every deadline of the supervisor - health check intervals, back-off waits and warm-ups
+
+    Deadlines are kept on a heap and fired by a single thread, which wakes up only when the nearest deadline
+    passes. On shutdown all pending deadlines are cancelled at once, so no one waits for its own timer to end.
+
+    Callbacks receive True when the deadline passed, False when the timer was cancelled by the shutdown.
+
+    Timers could be given a key, then an event (ex. exit of a process) can wake them up before the deadline.
+    """
+
+    _heap: List[Tuple[float, int, Timer]]
+    _sequence: count
+    _condition: Condition
+    _thread: Union[Thread, None]
+    _woken: Set[str]
+    is_shut_down: bool
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = count()
+        self._condition = Condition()
+        self._thread = None
+        self._woken = set()
+        self.is_shut_down = False
+
+    def call_later(self, delay: float, callback: Callable[[bool], None], key: Union[str, None] = None) -> Timer:
+        timer = Timer(monotonic() + delay, callback, key)
+
+        with self._condition:
+            if self.is_shut_down:
+                timer.cancelled = True
+                callback(False)
+                return timer
+
+            # the event happened before anyone started to wait for it
+            if key is not None and key in self._woken:
+                self._woken.discard(key)
+                callback(True)
+                return timer
+
+            heapq.heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+            self._start_thread()
+            self._condition.notify()
+
+        return timer
+
+    def wake(self, key: str):
+        """ Fires timers of given key immediately, or the next timer of the key when there is no such timer yet """
+
+        with self._condition:
+            timers = [timer for _, _, timer in self._heap if timer.key == key and not timer.cancelled]
+
+            if not timers:
+                self._woken.add(key)
+
+            for timer in timers:
+                timer.cancelled = True
+
+        for timer in timers:
+            timer.callback(True)
+
+    def forget(self, key: str):
+        """ Drops a pending wake up of the key """
+
+        with self._condition:
+            self._woken.discard(key)
+
+    def cancel(self, timer: Timer):
+        """ Forget the timer without calling its callback """
+
+        with self._condition:
+            timer.cancelled = True
+
+    def sleep(self, seconds: float, key: Union[str, None] = None) -> bool:
+        """
+        Blocks the current thread until the deadline, or until woken up by the key
+
+        :return: False when the sleep was interrupted by the shutdown
+        """
+
+        if self.is_shut_down:
+            return False
+
+        if seconds <= 0:
+            return True
+
+        event = Event()
+        result = []
+
+        def on_deadline(expired: bool):
+            result.append(expired)
+            event.set()
+
+        self.call_later(seconds, on_deadline, key)
+        event.wait()
+
+        return result[0]
+
+    async def async_sleep(self, seconds: float, key: Union[str, None] = None) -> bool:
+        """
+        Suspends the coroutine until the deadline, or until woken up by the key
+
+        :return: False when the sleep was interrupted by the shutdown
+        """
+
+        if self.is_shut_down:
+            return False
+
+        if seconds <= 0:
+            return True
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def resolve(expired: bool):
+            if not future.done():
+                future.set_result(expired)
+
+        def on_deadline(expired: bool):
+            try:
+                loop.call_soon_threadsafe(resolve, expired)
+            except RuntimeError:
+                pass  # loop already closed
+
+        timer = self.call_later(seconds, on_deadline, key)
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.cancel(timer)
+            raise
+
+    def shutdown(self):
+        """ Cancels all pending deadlines at once """
+
+        with self._condition:
+            self.is_shut_down = True
+            pending = [timer for _, _, timer in self._heap if not timer.cancelled]
+            self._heap = []
+            self._condition.notify()
+
+        Logger.debug('Scheduler: cancelling %i pending deadlines' % len(pending))
+
+        for timer in pending:
+            timer.cancelled = True
+            timer.callback(False)
+
+    def _start_thread(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='tunman-scheduler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            due = []
+
+            with self._condition:
+                while not self.is_shut_down and not due:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+
+                    now = monotonic()
+
+                    while self._heap and self._heap[0][0] <= now:
+                        _, _, timer = heapq.heappop(self._heap)
+
+                        if not timer.cancelled:
+                            due.append(timer)
+
+                    if not due and self._heap:
+                        self._condition.wait(self._heap[0][0] - now)
+
+                if self.is_shut_down and not due:
+                    return
+
+            fired_at = monotonic()
+
+            for timer in due:
+                SCHEDULER_LAG.observe(max(fired_at - timer.deadline, 0))
+
+                try:
+                    timer.callback(True)
+                except Exception as e:
+                    Logger.error('Scheduler: timer callback raised an error: %s' % str(e))
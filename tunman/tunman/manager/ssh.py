@@ -1,14 +1,23 @@
 
+import re
 import subprocess
-from typing import List
-from time import sleep
-from threading import RLock
+from collections import deque
+from time import monotonic
+from typing import Deque, Dict, List, Pattern, Set, Tuple, Union
+from threading import BoundedSemaphore, RLock
 from traceback import format_exc
 from ..model import Forwarding, HostTunnelDefinitions
 from ..logger import Logger
 from ..validation import Validation
 from ..notify import Notify
+from ..status import StatusBoard
+from ..metrics import TUNNEL_RESTARTS, SPAWN_TO_HEALTHY, PROCESSES, TUNNELS
 from .sysprocess import SystemProcessManager
+from .scheduler import Scheduler
+from .multiplex import ControlMasterManager
+from .ratelimit import SpawnRateLimiter
+from .childwatch import ChildWatcher
+from .ssherrors import SSHErrorClassifier, ERROR_REMOTE_BIND_FAILED, ERROR_DESCRIPTIONS
 
 SIGNAL_TERMINATE = 1
 SIGNAL_RESTART = 2
@@ -21,15 +30,60 @@ class TunnelManager:
 
     _signatures: List[str]
     _proc_manager: SystemProcessManager
+    _scheduler: Scheduler
+    _multiplexer: ControlMasterManager
+    _spawn_rate_limiter: SpawnRateLimiter
+    _spawn_slots: BoundedSemaphore
+    _child_watcher: ChildWatcher
+    _process_output: Dict[str, Deque[str]]
+    _process_errors: Dict[str, str]
+    status: StatusBoard
+    _spawned_at: Dict[str, float]
+    _failures: Dict[str, int]
+    _running: Dict[Forwarding, str]
+    _stopped: Set[Forwarding]
+    _wake_keys: Dict[Forwarding, str]
     _sleep_time = 10
+    _recovery_wait_time = 2
+    _health_check_grids: Dict[str, float]
+    _health_check_grid_margin = 0.01
+    _shutdown_timeout: float
+    _invalidate_after_failures: int
     is_terminating: bool
 
-    def __init__(self):
+    def __init__(self, process_table_ttl: float = 2, spawn_rate_per_host: float = 2, spawn_burst_per_host: float = 4,
+                 max_concurrent_spawns: int = 32, shutdown_timeout: float = 10, invalidate_after_failures: int = 3):
+        """
+        :param process_table_ttl: How often at most the process table could be scanned
+        :param spawn_rate_per_host: Number of SSH processes per second that could be spawned for a single host
+        :param spawn_burst_per_host: Number of SSH processes that could be spawned at once for a single host
+        :param max_concurrent_spawns: Global limit of SSH processes being spawned at the same time
+        :param shutdown_timeout: Time for all SSH processes to exit gracefully on shutdown, before they are killed
+        :param invalidate_after_failures: Failures in a row, after which the variables of the forwarding are
+                                          resolved again (0 disables)
+        """
+
         self.is_terminating = False
+        self._shutdown_timeout = shutdown_timeout
+        self._invalidate_after_failures = invalidate_after_failures
         self._signatures = []
         self._lock = RLock(timeout=60)
         self._starts_history = {}
-        self._proc_manager = SystemProcessManager()
+        self._proc_manager = SystemProcessManager(process_table_ttl=process_table_ttl)
+        self._scheduler = Scheduler()
+        self._multiplexer = ControlMasterManager(self._proc_manager)
+        self._spawn_rate_limiter = SpawnRateLimiter(spawn_rate_per_host, spawn_burst_per_host)
+        self._spawn_slots = BoundedSemaphore(max_concurrent_spawns)
+        self._child_watcher = self._proc_manager.child_watcher
+        self._process_output = {}
+        self._process_errors = {}
+        self.status = StatusBoard()
+        self._spawned_at = {}
+        self._failures = {}
+        self._running = {}
+        self._stopped = set()
+        self._wake_keys = {}
+        self._health_check_grids = {}
 
     def spawn_tunnel(self, definition: Forwarding, configuration: HostTunnelDefinitions):
         """
@@ -42,41 +96,35 @@ class TunnelManager:
         :return:
         """
 
-        try:
-            signature = definition.create_ssh_forwarding_signature()
-        except Exception as e:
-            signature = 'not_working_signature'
-
-            Logger.error('Cannot create a forwarding signature, maybe an SSH error? Error says %s' % str(e))
-            Logger.error(format_exc())
-
-        Logger.info('Created SSH args: %s' % definition.create_ssh_arguments())
-
-        with self._lock:
-            self._signatures.append(signature)
-
+        signature = self._create_signature(definition)
         retries_left = definition.retries
+        stop_key = self._get_stop_key(definition)
 
         while True:
             if retries_left == 0:
                 retries_left = definition.retries
-                self._carefully_sleep(definition.wait_time_after_all_retries_failed)
+                self._carefully_sleep(definition.wait_time_after_all_retries_failed, stop_key)
 
             try:
                 signal = self.spawn_ssh_process(definition, configuration, signature)
             except:
                 Logger.error(format_exc())
-                self._carefully_sleep(5)
+                self._carefully_sleep(5, stop_key)
                 continue
 
-            if signal == SIGNAL_TERMINATE:
+            if signal == SIGNAL_TERMINATE or self._is_stopped(definition):
+                self._on_supervision_finished(definition)
                 return
 
             if signal != SIGNAL_RESTART:
                 raise Exception('Application error, unknown signal "%s"' % str(signal))
 
+            self.status.on_down(definition)
+            self.status.on_health_check(definition, definition.health_history.get_summary())
+            signature = self._refresh_signature(definition, signature)
+
             # should not matter, secures from too much CPU usage
-            self._carefully_sleep(2)
+            self._carefully_sleep(2, stop_key)
             retries_left -= 1
 
     def spawn_ssh_process(self, forwarding: Forwarding,
@@ -93,40 +141,54 @@ class TunnelManager:
         :return:
         """
 
-        # remove old, died processes from the internal registry
-        with self._lock:
-            self._proc_manager.clean_up_already_exited_processes()
+        if self.is_terminating or self._is_stopped(forwarding):
+            return SIGNAL_TERMINATE
 
-        if self.is_terminating:
+        if not self._scheduler.sleep(self._get_spawn_delay(configuration)) or self._is_stopped(forwarding):
             return SIGNAL_TERMINATE
 
-        cmd = configuration.create_complete_command_with_supervision(forwarding)
+        with self._spawn_slots:
+            cmd, proc = self._start_process(forwarding, configuration, signature)
 
-        # maintain the registry
-        with self._lock:
-            proc = self._proc_manager.spawn(cmd)
+        wake_key = self._watch_process(forwarding, proc)
 
-            forwarding.on_tunnel_started()
-            Notify.notify_tunnel_restarted(forwarding)
+        try:
+            if self._is_stopped(forwarding):
+                # stopped while the process was being spawned
+                self._kill_tunnel(forwarding, configuration, signature)
+                return SIGNAL_TERMINATE
 
-        self._carefully_sleep(forwarding.warm_up_time)
+            self._carefully_sleep(forwarding.warm_up_time, wake_key)
 
-        # make a delayed retry on start
-        if not Validation.is_process_alive(signature):
-            stdout, stderr = self._proc_manager.communicate(proc)
-            Logger.error('Cannot spawn %s, stdout=%s, stderr=%s' % (cmd, stdout, stderr))
+            # stopped during the warm up - the tunnel is already closed, a replacement of the same ident
+            # could be running, so neither its status nor its forwarding could be touched
+            if self._is_stopped(forwarding):
+                return SIGNAL_TERMINATE
 
-            if not self._recover_from_error(stdout + stderr, configuration):
-                self._carefully_sleep(forwarding.time_before_restart_at_initialization)
+            error = self._pop_process_error(wake_key)
 
-            return SIGNAL_RESTART
+            # make a delayed retry on start
+            if error or not self._is_tunnel_alive(forwarding, configuration, signature):
+                if error:
+                    # ex. the port could not be bound, while the connection itself stays open
+                    self._kill_tunnel(forwarding, configuration, signature)
 
-        Logger.info('Process for "%s" survived initialization, got pid=%i' % (signature, proc.pid))
+                if self._handle_failed_start(forwarding, cmd, configuration, wake_key):
+                    self._carefully_sleep(self._recovery_wait_time)
+                else:
+                    self._carefully_sleep(forwarding.time_before_restart_at_initialization)
 
-        return self._tunnel_loop(proc, forwarding, configuration, signature)
+                return SIGNAL_RESTART
+
+            Logger.info('Process for "%s" survived initialization, got pid=%i' % (signature, proc.pid))
+            self._on_tunnel_alive(forwarding, configuration, proc.pid)
+
+            return self._tunnel_loop(proc, forwarding, configuration, signature, wake_key)
+        finally:
+            self._unwatch_process(forwarding, proc, wake_key)
 
     def _tunnel_loop(self, proc: subprocess.Popen, definition: Forwarding, configuration: HostTunnelDefinitions,
-                     signature: str) -> int:
+                     signature: str, wake_key: str = None) -> int:
         """
         One tunnel = one thread of health monitoring and reacting
 
@@ -135,22 +197,33 @@ class TunnelManager:
         :param definition:
         :param configuration:
         :param signature:
+        :param wake_key: Wakes up the loop before the next check is due, when the process exits or fails
         :return:
         """
 
         Logger.debug('Starting monitoring loop for "%s"' % signature)
 
         while True:
-            if not self._carefully_sleep(definition.validate.interval):
+            if not self._carefully_sleep(self._get_health_check_delay(definition, configuration), wake_key) \
+                    or self._is_stopped(definition):
                 return SIGNAL_TERMINATE
 
-            if not self._proc_manager.wait(proc):
+            if not self._proc_manager.is_running(proc):
                 Logger.error('The process just exited')
+                self._proc_manager.registry.forget_pid(proc.pid)
+                return SIGNAL_RESTART
+
+            if self._pop_process_error(wake_key):
+                self._kill_tunnel(definition, configuration, signature)
+
+                if self._recover_from_error(self._get_process_output(wake_key), configuration):
+                    self._carefully_sleep(self._recovery_wait_time)
+
                 return SIGNAL_RESTART
 
             Logger.debug('Running checks for signature "%s"' % signature)
 
-            if not Validation.is_process_alive(signature):
+            if not self._is_tunnel_alive(definition, configuration, signature):
                 Logger.error('The tunnel process exited for signature "%s"' % signature)
                 return SIGNAL_RESTART
 
@@ -159,23 +232,408 @@ class TunnelManager:
                     definition.validate.method, signature))
 
                 time_to_wait_on_health_check_failure = definition.validate.wait_time_before_restart
-                sleep(time_to_wait_on_health_check_failure)
+
+                if not self._scheduler.sleep(time_to_wait_on_health_check_failure) or self._is_stopped(definition):
+                    return SIGNAL_TERMINATE
 
                 # check if after given additional short wait time the health is OK
                 if time_to_wait_on_health_check_failure and Validation.check_tunnel_alive(definition, configuration):
                     Logger.info('Tunnel "%s" was recovered with restart' % signature)
                     continue
 
-                if definition.validate.kill_existing_tunnel_on_failure:
-                    self._proc_manager.kill_process_by_signature(signature)
+                if definition.validate.kill_existing_tunnel_on_failure and not self._is_stopped(definition):
+                    self._kill_tunnel(definition, configuration, signature)
 
                 return SIGNAL_RESTART
 
+            self._on_tunnel_alive(definition, configuration, proc.pid)
+
+    def _create_signature(self, definition: Forwarding) -> str:
+        """
+        Creates and registers the forwarding signature, which identifies the tunnel process
+
+        Threads: Per thread (worker thread in case of the asyncio engine)
+        """
+
+        try:
+            signature = definition.create_ssh_forwarding_signature()
+        except Exception as e:
+            signature = 'not_working_signature'
+
+            Logger.error('Cannot create a forwarding signature, maybe an SSH error? Error says %s' % str(e))
+            Logger.error(format_exc())
+
+        Logger.info('Created SSH args: %s' % definition.create_ssh_arguments())
+
+        with self._lock:
+            self._signatures.append(signature)
+            self._running[definition] = signature
+
+        self.status.register(definition, signature)
+
+        return signature
+
+    def _refresh_signature(self, definition: Forwarding, signature: str) -> str:
+        """
+        Called on each restart. After a few failures in a row the variables the forwarding depends on are resolved
+        again (ex. a docker bridge IP or a DNS record could have changed). A signature that changed replaces the old one
+        in the registry, the process of the old signature is killed
+
+        Threads: Per thread (worker thread in case of the asyncio engine)
+
+        :return: Signature to spawn the tunnel with
+        """
+
+        failures = self._failures.get(definition.ident, 0) + 1
+        self._failures[definition.ident] = failures
+
+        if self._invalidate_after_failures and failures % self._invalidate_after_failures == 0:
+            invalidated = definition.invalidate_ssh_forwarding_signature()
+            Logger.warning('"%s" failed %i times in a row, resolving again: %s' % (
+                definition, failures, ', '.join(invalidated) or 'no variables'))
+
+        with self._lock:
+            # could be already replaced by refresh_signatures()
+            signature = self._running.get(definition, signature)
+
+        return self._update_signature(definition, signature)
+
+    def refresh_signatures(self, configuration: HostTunnelDefinitions, cache_ids: List[str]):
+        """
+        Values of the variables have changed (ex. revalidated in the background) - the running tunnels,
+        that were created with the old values, are stopped and restarted by their supervisors with the new ones
+
+        Threads: Any
+        """
+
+        for definition in configuration.get_forwardings_depending_on(cache_ids):
+            with self._lock:
+                signature = self._running.get(definition)
+                wake_key = self._wake_keys.get(definition)
+
+            if signature is None:
+                # not spawned yet, will use the current values
+                continue
+
+            if self._update_signature(definition, signature) == signature:
+                continue
+
+            if configuration.multiplexing:
+                # cancelled using the spec it was opened with
+                self._kill_tunnel(definition, configuration, signature)
+
+            if wake_key:
+                self._scheduler.wake(wake_key)
+
+    def _update_signature(self, definition: Forwarding, signature: str) -> str:
+        """ Re-creates the signature, a changed one replaces the old one and the process of the old one is killed """
+
+        try:
+            new_signature = definition.create_ssh_forwarding_signature()
+        except Exception as e:
+            Logger.error('Cannot re-create the forwarding signature, keeping "%s". Error says %s' % (signature, str(e)))
+            return signature
+
+        if new_signature == signature:
+            return signature
+
+        Logger.warning('Signature of "%s" changed from "%s" to "%s"' % (definition, signature, new_signature))
+
+        if not definition.configuration.multiplexing:
+            self._proc_manager.kill_process_by_signature(signature)
+
+        self._proc_manager.registry.forget(signature)
+
+        with self._lock:
+            if signature in self._signatures and new_signature not in self._signatures:
+                self._signatures[self._signatures.index(signature)] = new_signature
+            elif new_signature not in self._signatures:
+                self._signatures.append(new_signature)
+            elif signature in self._signatures:
+                self._signatures.remove(signature)
+
+            self._running[definition] = new_signature
+
+        self.status.register(definition, new_signature)
+
+        return new_signature
+
+    def stop_tunnel(self, definition: Forwarding):
+        """
+        Stops supervising the forwarding (ex. removed from the configuration) and closes its tunnel.
+        The supervising thread/coroutine exits as soon as it wakes up
+
+        Threads: Any
+        """
+
+        with self._lock:
+            self._stopped.add(definition)
+            signature = self._running.pop(definition, None)
+            wake_key = self._wake_keys.get(definition)
+
+            if signature in self._signatures:
+                self._signatures.remove(signature)
+
+        Logger.info('Stopping "%s"' % definition)
+
+        if signature:
+            self._kill_tunnel(definition, definition.configuration, signature)
+            self._proc_manager.registry.forget(signature)
+
+        self.status.unregister(definition)
+        self._failures.pop(definition.ident, None)
+        self._spawned_at.pop(definition.ident, None)
+        self._scheduler.wake(self._get_stop_key(definition))
+
+        if wake_key:
+            self._scheduler.wake(wake_key)
+
+    def close_host(self, configuration: HostTunnelDefinitions):
+        """ Closes the master connection of a host that is no longer configured (multiplexed mode) """
+
+        if configuration.multiplexing:
+            self._multiplexer.close_master(configuration)
+
+    def _is_stopped(self, definition: Forwarding) -> bool:
+        return definition in self._stopped
+
+    @staticmethod
+    def _get_stop_key(definition: Forwarding) -> str:
+        """ Wakes up the sleeps of a stopped forwarding, that are not related to its process """
+
+        return 'stop:%s:%i' % (definition.ident, id(definition))
+
+    def _on_supervision_finished(self, definition: Forwarding):
+        with self._lock:
+            self._stopped.discard(definition)
+
+        self._scheduler.forget(self._get_stop_key(definition))
+
+    def _watch_process(self, forwarding: Forwarding, proc: subprocess.Popen) -> str:
+        """
+        Wakes up the forwarding as soon as its process exits, instead of waiting for the next check
+
+        :return: Key to wake up the sleeps of the forwarding with
+        """
+
+        wake_key = '%s#%i' % (forwarding.ident, proc.pid)
+        self._process_output[wake_key] = deque(maxlen=50)
+        self._wake_keys[forwarding] = wake_key
+        since = 0
+        pattern = None
+
+        if forwarding.configuration.multiplexing:
+            # the master connection is shared: only its output since this forwarding was added,
+            # and only the lines about the port of this forwarding are relevant
+            since = self._multiplexer.pop_output_offset(forwarding)
+            pattern = self._create_listen_port_pattern(forwarding)
+
+        self._child_watcher.watch(
+            proc, wake_key,
+            on_exit=lambda exited: self._on_process_exited(exited, wake_key),
+            on_output=lambda line: self._on_process_output(forwarding, line, wake_key, pattern),
+            since=since
+        )
+
+        return wake_key
+
+    def _unwatch_process(self, forwarding: Forwarding, proc: subprocess.Popen, wake_key: str):
+        if self._wake_keys.get(forwarding) == wake_key:
+            self._wake_keys.pop(forwarding, None)
+
+        self._child_watcher.unwatch(proc, wake_key)
+        self._scheduler.forget(wake_key)
+        self._process_output.pop(wake_key, None)
+        self._process_errors.pop(wake_key, None)
+
+    def _on_process_exited(self, proc: subprocess.Popen, wake_key: str):
+        """
+        Threads: Child watcher thread
+        """
+
+        Logger.warning('Process pid=%i exited with code %s' % (proc.pid, str(proc.returncode)))
+        self._proc_manager.registry.forget_pid(proc.pid)
+        self._scheduler.wake(wake_key)
+
+    def _on_process_output(self, forwarding: Forwarding, line: str, wake_key: str,
+                           pattern: Union[Pattern, None] = None):
+        """
+        Classifies the stderr of the process as it arrives, a known fatal error wakes up the forwarding at once
+
+        Threads: Child watcher thread (or the thread that started watching, for the lines written before)
+
+        :param pattern: When set, only matching lines are about the forwarding (shared master connection)
+        """
+
+        if pattern is not None and not pattern.search(line):
+            return
+
+        output = self._process_output.get(wake_key)
+
+        if output is not None:
+            output.append(line)
+
+        error = SSHErrorClassifier.classify(line)
+
+        if error:
+            Logger.error('%s for "%s": %s' % (ERROR_DESCRIPTIONS[error], forwarding, line))
+            self._process_errors[wake_key] = error
+            self._scheduler.wake(wake_key)
+
+    @staticmethod
+    def _create_listen_port_pattern(forwarding: Forwarding) -> Pattern:
+        """ Matches the port that the forwarding listens on, ex. "bind [127.0.0.1]:8010: Address already in use" """
+
+        try:
+            port = forwarding.remote.get_port() if forwarding.is_forwarding_local_to_remote() \
+                else forwarding.local.get_port()
+        except Exception as e:
+            Logger.warning('Cannot determine the listen port of "%s": %s' % (forwarding, str(e)))
+            return re.compile(r'(?!)')
+
+        return re.compile(r'(?<![0-9])%i(?![0-9])' % port)
+
+    def _pop_process_error(self, wake_key: Union[str, None]) -> Union[str, None]:
+        return self._process_errors.pop(wake_key, None)
+
+    def _get_process_output(self, wake_key: Union[str, None]) -> str:
+        return "\n".join(self._process_output.get(wake_key, []))
+
+    def _get_health_check_delay(self, definition: Forwarding, configuration: HostTunnelDefinitions) -> float:
+        """
+        Time to the next health check of the forwarding
+
+        Remote port checks are due on a grid of the interval, common for the whole host - forwardings started
+        at different moments check together, so the checks land in a single batch (one SSH exec per host per tick)
+        """
+
+        interval = definition.validate.interval
+
+        if definition.validate.method != 'remote_port_ping' or interval <= 0:
+            return interval
+
+        started_at = self._health_check_grids.setdefault(configuration.ident, monotonic())
+        delay = interval - (monotonic() - started_at) % interval
+
+        # woken up right at the tick, the check of this tick is being made now
+        if delay < min(self._health_check_grid_margin, interval / 2):
+            delay += interval
+
+        return delay
+
+    def _get_spawn_delay(self, configuration: HostTunnelDefinitions) -> float:
+        """ Reserves a spawn of a SSH process for the host, returns the time to wait for it """
+
+        delay = self._spawn_rate_limiter.reserve(configuration)
+
+        if delay > 0:
+            Logger.debug('Spawn for %s delayed by %.2fs due to the rate limit of the host' % (configuration, delay))
+
+        return delay
+
+    def _start_process(self, forwarding: Forwarding, configuration: HostTunnelDefinitions,
+                       signature: str) -> Tuple[str, subprocess.Popen]:
+        """
+        Spawns the SSH process and maintains the registry
+
+        Threads: Per thread (worker thread in case of the asyncio engine)
+        """
+
+        # remove old, died processes from the internal registry
+        with self._lock:
+            self._proc_manager.clean_up_already_exited_processes()
+
+        if configuration.multiplexing:
+            cmd, proc = self._multiplexer.open_forwarding(forwarding, configuration)
+
+            with self._lock:
+                forwarding.on_tunnel_started()
+                Notify.notify_tunnel_restarted(forwarding)
+
+            self._on_tunnel_started(forwarding, configuration)
+
+            return cmd, proc
+
+        cmd = configuration.create_complete_command_with_supervision(forwarding)
+
+        # the registry is thread-safe, spawning (that waits for the process to settle) does not block other tunnels
+        proc = self._proc_manager.spawn(cmd, signature)
+
+        with self._lock:
+            forwarding.on_tunnel_started()
+            Notify.notify_tunnel_restarted(forwarding)
+
+        self._on_tunnel_started(forwarding, configuration)
+
+        return cmd, proc
+
+    def _on_tunnel_started(self, forwarding: Forwarding, configuration: HostTunnelDefinitions):
+        # the state is kept per ident, it could belong to a replacement of a stopped forwarding already
+        if self._is_stopped(forwarding):
+            return
+
+        self._spawned_at[forwarding.ident] = monotonic()
+        self.status.on_started(forwarding)
+
+        if forwarding.current_restart_count > 0:
+            TUNNEL_RESTARTS.inc(forwarding=forwarding.ident, host=configuration.ident)
+
+    def _on_tunnel_alive(self, forwarding: Forwarding, configuration: HostTunnelDefinitions, pid: int):
+        if self._is_stopped(forwarding):
+            return
+
+        self._failures[forwarding.ident] = 0
+        spawned_at = self._spawned_at.pop(forwarding.ident, None)
+
+        if spawned_at is not None:
+            SPAWN_TO_HEALTHY.observe(monotonic() - spawned_at, forwarding=forwarding.ident, host=configuration.ident)
+
+        self.status.on_alive(forwarding, pid)
+        self.status.on_health_check(forwarding, forwarding.health_history.get_summary())
+
+    def _handle_failed_start(self, forwarding: Forwarding, cmd: str, configuration: HostTunnelDefinitions,
+                             wake_key: str) -> bool:
+        """
+        Reports output of a process that did not survive the warm up, attempts to recover
+
+        Threads: Per thread (worker thread in case of the asyncio engine)
+
+        :return: Returns True when recovery was performed
+        """
+
+        if configuration.multiplexing:
+            output = self._multiplexer.pop_error(forwarding)
+            Logger.error('Cannot forward %s, output=%s' % (cmd, output))
+
+            return self._recover_from_error(output, configuration)
+
+        output = self._get_process_output(wake_key)
+        Logger.error('Cannot spawn %s, stderr=%s' % (cmd, output))
+
+        return self._recover_from_error(output, configuration)
+
+    def _is_tunnel_alive(self, forwarding: Forwarding, configuration: HostTunnelDefinitions, signature: str) -> bool:
+        if configuration.multiplexing:
+            return self._multiplexer.is_forwarding_active(forwarding, configuration)
+
+        return Validation.is_process_alive(signature, self._proc_manager.registry)
+
+    def _kill_tunnel(self, forwarding: Forwarding, configuration: HostTunnelDefinitions, signature: str):
+        if configuration.multiplexing:
+            self._multiplexer.close_forwarding(forwarding, configuration)
+            return
+
+        self._proc_manager.kill_process_by_signature(signature)
+
     def get_stats(self, definitions: List[Forwarding]) -> dict:
         definitions_status = {}
 
         for definition in definitions:
-            proc = self._proc_manager.find_process_by_signature(definition.create_ssh_forwarding_signature())
+            if definition.configuration.multiplexing:
+                proc = self._multiplexer.get_master(definition.configuration) \
+                    if self._multiplexer.is_forwarding_active(definition, definition.configuration) else None
+            else:
+                proc = self._proc_manager.find_process_by_signature(definition.create_ssh_forwarding_signature())
 
             definitions_status[definition] = {
                 'pid': proc.pid if proc else '',
@@ -192,31 +650,44 @@ class TunnelManager:
             'is_terminating': self.is_terminating
         }
 
-    @staticmethod
-    def _recover_from_error(error_message: str, config: HostTunnelDefinitions) -> bool:
+    def collect_metrics(self):
+        """ Updates gauges, that are computed at scrape time """
+
+        snapshot = self.status.get_snapshot()
+        alive = len([forwarding for forwarding in snapshot['forwardings'] if forwarding['is_alive']])
+
+        PROCESSES.set(self._proc_manager.get_procs_count())
+        TUNNELS.set(alive, state='alive')
+        TUNNELS.set(len(snapshot['forwardings']) - alive, state='down')
+
+    def _recover_from_error(self, error_message: str, config: HostTunnelDefinitions) -> bool:
         """
+        Blocking part of the recovery, the caller waits "_recovery_wait_time" for its effects when it was performed
+        (the asyncio engine waits on the loop, not in the worker pool)
+
+        Threads: Per thread (worker thread in case of the asyncio engine)
+
         :param error_message:
         :param config:
         :return: Returns True when recovery was performed
         """
 
-        if "remote port forwarding failed for listen port" in error_message and config.restart_all_on_forward_failure:
+        if ERROR_REMOTE_BIND_FAILED in SSHErrorClassifier.classify_output(error_message) \
+                and config.restart_all_on_forward_failure:
             Logger.warning('Killing all remote SSH sessions to free up the busy port')
 
             config.ssh_kill_all_sessions_on_remote()
-            sleep(2)
 
             return True
 
         return False
 
-    def _carefully_sleep(self, sleep_time: int):
-        for i in range(0, sleep_time):
-            if self.is_terminating:
-                Logger.debug('Careful sleep: got termination signal')
-                return False
+    def _carefully_sleep(self, sleep_time: int, wake_key: str = None) -> bool:
+        """ Waits for a deadline owned by the scheduler, returns False immediately on application shutdown """
 
-            sleep(1)
+        if self.is_terminating or not self._scheduler.sleep(sleep_time, wake_key):
+            Logger.debug('Careful sleep: got termination signal')
+            return False
 
         return True
 
@@ -229,4 +700,6 @@ class TunnelManager:
         """
 
         self.is_terminating = True
-        self._proc_manager.close_all_tunnels(self._signatures)
+        self._scheduler.shutdown()
+        self._proc_manager.close_all_tunnels(self._signatures + self._multiplexer.get_master_signatures(),
+                                             timeout=self._shutdown_timeout)
@@ -0,0 +1,60 @@
+import re
+from typing import List, Pattern, Tuple, Union
+
+ERROR_REMOTE_BIND_FAILED = 'remote_bind_failed'
+ERROR_LOCAL_BIND_FAILED = 'local_bind_failed'
+ERROR_HOST_KEY_MISMATCH = 'host_key_mismatch'
+ERROR_AUTH_FAILED = 'auth_failed'
+ERROR_CONNECTION_REFUSED = 'connection_refused'
+
+ERROR_DESCRIPTIONS = {
+    ERROR_REMOTE_BIND_FAILED: 'Cannot bind the forwarded port on the SSH host, it is probably already in use',
+    ERROR_LOCAL_BIND_FAILED: 'Cannot bind the forwarded port locally, it is probably already in use',
+    ERROR_HOST_KEY_MISMATCH: 'Host key verification failed',
+    ERROR_AUTH_FAILED: 'Authentication failed',
+    ERROR_CONNECTION_REFUSED: 'Connection to the SSH server refused'
+}
+
+
+class SSHErrorClassifier:
+    """
+    Recognizes known, fatal errors in the ssh output - line by line, as the output is streamed
+    """
+
+    patterns: List[Tuple[str, Pattern]] = [
+        (ERROR_REMOTE_BIND_FAILED, re.compile(r'remote port forwarding failed for listen port', re.IGNORECASE)),
+        (ERROR_LOCAL_BIND_FAILED, re.compile(
+            r'Address already in use|cannot listen to port|Could not request local forwarding', re.IGNORECASE)),
+        (ERROR_HOST_KEY_MISMATCH, re.compile(
+            r'REMOTE HOST IDENTIFICATION HAS CHANGED|Host key verification failed', re.IGNORECASE)),
+        (ERROR_AUTH_FAILED, re.compile(
+            r'Permission denied \(|Too many authentication failures|Authentication failed', re.IGNORECASE)),
+        (ERROR_CONNECTION_REFUSED, re.compile(
+            r'connect to host .* port [0-9]+: Connection refused', re.IGNORECASE))
+    ]
+
+    @staticmethod
+    def classify(line: str) -> Union[str, None]:
+        """
+        :return: One of ERROR_* constants, None when the line is not a known error
+        """
+
+        for error, pattern in SSHErrorClassifier.patterns:
+            if pattern.search(line):
+                return error
+
+        return None
+
+    @staticmethod
+    def classify_output(output: str) -> List[str]:
+        """ All known errors found in a multi-line output """
+
+        errors = []
+
+        for line in output.split("\n"):
+            error = SSHErrorClassifier.classify(line)
+
+            if error and error not in errors:
+                errors.append(error)
+
+        return errors
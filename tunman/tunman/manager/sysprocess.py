@@ -1,8 +1,13 @@
 
+import os
 import psutil
+import signal
 import subprocess
-from typing import Union, List, Tuple
+from typing import Union, List
 from ..logger import Logger
+from .registry import ProcessRegistry
+from .proctable import ProcessTableSnapshot
+from .childwatch import ChildWatcher
 
 
 class SystemProcessManager:
@@ -11,60 +16,110 @@ class SystemProcessManager:
     """
 
     _procs: List[subprocess.Popen]
+    registry: ProcessRegistry
+    snapshot: ProcessTableSnapshot
+    child_watcher: ChildWatcher
 
-    def __init__(self):
+    def __init__(self, process_table_ttl: float = 2):
         self._procs = []
+        self.snapshot = ProcessTableSnapshot(ttl=process_table_ttl)
+        self.registry = ProcessRegistry(self.snapshot)
+        self.child_watcher = ChildWatcher()
 
     """
     System process helper methods
     """
 
-    def spawn(self, cmd: str) -> subprocess.Popen:
+    def spawn(self, cmd: str, signature: str = '') -> subprocess.Popen:
         Logger.info('Spawning %s' % cmd)
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # each tunnel in its own process group (shell + ssh), so the whole group could be signalled at once
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                start_new_session=True)
+
+        if signature:
+            self.registry.register(signature, proc.pid)
+
+        # stderr is streamed by the watcher, since the start
+        self.child_watcher.add(proc)
+
         self.wait(proc)
 
         if proc.poll() is None:
             self._procs.append(proc)
+        else:
+            self.registry.forget_pid(proc.pid)
 
         return proc
 
-    @staticmethod
-    def communicate(proc: subprocess.Popen) -> Tuple[str, str]:
-        try:
-            streams = proc.communicate(timeout=2)
-            return streams[0].decode('utf-8'), streams[1].decode('utf-8')
-        except subprocess.TimeoutExpired:
-            return '', ''
-
-    def close_all_tunnels(self, signatures: List[str]):
+    def close_all_tunnels(self, signatures: List[str], timeout: float = 10):
         """
-        Kill all processes spawned previously (finds by tunnel parameters)
+        Kill all processes spawned previously (and orphans, found by tunnel parameters)
+
+        All processes (their process groups) get SIGTERM at once, then those which did not exit before
+        the shared deadline get SIGKILL - so the shutdown takes at most "timeout" seconds, regardless of the count.
+
         :return:
         """
 
+        pids = set([proc.pid for proc in self._procs])
+
         for signature in signatures:
-            proc = self.find_process_by_signature(signature)
+            pids.update(self.registry.get_pids(signature))
+            self.registry.forget(signature)
+
+        # catch orphans of all signatures using a single, fresh process table snapshot
+        self.snapshot.refresh(force=True)
+
+        for signature in signatures:
+            pids.update(self.snapshot.find_pids(signature))
+
+        pids.discard(os.getpid())
+        procs = []
 
-            if proc:
-                Logger.info('Killing %i (%s)' % (proc.pid, proc.name()))
-                self._kill_proc(proc)
+        for pid in pids:
+            try:
+                procs.append(psutil.Process(pid))
+            except psutil.NoSuchProcess:
+                pass
 
-            for proc in psutil.process_iter():
-                cmdline = " ".join(proc.cmdline())
+        Logger.info('Terminating %i processes, waiting up to %is' % (len(procs), timeout))
+        groups = [self._get_process_group(proc) for proc in procs]
 
-                if signature in cmdline:
-                    self._kill_proc(proc)
+        for proc, group in zip(procs, groups):
+            self._send_signal(proc, group, signal.SIGTERM)
 
-        for proc in self._procs:
-            Logger.info('Killing %i' % proc.pid)
+        _, alive = psutil.wait_procs(procs, timeout=timeout)
 
-            self._kill_proc(proc)
+        for proc in alive:
+            Logger.warning('Process %i did not exit in time, killing' % proc.pid)
+
+        # also the rest of the groups, which could outlive its leader
+        for proc, group in zip(procs, groups):
+            if proc in alive or group is not None:
+                self._send_signal(proc, group, signal.SIGKILL)
+
+        self._procs = []
+
+    @staticmethod
+    def _get_process_group(proc: psutil.Process) -> Union[int, None]:
+        """ Process group led by the process, None when the process is not a group leader (or it is our group) """
+
+        try:
+            group = os.getpgid(proc.pid)
+        except (ProcessLookupError, PermissionError):
+            return None
+
+        return group if group == proc.pid and group != os.getpgid(0) else None
 
     @staticmethod
-    def _kill_proc(proc):
-        SystemProcessManager.wait(proc)
-        proc.kill()
+    def _send_signal(proc: psutil.Process, group: Union[int, None], sig: int):
+        try:
+            if group is not None:
+                os.killpg(group, sig)
+            else:
+                proc.send_signal(sig)
+        except (ProcessLookupError, PermissionError, psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
 
     @staticmethod
     def wait(proc) -> bool:
@@ -78,21 +133,33 @@ class SystemProcessManager:
         return False
 
     @staticmethod
-    def find_process_by_signature(signature: str) -> Union[psutil.Process, None]:
-        for proc in psutil.process_iter():
-            cmdline = " ".join(proc.cmdline())
+    def is_running(proc: subprocess.Popen) -> bool:
+        """ Non-blocking check, exits are also delivered as events by the ChildWatcher """
 
-            if signature in cmdline and "ssh" in cmdline:
-                return proc
-
-        return None
+        return proc.poll() is None
 
     @staticmethod
-    def kill_process_by_signature(signature: str):
-        proc = SystemProcessManager.find_process_by_signature(signature)
+    def kill_process_group(proc: subprocess.Popen):
+        """ Kills a process started by spawn() together with its group - ex. sshpass and ssh behind the shell """
+
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # not a leader of its own group
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def find_process_by_signature(self, signature: str) -> Union[psutil.Process, None]:
+        return self.registry.find(signature)
+
+    def kill_process_by_signature(self, signature: str):
+        proc = self.find_process_by_signature(signature)
 
         if proc:
             proc.kill()
+            self.registry.forget_pid(proc.pid)
 
     def clean_up_already_exited_processes(self):
         """ Free up information about processes that no longer are alive,
@@ -104,6 +171,7 @@ class SystemProcessManager:
 
             if proc.poll() is not None:
                 Logger.debug('clean_up: Freeing proc pid=%i' % proc.pid)
+                self.registry.forget_pid(proc.pid)
 
                 try:
                     self._procs.remove(proc)
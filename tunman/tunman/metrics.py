@@ -0,0 +1,179 @@
+import abc
+from threading import Lock
+from typing import Dict, List, Tuple
+
+"""
+    Metrics in Prometheus text exposition format, served at /metrics
+"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    name: str
+    description: str
+    label_names: Tuple[str, ...]
+    type: str = 'untyped'
+    _lock: Lock
+
+    def __init__(self, name: str, description: str, label_names: List[str] = None):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names or [])
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s %s' % (self.name, self.type)]
+
+        with self._lock:
+            lines += self._render_samples()
+
+        return lines
+
+    @abc.abstractmethod
+    def _render_samples(self) -> List[str]:
+        pass
+
+
+class Counter(Metric):
+    type = 'counter'
+    _values: Dict[Tuple[str, ...], float]
+
+    def __init__(self, name: str, description: str, label_names: List[str] = None):
+        super().__init__(name, description, label_names)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> List[str]:
+        return ['%s%s %s' % (self.name, _format_labels(self.label_names, key), _format_number(value))
+                for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    _buckets: Tuple[float, ...]
+    _counts: Dict[Tuple[str, ...], List[int]]
+    _sums: Dict[Tuple[str, ...], float]
+
+    def __init__(self, name: str, description: str, label_names: List[str] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self._buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self._buckets))
+            self._sums[key] = self._sums.get(key, 0) + value
+
+            for index, upper_bound in enumerate(self._buckets):
+                if value <= upper_bound:
+                    counts[index] += 1
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+
+        for key, counts in self._counts.items():
+            for upper_bound, count in zip(self._buckets, counts):
+                lines.append('%s_bucket%s %i' % (
+                    self.name,
+                    _format_labels(self.label_names, key, 'le="%s"' % _format_number(upper_bound)),
+                    count
+                ))
+
+            lines.append('%s_sum%s %s' % (self.name, _format_labels(self.label_names, key),
+                                          _format_number(self._sums[key])))
+            lines.append('%s_count%s %i' % (self.name, _format_labels(self.label_names, key), counts[-1]))
+
+        return lines
+
+
+class MetricsRegistry(object):
+    _metrics: List[Metric]
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric):
+        self._metrics.append(metric)
+
+        return metric
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics:
+            lines += metric.render()
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TUNNEL_RESTARTS = REGISTRY.register(Counter(
+    'tunman_tunnel_restarts_total', 'Number of tunnel restarts', ['forwarding', 'host']))
+
+SPAWN_TO_HEALTHY = REGISTRY.register(Histogram(
+    'tunman_spawn_to_healthy_seconds', 'Time from spawning a tunnel to its first successful check',
+    ['forwarding', 'host'], buckets=SLOW_BUCKETS))
+
+HEALTH_CHECK_DURATION = REGISTRY.register(Histogram(
+    'tunman_health_check_duration_seconds', 'Duration of a tunnel health check', ['forwarding', 'host', 'result']))
+
+# per host only: a command serves the whole host (variables, or remote port checks of many forwardings batched
+# into one command), so there is no single forwarding to attribute its latency to
+SSH_EXEC_DURATION = REGISTRY.register(Histogram(
+    'tunman_ssh_exec_duration_seconds', 'Latency of commands executed on the SSH host', ['host']))
+
+PROCESSES = REGISTRY.register(Gauge(
+    'tunman_processes', 'Number of living processes spawned by the supervisor'))
+
+TUNNELS = REGISTRY.register(Gauge(
+    'tunman_tunnels', 'Number of supervised forwardings by state', ['state']))
+
+SCHEDULER_LAG = REGISTRY.register(Histogram(
+    'tunman_scheduler_lag_seconds', 'Delay between a scheduled deadline and the moment it was fired'))
+
+VARIABLES_RESOLVE_DURATION = REGISTRY.register(Histogram(
+    'tunman_variables_resolve_seconds', 'Time of resolving template variables of a host at startup',
+    ['host', 'result'], buckets=SLOW_BUCKETS))
@@ -1,15 +1,36 @@
 
+import os
 import subprocess
-from socket import gethostbyname
-from typing import List, NamedTuple, Callable, Union
-from jinja2 import Environment, BaseLoader
+from hashlib import sha1
+from tempfile import gettempdir
+from time import monotonic
+from typing import List, NamedTuple, Callable, Union, Dict, FrozenSet, Tuple
+from jinja2 import Environment, BaseLoader, Template
 from datetime import date
 from threading import RLock
 from .interfaces import ConfigurationInterface, PortDefinition
+from .logger import Logger
 from .ssh import SSHClient
+from .healthstats import HealthCheckHistory
 from .network.ipparser import ParsedNetworkingInformation
+from .network.resolver import RESOLVER
 
 
+TEMPLATE_ENVIRONMENT = Environment(loader=BaseLoader, autoescape=False)
+TEMPLATE_DELIMITERS = ('{{', '{%', '{#')
+
+# template variable => id of the value in the HostTunnelDefinitions cache
+VARIABLE_CACHE_IDS = {
+    'local_gw': 'get_local_gateway',
+    'remote_gw': 'get_remote_gateway',
+    'remote_interface_gw': 'get_remote_interface_gateway',
+    'remote_docker_host': 'get_remote_docker_host_ip',
+    'remote_docker_container': 'get_remote_interface_gateway',
+    'remote_interface_eth0': 'get_remote_interface_ip_(eth0)',
+    'remote_interface_eth1': 'get_remote_interface_ip_(eth1)',
+    'remote_interface_eth2': 'get_remote_interface_ip_(eth2)'
+}
+
 ValidationDefinition = NamedTuple('ValidationDefinition', [
     ('method', any), ('interval', int), ('wait_time_before_restart', int), ('kill_existing_tunnel_on_failure', bool),
     ('notify_url', str)
@@ -46,6 +67,7 @@ class Forwarding(object):
 
     # dynamic state
     starts_history: list
+    health_history: HealthCheckHistory
     _cache: dict
 
     def __init__(self, local: LocalPortDefinition,
@@ -74,6 +96,7 @@ class Forwarding(object):
         # dynamic
         self._cache = {}
         self.starts_history = []
+        self.health_history = HealthCheckHistory()
 
     def is_forwarding_remote_to_local(self):
         """
@@ -101,7 +124,7 @@ class Forwarding(object):
         :return:
         """
 
-        if 'create_ssh_forwarding' in self._cache:
+        if 'create_ssh_forwarding' in self._cache and monotonic() < self._cache['create_ssh_forwarding_expires_at']:
             return self._cache['create_ssh_forwarding']
 
         c_str = ' -o ServerAliveInterval=15 -o ServerAliveCountMax=4 -o ExitOnForwardFailure=yes '
@@ -109,6 +132,51 @@ class Forwarding(object):
         if self.remote.gateway or self.local.gateway:
             c_str += ' -g '
 
+        c_str += self._create_forwarding_spec()
+
+        result = self.configuration.parse(c_str)
+        self._cache['create_ssh_forwarding'] = result
+        self._cache['create_ssh_forwarding_expires_at'] = monotonic() + self.configuration.variables_ttl
+
+        return result
+
+    def invalidate_ssh_forwarding_signature(self) -> List[str]:
+        """
+        Forces the variables the signature depends on to be resolved again, and the signature to be re-created
+
+        :return: Ids of the invalidated values of the host cache
+        """
+
+        invalidated = self.configuration.invalidate_variables(self.get_template_strings())
+        self.forget_ssh_forwarding_signature()
+
+        return invalidated
+
+    def forget_ssh_forwarding_signature(self):
+        """ The signature is created again on next use, with the current values of the variables """
+
+        self._cache.pop('create_ssh_forwarding', None)
+
+    def get_template_strings(self) -> List[str]:
+        """ Hosts and ports, as they were configured - before parsing """
+
+        return [str(port.host) for port in (self.local, self.remote)] + \
+               [str(port.port) for port in (self.local, self.remote)]
+
+    def create_ssh_forwarding_spec(self) -> str:
+        """
+        Creates only the -L/-R forwarding switch, without connection options.
+        Used to add/remove forwarding on a multiplexed connection (ssh -O forward), where the -g switch
+        cannot be passed, so the gateway binding for a local forwarding is explicit
+
+        :return:
+        """
+
+        return self.configuration.parse(self._create_forwarding_spec(bind_gateway_explicitly=True))
+
+    def _create_forwarding_spec(self, bind_gateway_explicitly: bool = False) -> str:
+        c_str = ''
+
         if self.is_forwarding_local_to_remote():
             c_str += '-R '
 
@@ -126,6 +194,8 @@ class Forwarding(object):
 
             if not self.local.gateway:
                 c_str += '%s:' % self.local.get_host()
+            elif bind_gateway_explicitly:
+                c_str += '*:'
 
             c_str += '%i:%s:%i' % (
                 self.local.get_port(),
@@ -133,10 +203,7 @@ class Forwarding(object):
                 self.remote.get_port()
             )
 
-        result = self.configuration.parse(c_str)
-        self._cache['create_ssh_forwarding'] = result
-
-        return result
+        return c_str
 
     def create_ssh_arguments(self, with_forwarding: bool = True) -> str:
         """
@@ -158,6 +225,27 @@ class Forwarding(object):
             append=append
         )
 
+    def update_supervision(self, other: 'Forwarding'):
+        """
+        Takes over the options that do not change the SSH command (health check, retries, timeouts),
+        the supervisor uses them from its next iteration
+        """
+
+        self.validate = other.validate
+        self.retries = other.retries
+        self.health_check_connect_timeout = other.health_check_connect_timeout
+        self.warm_up_time = other.warm_up_time
+        self.time_before_restart_at_initialization = other.time_before_restart_at_initialization
+        self.wait_time_after_all_retries_failed = other.wait_time_after_all_retries_failed
+
+    def bind_to(self, configuration: ConfigurationInterface):
+        """ Makes the forwarding (and its ports) belong to other instance of the same host """
+
+        self.configuration = configuration
+        self.local.configuration = configuration
+        self.remote.configuration = configuration
+        self._cache = {}
+
     def on_tunnel_started(self):
         self.starts_history.append(date.today())
 
@@ -193,17 +281,38 @@ class HostTunnelDefinitions(ConfigurationInterface):
     forward: List[Forwarding]
     variables_post_processor: Callable
     restart_all_on_forward_failure: bool
+    multiplexing: bool
+    variables_ttl: float
     _ip_route: Union[ParsedNetworkingInformation, None]
     _ssh: Union[SSHClient, None]
     _cache: dict
+    _resolved_at: Dict[str, float]
+    _resolvers: Dict[str, Callable]
+    _templates: Dict[str, Template]
+    _contexts: Dict[FrozenSet[str], Tuple[float, dict]]
     _lock: RLock
 
     def __init__(self):
+        self.multiplexing = False
+        self.variables_ttl = 3600
         self._cache = {}
+        self._resolved_at = {}
+        self._resolvers = {}
+        self._templates = {}
+        self._contexts = {}
         self._ssh = None
         self._lock = RLock(timeout=120)
         self._ip_route = None
 
+    def update_settings(self, other: 'HostTunnelDefinitions'):
+        """ Takes over the options that do not change the SSH connection, the resolved values are kept """
+
+        with self._lock:
+            self.variables_post_processor = other.variables_post_processor
+            self.restart_all_on_forward_failure = other.restart_all_on_forward_failure
+            self.variables_ttl = other.variables_ttl
+            self._contexts = {}
+
     def post_process_variables(self, variables: dict) -> dict:
         if self.variables_post_processor:
             return self.variables_post_processor(variables, self)
@@ -214,16 +323,48 @@ class HostTunnelDefinitions(ConfigurationInterface):
         """
         Parses connection string ex. {{ remote_gw }}:3306 into 192.168.1.2:3306
 
+        Compiled templates are cached per connection string, the variables are resolved once per set of variables
+        used in the string, and again after "variables_ttl" seconds. Strings without any template syntax
+        are returned as they are.
+
         :param conn_string:
         :return:
         """
 
-        to_inject = {
-            'local_gw': self.get_local_gateway()
-        }
+        if not any(delimiter in conn_string for delimiter in TEMPLATE_DELIMITERS):
+            return conn_string
 
-        to_inject = self.post_process_variables(to_inject)
+        tpl = self._templates.get(conn_string)
+
+        if tpl is None:
+            tpl = TEMPLATE_ENVIRONMENT.from_string(conn_string)
+            self._templates[conn_string] = tpl
+
+        return tpl.render(**self._get_template_context(conn_string))
+
+    def prefetch_variables(self) -> List[str]:
+        """
+        Resolves everything the templates of the forwardings use, so the tunnels do not have to wait for it
+
+        Threads: Blocking - could connect via SSH, resolve DNS, call "ip route"
+        :return: Names of the resolved variables
+        """
+
+        resolved = set()
+
+        for forwarding in self.forward:
+            for conn_string in forwarding.get_template_strings():
+                if not any(delimiter in conn_string for delimiter in TEMPLATE_DELIMITERS):
+                    continue
+
+                resolved.update(key for key, value in self._get_template_context(conn_string).items()
+                                if value != '')
 
+            forwarding.create_ssh_forwarding_signature()
+
+        return sorted(resolved)
+
+    def _get_template_context(self, conn_string: str) -> dict:
         # make it lazy
         lazy_vars = {
             'remote_gw': self.get_remote_gateway,
@@ -235,15 +376,69 @@ class HostTunnelDefinitions(ConfigurationInterface):
             'remote_interface_eth2': lambda: self.get_remote_interface_ip('eth2')
         }
 
+        used_vars = frozenset(key for key in lazy_vars.keys() if key in conn_string)
+        memoized = self._contexts.get(used_vars)
+
+        if memoized and monotonic() < memoized[0]:
+            return memoized[1]
+
+        to_inject = {
+            'local_gw': self.get_local_gateway()
+        }
+
+        to_inject = self.post_process_variables(to_inject)
+
         for key, callback in lazy_vars.items():
-            if key in conn_string and (key not in to_inject or to_inject[key] == ''):
+            if key in used_vars and (key not in to_inject or to_inject[key] == ''):
                 to_inject[key] = callback()
             else:
                 to_inject[key] = ''
 
-        tpl = Environment(loader=BaseLoader, autoescape=False).from_string(conn_string)
+        self._contexts[used_vars] = (self._get_context_expiration(used_vars), to_inject)
+
+        return to_inject
+
+    def _get_context_expiration(self, used_vars: FrozenSet[str]) -> float:
+        """ The context is valid as long as all of the values it was created from """
+
+        with self._lock:
+            resolved_at = [self._resolved_at[VARIABLE_CACHE_IDS[name]] for name in used_vars | {'local_gw'}
+                           if VARIABLE_CACHE_IDS[name] in self._resolved_at]
+
+        return min(resolved_at) + self.variables_ttl if resolved_at else float('inf')
+
+    def get_variable_cache_ids(self, conn_strings: List[str]) -> List[str]:
+        """ Ids of the cached values, that the connection strings depend on """
+
+        return sorted(set(cache_id for name, cache_id in VARIABLE_CACHE_IDS.items()
+                          if any(name in conn_string for conn_string in conn_strings)))
 
-        return tpl.render(**to_inject)
+    def get_forwardings_depending_on(self, cache_ids: List[str]) -> List[Forwarding]:
+        return [forwarding for forwarding in self.forward
+                if set(self.get_variable_cache_ids(forwarding.get_template_strings())) & set(cache_ids)]
+
+    def invalidate_variables(self, conn_strings: List[str]) -> List[str]:
+        """
+        Marks the values the connection strings depend on as expired, they will be resolved again on next use
+        (if resolving fails, the previous value is kept)
+
+        :return: Ids of the invalidated values
+        """
+
+        cache_ids = self.get_variable_cache_ids(conn_strings)
+
+        with self._lock:
+            for cache_id in cache_ids:
+                if cache_id in self._resolved_at:
+                    self._resolved_at[cache_id] = float('-inf')
+
+            self._contexts = {}
+            self._forget_ip_route()
+
+        if VARIABLE_CACHE_IDS['remote_gw'] in cache_ids:
+            RESOLVER.expire(self.remote_host)
+
+        return cache_ids
 
     def get_remote_interface_ip(self, name: str):
         return self._cached(
@@ -258,9 +453,11 @@ class HostTunnelDefinitions(ConfigurationInterface):
         )
 
     def get_remote_gateway(self):
+        # the DNS lookup does not block other users of the host while it lasts
         return self._cached(
             'get_remote_gateway',
-            lambda: gethostbyname(self.remote_host).strip()
+            lambda: RESOLVER.resolve(self.remote_host),
+            exclusive=False
         )
 
     def get_remote_docker_host_ip(self):
@@ -282,34 +479,133 @@ class HostTunnelDefinitions(ConfigurationInterface):
 
         return self._ip_route
 
-    def _cached(self, cache_id: str, callback: Callable) -> any:
+    def _cached(self, cache_id: str, callback: Callable, exclusive: bool = True) -> any:
+        """
+        :param exclusive: Resolve while holding the lock of the host (one resolution at a time)
+        """
+
         with self._lock:
+            self._resolvers[cache_id] = callback
+
+            if cache_id in self._cache and monotonic() - self._resolved_at[cache_id] < self.variables_ttl:
+                return self._cache[cache_id]
+
+            if exclusive:
+                return self._resolve(cache_id, callback)
+
+        return self._resolve(cache_id, callback)
+
+    def _resolve(self, cache_id: str, callback: Callable) -> any:
+        try:
+            value = callback()
+        except Exception as e:
             if cache_id not in self._cache:
-                self._cache[cache_id] = callback()
+                raise
+
+            Logger.warning('Cannot resolve "%s" again for %s, keeping the previous value: %s' % (
+                cache_id, self, str(e)))
+            value = self._cache[cache_id]
+
+        self._store(cache_id, value)
+
+        return value
+
+    def _store(self, cache_id: str, value: any):
+        with self._lock:
+            if cache_id in self._cache and self._cache[cache_id] != value:
+                self._contexts = {}
+
+            self._cache[cache_id] = value
+            self._resolved_at[cache_id] = monotonic()
+
+    def _forget_ip_route(self):
+        """ The routing tables are read again on next use """
+
+        self._ip_route = None
+
+        if self._ssh:
+            self._ssh.forget_ip_route()
+
+    def get_resolved_variables(self) -> dict:
+        """ Copy of the values resolved so far, to be persisted (see: VariablesCache) """
+
+        with self._lock:
+            return dict(self._cache)
+
+    def restore_variables(self, values: dict):
+        """ Fills the cache with values resolved before, ex. by the previous run of the application """
+
+        with self._lock:
+            for cache_id, value in values.items():
+                self._store(cache_id, value)
+
+            self._contexts = {}
+
+    def revalidate_variables(self) -> List[str]:
+        """
+        Resolves again all cached values that were used since start, replaces the ones that changed.
+        Signatures of the forwardings, that depend on a changed value, are created again on next use
+
+        A value that cannot be resolved is kept as it is, the rest is revalidated anyway.
+
+        Threads: Blocking - resolving is done without holding the lock, so the tunnels are not stalled
+        :return: Cache ids of the values that changed
+        """
+
+        with self._lock:
+            resolvers = dict(self._resolvers)
+
+            # the routing tables could have changed as well
+            self._forget_ip_route()
+
+        changed = []
+
+        for cache_id, callback in resolvers.items():
+            try:
+                value = callback()
+            except Exception as e:
+                Logger.warning('Cannot revalidate "%s" for %s, keeping the previous value: %s' % (
+                    cache_id, self, str(e)))
+                continue
 
-            return self._cache[cache_id]
+            with self._lock:
+                if self._cache.get(cache_id) != value:
+                    changed.append(cache_id)
+
+                self._store(cache_id, value)
+
+        for forwarding in self.get_forwardings_depending_on(changed):
+            forwarding.forget_ssh_forwarding_signature()
+
+        return changed
 
     def ssh_kill_all_sessions_on_remote(self):
         with self._lock:
             self._get_ssh_client().kill_all_sessions()
 
-    def exec_ssh(self, cmd: str, env: dict = None) -> str:
+    def exec_ssh(self, cmd: str, env: dict = None, retries: int = None, timeout: float = None,
+                 on_line: Callable[[str], None] = None) -> str:
         """
         Execute a command via SSH
+        The client is thread-safe, commands run concurrently on channels of pooled sessions
+
         :param cmd:
         :param env:
+        :param retries: Retries on SSH errors, defaults to the client setting
+        :param timeout: Time the command could stay silent, defaults to the client setting
+        :param on_line: Receives lines of the output as they are printed
         :return:
         """
 
-        ssh = self._get_ssh_client()
-
-        with self._lock:
-            return ssh.exec(cmd, env=env)
+        return self._get_ssh_client().exec(cmd, env=env, retries=retries, timeout=timeout, on_line=on_line)
 
     def _get_ssh_client(self) -> SSHClient:
         """
-        RAW ssh client, DO NOT USE - have not implemented locking
-        Only for internal model usage
+        SSH client shared by all forwardings of this host, created lazily under the definition lock
+        The client keeps a pool of persistent sessions and guards it with its own lock, so it is safe to call from
+        any thread without holding the definition lock. Only for internal model usage
+
+        Threads: Any
 
         :return:
         """
@@ -367,3 +663,38 @@ class HostTunnelDefinitions(ConfigurationInterface):
             cmd += 'ssh -N -T ' + args
 
         return cmd
+
+    def get_control_socket_path(self) -> str:
+        """ Path to the ControlMaster socket of the multiplexed connection (short, as UNIX sockets paths are limited) """
+
+        return os.path.join(gettempdir(), 'tunman-mux-%s.sock' % sha1(self.ident.encode('utf-8')).hexdigest()[0:16])
+
+    def create_control_master_command(self) -> str:
+        """ A single master connection, that carries all forwardings of the host (see: ssh -O forward) """
+
+        cmd = ''
+
+        if self.remote_password:
+            cmd += 'sshpass -p "%s" ' % self.remote_password
+
+        cmd += 'ssh -N -T' + self.create_ssh_connection_string(
+            append='-M -S %s -o ControlPersist=no -o ServerAliveInterval=15 -o ServerAliveCountMax=4 '
+                   '-o ExitOnForwardFailure=no' % self.get_control_socket_path()
+        )
+
+        return cmd
+
+    def create_control_command(self, operation: str, forwarding_spec: str = '') -> str:
+        """
+        Sends a control message to the master connection
+
+        :param operation: check, forward, cancel, exit
+        :param forwarding_spec: -L/-R switch, see Forwarding.create_ssh_forwarding_spec()
+        :return:
+        """
+
+        return 'ssh' + self.create_ssh_connection_string(
+            with_key=False,
+            with_custom_opts=False,
+            append='-S %s -O %s %s' % (self.get_control_socket_path(), operation, forwarding_spec)
+        )
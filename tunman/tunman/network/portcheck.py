@@ -0,0 +1,198 @@
+import errno
+import selectors
+import socket
+from concurrent.futures import Future, TimeoutError
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import monotonic
+from typing import Dict, List, Union
+from ..logger import Logger
+from .resolver import DNSResolver, RESOLVER
+
+
+class PortProbe(object):
+    """ Single TCP connect attempt """
+
+    host: str
+    port: int
+    address: Union[tuple, None]
+    deadline: float
+    future: Future
+    sock: Union[socket.socket, None]
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.address = None
+        self.deadline = monotonic() + timeout
+        self.future = Future()
+        self.sock = None
+
+    def finish(self, result: bool):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+        if not self.future.done():
+            self.future.set_result(result)
+
+
+class PortCheckEngine(object):
+    """
+    Non-blocking TCP port checker
+
+    All submitted probes are connecting at the same time, driven by a single selector thread. A probe ends as soon
+    as its connection is established or refused, or when its own timeout passes - so checking many ports at once
+    takes about as long as the slowest single probe.
+
+    Hostnames are resolved by the shared DNSResolver before the probe is queued, never in the selector thread.
+    """
+
+    # the probe ends by its own deadline, a caller waits a bit longer in case the lookup of the host is slow
+    RESULT_TIMEOUT_MARGIN = 10
+
+    _queue: Queue
+    _probes: Dict[int, PortProbe]
+    _selector: Union[selectors.BaseSelector, None]
+    _thread: Union[Thread, None]
+    _wakeup: tuple
+    _lock: Lock
+    _resolver: DNSResolver
+
+    def __init__(self, resolver: DNSResolver = None):
+        self._resolver = resolver if resolver else RESOLVER
+        self._queue = Queue()
+        self._probes = {}
+        self._selector = None
+        self._thread = None
+        self._wakeup = ()
+        self._lock = Lock()
+
+    def submit(self, host: str, port: int, timeout: float) -> Future:
+        probe = PortProbe(host, port, timeout)
+
+        self._start()
+        self._resolver.resolve_async(host).add_done_callback(lambda resolved: self._enqueue(probe, resolved))
+
+        return probe.future
+
+    def _enqueue(self, probe: PortProbe, resolved: Future):
+        try:
+            probe.address = (resolved.result(), probe.port)
+        except Exception as e:
+            # ex. UnicodeError for a too long hostname
+            Logger.debug('Port check of %s:%i failed: %s' % (probe.host, probe.port, str(e)))
+            probe.finish(False)
+            return
+
+        self._queue.put(probe)
+        self._wakeup[1].send(b'\0')
+
+    def check(self, host: str, port: int, timeout: float) -> bool:
+        return self._wait(self.submit(host, port, timeout), host, port, timeout)
+
+    def check_many(self, targets: List[tuple]) -> List[bool]:
+        """
+        :param targets: List of (host, port, timeout)
+        :return: Results in order of targets
+        """
+
+        futures = [self.submit(host, port, timeout) for host, port, timeout in targets]
+
+        return [self._wait(future, *target) for future, target in zip(futures, targets)]
+
+    def _wait(self, future: Future, host: str, port: int, timeout: float) -> bool:
+        try:
+            return future.result(timeout=timeout + self.RESULT_TIMEOUT_MARGIN)
+        except TimeoutError:
+            Logger.error('Port check of %s:%i did not finish in time' % (host, port))
+            return False
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._selector = selectors.DefaultSelector()
+            self._wakeup = socket.socketpair()
+            self._wakeup[0].setblocking(False)
+            self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+            self._thread = Thread(target=self._run, name='tunman-port-checks', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            # an unexpected error must not leave the health checks of all tunnels waiting forever
+            try:
+                self._run_once()
+            except Exception as e:
+                Logger.error('Port checks: unexpected error, failing %i pending checks: %s' % (
+                    len(self._probes), str(e)))
+                self._fail_pending_probes()
+
+    def _run_once(self):
+        self._accept_new_probes()
+
+        now = monotonic()
+        timeout = min([probe.deadline for probe in self._probes.values()], default=now + 60) - now
+
+        for key, _ in self._selector.select(timeout=max(timeout, 0)):
+            if key.fileobj is self._wakeup[0]:
+                self._drain_wakeup()
+                continue
+
+            probe = self._probes.pop(key.fd)
+            self._selector.unregister(key.fileobj)
+            probe.finish(probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0)
+
+        now = monotonic()
+
+        for fd, probe in list(self._probes.items()):
+            if probe.deadline <= now:
+                Logger.debug('Port check of %s:%i timed out' % (probe.host, probe.port))
+                self._selector.unregister(probe.sock)
+                del self._probes[fd]
+                probe.finish(False)
+
+    def _fail_pending_probes(self):
+        for probe in self._probes.values():
+            try:
+                self._selector.unregister(probe.sock)
+            except (KeyError, ValueError):
+                pass
+
+            probe.finish(False)
+
+        self._probes = {}
+
+    def _accept_new_probes(self):
+        while True:
+            try:
+                probe = self._queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                probe.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                probe.sock.setblocking(False)
+                result = probe.sock.connect_ex(probe.address)
+            except OSError as e:
+                Logger.debug('Port check of %s:%i failed: %s' % (probe.host, probe.port, str(e)))
+                probe.finish(False)
+                continue
+
+            if result == 0:
+                probe.finish(True)
+            elif result in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self._selector.register(probe.sock, selectors.EVENT_WRITE)
+                self._probes[probe.sock.fileno()] = probe
+            else:
+                probe.finish(False)
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup[0].recv(1024):
+                pass
+        except BlockingIOError:
+            pass
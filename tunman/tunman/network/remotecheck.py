@@ -0,0 +1,119 @@
+import re
+from concurrent.futures import Future
+from shlex import quote
+from threading import RLock, Timer
+from typing import Dict, List, Tuple
+from ..interfaces import ConfigurationInterface
+from ..logger import Logger
+
+
+class RemotePortProbe(object):
+    host: str
+    port: int
+    timeout: int
+    future: Future
+
+    def __init__(self, host: str, port: int, timeout: int):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.future = Future()
+
+    @property
+    def target(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+
+class RemotePortCheckBatcher(object):
+    """
+    Checks ports reachable from the SSH host - coalesces all checks of a host submitted within a short window
+    into a single SSH exec, that probes every port concurrently on the remote side and reports per-port results
+    """
+
+    EXEC_TIMEOUT_MARGIN = 5
+
+    _window: float
+    _pending: Dict[str, List[RemotePortProbe]]
+    _lock: RLock
+
+    def __init__(self, window: float = 0.5):
+        self._window = window
+        self._pending = {}
+        self._lock = RLock()
+
+    def submit(self, configuration: ConfigurationInterface, host: str, port: int, timeout: int) -> Future:
+        probe = RemotePortProbe(host, port, timeout)
+
+        with self._lock:
+            probes = self._pending.setdefault(configuration.ident, [])
+            probes.append(probe)
+
+            # first check in the window schedules the batch
+            if len(probes) == 1:
+                timer = Timer(self._window, self._flush, args=[configuration])
+                timer.daemon = True
+                timer.start()
+
+        return probe.future
+
+    def check(self, configuration: ConfigurationInterface, host: str, port: int, timeout: int) -> bool:
+        return self.submit(configuration, host, port, timeout).result()
+
+    def _flush(self, configuration: ConfigurationInterface):
+        with self._lock:
+            probes = self._pending.pop(configuration.ident, [])
+
+        if not probes:
+            return
+
+        waiting = {}
+
+        for probe in probes:
+            waiting.setdefault(probe.target, []).append(probe)
+
+        def on_line(line: str):
+            for target, result in self.parse_output(line).items():
+                for probe in waiting.pop(target, []):
+                    probe.future.set_result(result)
+
+        # the slowest "nc" decides, a retry would only double the wait of the probes already failed
+        try:
+            configuration.exec_ssh(self.create_command(probes), retries=0, on_line=on_line,
+                                   timeout=max(probe.timeout for probe in probes) + self.EXEC_TIMEOUT_MARGIN)
+        except Exception as e:
+            Logger.error('Remote port checks on %s failed: %s. %i of %i ports were not reported' % (
+                configuration, str(e), len(waiting), len(set(probe.target for probe in probes))))
+
+        Logger.debug('Checked %i remote ports on %s with a single command' % (len(probes), configuration))
+
+        for target_probes in waiting.values():
+            for probe in target_probes:
+                probe.future.set_result(False)
+
+    @staticmethod
+    def create_command(probes: List[RemotePortProbe]) -> str:
+        timeouts = {}
+
+        for probe in probes:
+            timeouts[probe.target] = max(probe.timeout, timeouts.get(probe.target, 0))
+
+        cmd = ''
+
+        for (host, port), timeout in timeouts.items():
+            cmd += '(nc -zw%i %s %i >/dev/null 2>&1; echo "%s %i $?") & ' % (
+                timeout, quote(host), port, quote(host), port
+            )
+
+        return cmd + 'wait'
+
+    @staticmethod
+    def parse_output(output: str) -> Dict[Tuple[str, int], bool]:
+        results = {}
+
+        for line in output.split("\n"):
+            match = re.match(r'^(\S+) ([0-9]+) ([0-9]+)$', line.strip())
+
+            if match:
+                results[(match.group(1), int(match.group(2)))] = match.group(3) == '0'
+
+        return results
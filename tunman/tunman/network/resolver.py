@@ -0,0 +1,168 @@
+import socket
+from concurrent.futures import Future, ThreadPoolExecutor
+from ipaddress import ip_address
+from threading import Lock
+from time import monotonic
+from typing import Dict, Union
+from ..logger import Logger
+
+
+class ResolvedHost(object):
+    address: Union[str, None]
+    error: Union[Exception, None]
+    resolved_at: float
+    expires_at: float
+
+    def __init__(self, address: Union[str, None], error: Union[Exception, None], resolved_at: float,
+                 expires_at: float):
+        self.address = address
+        self.error = error
+        self.resolved_at = resolved_at
+        self.expires_at = expires_at
+
+
+class DNSResolver(object):
+    """
+    Shared cache of hostname lookups, resolving in a small pool of worker threads
+
+    - Successful lookups are kept for "positive_ttl" seconds, failed lookups for "negative_ttl" seconds
+    - Concurrent lookups of the same host are merged into one
+    - An expired address is still served up to "stale_ttl" seconds longer, while it is looked up again
+      in the background - so a slow or flaky DNS server does not stall the callers. When that lookup fails,
+      the last known address is kept
+    """
+
+    _positive_ttl: float
+    _negative_ttl: float
+    _stale_ttl: float
+    _workers: int
+    _entries: Dict[str, ResolvedHost]
+    _pending: Dict[str, Future]
+    _executor: Union[ThreadPoolExecutor, None]
+    _lock: Lock
+
+    def __init__(self, positive_ttl: float = 300, negative_ttl: float = 30, stale_ttl: float = 3600,
+                 workers: int = 8):
+        self._positive_ttl = positive_ttl
+        self._negative_ttl = negative_ttl
+        self._stale_ttl = stale_ttl
+        self._workers = workers
+        self._entries = {}
+        self._pending = {}
+        self._executor = None
+        self._lock = Lock()
+
+    def configure(self, positive_ttl: float, negative_ttl: float, stale_ttl: float):
+        self._positive_ttl = positive_ttl
+        self._negative_ttl = negative_ttl
+        self._stale_ttl = stale_ttl
+
+    def resolve(self, host: str, timeout: float = None) -> str:
+        """
+        Threads: Blocking, until the address is known (immediately when it is cached)
+
+        :raises OSError: When the host cannot be resolved
+        """
+
+        return self.resolve_async(host).result(timeout)
+
+    def resolve_async(self, host: str) -> Future:
+        """
+        :return: Future resolved with the IPv4 address of the host
+        """
+
+        if self._is_ip_address(host):
+            return self._create_done_future(host)
+
+        now = monotonic()
+
+        with self._lock:
+            entry = self._entries.get(host)
+
+            if entry and now < entry.expires_at:
+                return self._create_done_future(entry.address, entry.error if not entry.address else None)
+
+            if entry and entry.address and now < entry.resolved_at + self._positive_ttl + self._stale_ttl:
+                self._lookup_in_background(host)
+
+                return self._create_done_future(entry.address)
+
+            return self._lookup_in_background(host)
+
+    def expire(self, host: str):
+        """ Next use of the host triggers a lookup (the known address is served meanwhile) """
+
+        with self._lock:
+            entry = self._entries.get(host)
+
+            if entry:
+                entry.expires_at = 0
+
+    def _lookup_in_background(self, host: str) -> Future:
+        pending = self._pending.get(host)
+
+        if pending is None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='tunman-dns')
+
+            pending = self._pending[host] = self._executor.submit(self._lookup, host)
+
+        return pending
+
+    def _lookup(self, host: str) -> str:
+        started_at = monotonic()
+
+        try:
+            address = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+        except (OSError, IndexError) as e:
+            return self._on_lookup_failed(host, e if isinstance(e, OSError) else socket.gaierror(str(e)))
+
+        Logger.debug('DNS: %s resolved to %s in %.3fs' % (host, address, monotonic() - started_at))
+
+        with self._lock:
+            now = monotonic()
+            self._entries[host] = ResolvedHost(address, None, now, now + self._positive_ttl)
+            self._pending.pop(host, None)
+
+        return address
+
+    def _on_lookup_failed(self, host: str, error: OSError) -> str:
+        with self._lock:
+            now = monotonic()
+            self._pending.pop(host, None)
+            previous = self._entries.get(host)
+
+            if previous and previous.address and now < previous.resolved_at + self._positive_ttl + self._stale_ttl:
+                Logger.warning('DNS: cannot resolve %s again, keeping %s: %s' % (host, previous.address, str(error)))
+                self._entries[host] = ResolvedHost(previous.address, error, previous.resolved_at,
+                                                   now + self._negative_ttl)
+
+                return previous.address
+
+            Logger.debug('DNS: cannot resolve %s: %s' % (host, str(error)))
+            self._entries[host] = ResolvedHost(None, error, now, now + self._negative_ttl)
+
+        raise error
+
+    @staticmethod
+    def _is_ip_address(host: str) -> bool:
+        try:
+            ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _create_done_future(result: Union[str, None], error: Exception = None) -> Future:
+        future = Future()
+
+        if error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+        return future
+
+
+# shared by the template variables and the health checks
+RESOLVER = DNSResolver()
@@ -1,27 +1,108 @@
-
-from requests import post as http_post
+from requests import Session
 from json import dumps as json_dumps
+from queue import Queue, Full, Empty
+from threading import Thread, Lock
+from time import monotonic
+from typing import Dict, List, Union
 from .model import Forwarding
 from .logger import Logger
 
 
-class Notify:
+class NotificationDispatcher:
+    """
+    Delivers webhook notifications in background, so a slow webhook never stalls the supervisor
+
+    Messages are kept in a bounded queue. Bursts (ex. many tunnels flapping at once) are coalesced
+    per url into a single message. HTTP connections are reused between deliveries.
+    """
+
+    _queue: Queue
+    _session: Session
+    _thread: Union[Thread, None]
+    _lock: Lock
+    _timeout: float
+    _coalesce_window: float
+
+    def __init__(self, max_queue_size: int = 1000, timeout: float = 10, coalesce_window: float = 2):
+        self._queue = Queue(maxsize=max_queue_size)
+        self._session = Session()
+        self._thread = None
+        self._lock = Lock()
+        self._timeout = timeout
+        self._coalesce_window = coalesce_window
+
+    def enqueue(self, url: str, msg: str):
+        self._start()
+
+        try:
+            self._queue.put_nowait((url, msg))
+        except Full:
+            Logger.warning('Webhook queue is full, dropping notification to "%s"' % url)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='tunman-notify', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+
+            for url, messages in batch.items():
+                self._deliver(url, self.coalesce(messages))
+
+    def _collect_batch(self) -> Dict[str, List[str]]:
+        """ Waits for the first message, then collects everything that arrives within the coalescing window """
+
+        url, msg = self._queue.get()
+        batch = {url: [msg]}
+        deadline = monotonic() + self._coalesce_window
+
+        while True:
+            remaining = deadline - monotonic()
+
+            if remaining <= 0:
+                return batch
+
+            try:
+                url, msg = self._queue.get(timeout=remaining)
+            except Empty:
+                return batch
+
+            batch.setdefault(url, []).append(msg)
+
     @staticmethod
-    def notify(fw: Forwarding, msg: str):
-        if not fw.validate.notify_url:
-            return
+    def coalesce(messages: List[str]) -> str:
+        if len(messages) == 1:
+            return messages[0]
+
+        return ':warning: %i tunnel events:\n' % len(messages) + "\n".join(['- ' + msg for msg in messages])
 
+    def _deliver(self, url: str, msg: str):
         try:
-            response = http_post(
-                url=fw.validate.notify_url,
+            response = self._session.post(
+                url=url,
                 data=json_dumps({
                     'text': msg
-                })
+                }),
+                timeout=self._timeout
             )
 
             assert response.status_code == 200
         except Exception as e:
-            Logger.warning('Webhook error, cannot post to "%s". Details: %s' % (fw.validate.notify_url, str(e)))
+            Logger.warning('Webhook error, cannot post to "%s". Details: %s' % (url, str(e)))
+
+
+class Notify:
+    dispatcher: NotificationDispatcher = NotificationDispatcher()
+
+    @staticmethod
+    def notify(fw: Forwarding, msg: str):
+        if not fw.validate.notify_url:
+            return
+
+        Notify.dispatcher.enqueue(fw.validate.notify_url, msg)
 
     @staticmethod
     def notify_tunnel_restarted(fw: Forwarding):
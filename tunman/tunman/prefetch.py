@@ -0,0 +1,181 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Thread
+from time import monotonic
+from typing import Callable, Dict, List, Tuple, Union
+from .interfaces import ConfigurationInterface
+from .metrics import VARIABLES_RESOLVE_DURATION
+from .varcache import VariablesCache
+from .logger import Logger
+
+
+class PrefetchResult(object):
+    ident: str
+    is_ok: bool
+    variables: List[str]
+    elapsed: float
+    error: str
+    is_restored: bool
+
+    def __init__(self, ident: str, is_ok: bool, elapsed: float, variables: List[str] = None, error: str = '',
+                 is_restored: bool = False):
+        self.ident = ident
+        self.is_ok = is_ok
+        self.elapsed = elapsed
+        self.variables = variables or []
+        self.error = error
+        self.is_restored = is_restored
+
+    def to_dict(self) -> dict:
+        return {
+            'ident': self.ident,
+            'is_ok': self.is_ok,
+            'elapsed': round(self.elapsed, 3),
+            'variables': self.variables,
+            'error': self.error,
+            'is_restored': self.is_restored
+        }
+
+
+class VariablesPrefetcher(object):
+    """
+    Startup phase - resolves template variables ({{ remote_gw }}, {{ remote_interface_eth0 }}...) of all hosts
+    concurrently, so the startup takes as long as the slowest host, not as the sum of all hosts
+
+    At most "workers" hosts are resolved at once. A host that does not finish within the timeout is not waited for -
+    its tunnels resolve the variables on their own when spawned, as they would without the prefetch.
+
+    With a VariablesCache the values saved by the previous run are used right away, without connecting to the hosts,
+    then are resolved again in the background. When a value has changed, "on_changed" is called with the host
+    and the cache ids of the changed values (ex. to restart the tunnels that were created with the old values).
+    """
+
+    _timeout: float
+    _workers: int
+    _cache: Union[VariablesCache, None]
+    _on_changed: Union[Callable[[ConfigurationInterface, List[str]], None], None]
+
+    def __init__(self, timeout: float = 30, workers: int = 16, cache: VariablesCache = None,
+                 on_changed: Callable[[ConfigurationInterface, List[str]], None] = None):
+        self._timeout = timeout
+        self._workers = workers
+        self._cache = cache
+        self._on_changed = on_changed
+
+    def prefetch(self, configurations: List[ConfigurationInterface]) -> Dict[str, PrefetchResult]:
+        """
+        Each host has "timeout" seconds, counted from the moment its resolving has started - so hosts queued
+        behind slow ones get the full time as well. A host that does not make it is left resolving in the background
+        and its place is given to the next host
+
+        Threads: Blocking, at most for "timeout" seconds per each "workers" hosts
+        :return: Result per host ident
+        """
+
+        if not configurations:
+            return {}
+
+        started_at = monotonic()
+        queued = deque(configurations)
+        running = {}  # type: Dict[Future, Tuple[ConfigurationInterface, float]]
+        results = {}
+        revalidation = ThreadPoolExecutor(max_workers=min(self._workers, len(configurations)),
+                                          thread_name_prefix='tunman-revalidate')
+
+        try:
+            while queued or running:
+                while queued and len(running) < self._workers:
+                    configuration = queued.popleft()
+                    running[self._start(configuration, self._restore(configuration))] = (configuration, monotonic())
+
+                next_deadline = min(host_started_at for _, host_started_at in running.values()) + self._timeout
+                done, _ = wait(running, timeout=max(0, next_deadline - monotonic()), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    configuration, _ = running.pop(future)
+                    results[configuration.ident] = future.result()
+
+                    if results[configuration.ident].is_restored:
+                        revalidation.submit(self._revalidate_host, configuration)
+
+                for future, (configuration, host_started_at) in list(running.items()):
+                    if monotonic() >= host_started_at + self._timeout:
+                        running.pop(future)
+                        results[configuration.ident] = self._on_timeout(configuration, host_started_at)
+        finally:
+            # revalidation is left running in the background, its results land in the cache anyway
+            revalidation.shutdown(wait=False)
+
+        Logger.info('Resolved variables of %i/%i hosts in %.2fs' % (
+            len([result for result in results.values() if result.is_ok]), len(results), monotonic() - started_at
+        ))
+
+        return results
+
+    def _start(self, configuration: ConfigurationInterface, is_restored: bool) -> Future:
+        """ A thread per host, so a hung host could be abandoned without occupying a worker of the pool """
+
+        future = Future()
+        Thread(target=lambda: future.set_result(self._prefetch_host(configuration, is_restored)),
+               name='tunman-prefetch', daemon=True).start()
+
+        return future
+
+    def _on_timeout(self, configuration: ConfigurationInterface, started_at: float) -> PrefetchResult:
+        elapsed = monotonic() - started_at
+        Logger.warning('Variables of %s were not resolved within %.2fs, the tunnels will resolve them on start'
+                       % (configuration, self._timeout))
+        VARIABLES_RESOLVE_DURATION.observe(elapsed, host=configuration.ident, result='timeout')
+
+        return PrefetchResult(configuration.ident, False, elapsed, error='Timed out')
+
+    def _restore(self, configuration: ConfigurationInterface) -> bool:
+        values = self._cache.load(configuration.ident) if self._cache else {}
+
+        if values:
+            configuration.restore_variables(values)
+
+        return len(values) > 0
+
+    def _prefetch_host(self, configuration: ConfigurationInterface, is_restored: bool) -> PrefetchResult:
+        started_at = monotonic()
+
+        try:
+            variables = configuration.prefetch_variables()
+        except Exception as e:
+            elapsed = monotonic() - started_at
+            Logger.error('Cannot resolve variables of %s after %.2fs: %s' % (configuration, elapsed, str(e)))
+            VARIABLES_RESOLVE_DURATION.observe(elapsed, host=configuration.ident, result='error')
+
+            return PrefetchResult(configuration.ident, False, elapsed, error=str(e))
+
+        elapsed = monotonic() - started_at
+        Logger.info('%s %s for %s in %.2fs' % ('Restored' if is_restored else 'Resolved',
+                                               ', '.join(variables) or 'no variables', configuration, elapsed))
+        VARIABLES_RESOLVE_DURATION.observe(elapsed, host=configuration.ident,
+                                           result='restored' if is_restored else 'ok')
+
+        if self._cache and not is_restored:
+            self._cache.save(configuration.ident, configuration.get_resolved_variables())
+
+        return PrefetchResult(configuration.ident, True, elapsed, variables, is_restored=is_restored)
+
+    def _revalidate_host(self, configuration: ConfigurationInterface):
+        """ Resolves again the values restored from the cache - a changed value replaces the restored one """
+
+        started_at = monotonic()
+
+        try:
+            changed = configuration.revalidate_variables()
+        except Exception as e:
+            Logger.error('Cannot revalidate cached variables of %s, keeping them: %s' % (configuration, str(e)))
+            return
+
+        Logger.info('Revalidated cached variables of %s in %.2fs' % (configuration, monotonic() - started_at))
+        self._cache.save(configuration.ident, configuration.get_resolved_variables())
+
+        if changed:
+            Logger.warning('Cached variables of %s changed: %s' % (configuration, ', '.join(changed)))
+
+            if self._on_changed:
+                self._on_changed(configuration, changed)
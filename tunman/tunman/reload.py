@@ -0,0 +1,161 @@
+import os
+from threading import Event, Thread
+from typing import Callable, Dict, List, Tuple, Union
+from .model import HostTunnelDefinitions, Forwarding
+from .logger import Logger
+
+
+class ReloadPlan(object):
+    """ What has to be done with the running forwardings, to match the reloaded configuration """
+
+    added: List[Forwarding]
+    removed: List[Forwarding]
+    changed: List[Tuple[Forwarding, Forwarding]]
+    unchanged: List[Forwarding]
+    removed_hosts: List[HostTunnelDefinitions]
+    configurations: List[HostTunnelDefinitions]
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+        self.unchanged = []
+        self.removed_hosts = []
+        self.configurations = []
+
+    def get_forwardings_to_stop(self) -> List[Forwarding]:
+        return self.removed + [running for running, _ in self.changed]
+
+    def get_forwardings_to_start(self) -> List[Forwarding]:
+        return self.added + [reloaded for _, reloaded in self.changed]
+
+    def to_dict(self) -> dict:
+        return {
+            'added': [forwarding.ident for forwarding in self.added],
+            'removed': [forwarding.ident for forwarding in self.removed],
+            'restarted': [running.ident for running, _ in self.changed],
+            'unchanged': len(self.unchanged)
+        }
+
+
+class ConfigurationDiff(object):
+    """
+    Compares the running configuration with a freshly loaded one
+
+    Forwardings are matched by ident, and compared by the effective SSH command (with the variables resolved).
+    A host, whose connection details did not change, keeps its instance (resolved variables, SSH client,
+    master connection) and the reloaded forwardings are moved to it. When the connection details of a host
+    have changed, all of its forwardings are restarted.
+    """
+
+    @staticmethod
+    def create_plan(running: List[HostTunnelDefinitions], loaded: List[HostTunnelDefinitions]) -> ReloadPlan:
+        plan = ReloadPlan()
+        running_hosts = {configuration.ident: configuration for configuration in running}
+        running_forwardings = {forwarding.ident: forwarding for configuration in running
+                               for forwarding in configuration.forward}
+        loaded_idents = set()
+
+        for configuration in loaded:
+            previous = running_hosts.pop(configuration.ident, None)
+            is_kept = previous is not None and \
+                ConfigurationDiff._get_connection(previous) == ConfigurationDiff._get_connection(configuration)
+
+            if is_kept:
+                previous.update_settings(configuration)
+
+                for forwarding in configuration.forward:
+                    forwarding.bind_to(previous)
+
+            elif previous is not None:
+                plan.removed_hosts.append(previous)
+
+            host = previous if is_kept else configuration
+            forward = []
+
+            for forwarding in configuration.forward:
+                loaded_idents.add(forwarding.ident)
+                current = running_forwardings.get(forwarding.ident)
+
+                if current is None:
+                    plan.added.append(forwarding)
+                    forward.append(forwarding)
+
+                elif is_kept and ConfigurationDiff._is_same_tunnel(current, forwarding):
+                    current.update_supervision(forwarding)
+                    plan.unchanged.append(current)
+                    forward.append(current)
+
+                else:
+                    plan.changed.append((current, forwarding))
+                    forward.append(forwarding)
+
+            host.forward = forward
+            plan.configurations.append(host)
+
+        plan.removed_hosts += list(running_hosts.values())
+        plan.removed = [forwarding for ident, forwarding in running_forwardings.items() if ident not in loaded_idents]
+
+        return plan
+
+    @staticmethod
+    def _is_same_tunnel(running: Forwarding, loaded: Forwarding) -> bool:
+        running_signature = ConfigurationDiff._get_effective_signature(running)
+
+        return running_signature is not None and running_signature == ConfigurationDiff._get_effective_signature(loaded)
+
+    @staticmethod
+    def _get_effective_signature(forwarding: Forwarding) -> Union[str, None]:
+        """ Full command of the tunnel, None when it cannot be created (then the forwarding is restarted) """
+
+        try:
+            return forwarding.configuration.create_complete_command_with_supervision(forwarding)
+        except Exception as e:
+            Logger.warning('Cannot create the command for "%s": %s' % (forwarding, str(e)))
+            return None
+
+    @staticmethod
+    def _get_connection(configuration: HostTunnelDefinitions) -> tuple:
+        return (configuration.remote_user, configuration.remote_host, configuration.remote_port,
+                configuration.remote_key, configuration.remote_passphrase, configuration.remote_password,
+                configuration.ssh_opts, configuration.multiplexing)
+
+
+class ConfigurationWatcher(object):
+    """ Polls the configuration directory, calls "on_change" when any file was added, removed or modified """
+
+    _path: str
+    _interval: float
+    _on_change: Callable[[], None]
+    _stopped: Event
+
+    def __init__(self, path: str, interval: float, on_change: Callable[[], None]):
+        self._path = path
+        self._interval = interval
+        self._on_change = on_change
+        self._stopped = Event()
+
+    def start(self):
+        Thread(target=self._run, name='tunman-config-watcher', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        state = self._scan()
+
+        while not self._stopped.wait(self._interval):
+            current = self._scan()
+
+            if current != state:
+                Logger.info('Configuration at "%s" has changed' % self._path)
+                state = current
+                self._on_change()
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        try:
+            return {entry.name: (entry.stat().st_mtime, entry.stat().st_size)
+                    for entry in os.scandir(self._path) if entry.is_file()}
+        except OSError as e:
+            Logger.warning('Cannot scan "%s": %s' % (self._path, str(e)))
+            return {}
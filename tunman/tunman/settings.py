@@ -13,6 +13,52 @@ class Config(object):
     LOG_PATH = './tunman.log'
     SECRET_PREFIX = ''
 
+    # how often (in seconds) at most the process table could be scanned, the snapshot is shared between all tunnels
+    PROCESS_TABLE_TTL = float(os.getenv('TUNMAN_PROCESS_TABLE_TTL', 2))
+
+    # supervisor engine: "threads" (a thread per forwarding) or "asyncio" (coroutines on the web server loop)
+    ENGINE = os.getenv('TUNMAN_ENGINE', 'threads')
+
+    # asyncio engine: number of worker threads executing blocking calls (spawning, health checks)
+    ASYNC_WORKERS = int(os.getenv('TUNMAN_ASYNC_WORKERS', 16))
+
+    # startup and restarts: SSH processes spawned per second for a single host, and how many at once in a burst
+    SPAWN_RATE_PER_HOST = float(os.getenv('TUNMAN_SPAWN_RATE_PER_HOST', 2))
+    SPAWN_BURST_PER_HOST = float(os.getenv('TUNMAN_SPAWN_BURST_PER_HOST', 4))
+
+    # global limit of SSH processes being spawned at the same time
+    MAX_CONCURRENT_SPAWNS = int(os.getenv('TUNMAN_MAX_CONCURRENT_SPAWNS', 32))
+
+    # at startup: seconds to wait for resolving template variables ({{ remote_gw }} etc.) of each host,
+    # hosts that did not make it resolve their variables later, when their tunnels are spawned
+    PREFETCH_TIMEOUT = float(os.getenv('TUNMAN_PREFETCH_TIMEOUT', 30))
+
+    # at startup: number of hosts, whose template variables are resolved at once
+    PREFETCH_WORKERS = int(os.getenv('TUNMAN_PREFETCH_WORKERS', 16))
+
+    # resolved template variables could be saved in a file, so the next start does not have to connect to all hosts
+    # before spawning the tunnels (the values are resolved again in the background). Disabled by default
+    VARIABLES_CACHE_PATH = os.getenv('TUNMAN_VARIABLES_CACHE_PATH') or None
+    VARIABLES_CACHE_TTL = float(os.getenv('TUNMAN_VARIABLES_CACHE_TTL', 86400))
+
+    # template variables ({{ remote_gw }} etc.) are resolved again after this many seconds,
+    # or earlier - after a few failures of a tunnel in a row (0 disables that)
+    VARIABLES_TTL = float(os.getenv('TUNMAN_VARIABLES_TTL', 3600))
+    INVALIDATE_VARIABLES_AFTER_FAILURES = int(os.getenv('TUNMAN_INVALIDATE_VARIABLES_AFTER_FAILURES', 3))
+
+    # DNS lookups (remote_gw, health checks): seconds to keep resolved and failed lookups, and how long
+    # an expired address may still be used while it is being looked up again
+    DNS_TTL = float(os.getenv('TUNMAN_DNS_TTL', 300))
+    DNS_NEGATIVE_TTL = float(os.getenv('TUNMAN_DNS_NEGATIVE_TTL', 30))
+    DNS_STALE_TTL = float(os.getenv('TUNMAN_DNS_STALE_TTL', 3600))
+
+    # seconds between checks of the conf.d directory for changes, a change reloads the configuration (0 disables)
+    # the configuration could be also reloaded with SIGHUP, or with a POST request to /reload
+    CONFIG_WATCH_INTERVAL = float(os.getenv('TUNMAN_CONFIG_WATCH_INTERVAL', 0))
+
+    # on shutdown: seconds for all SSH processes to exit after SIGTERM, the rest is killed with SIGKILL
+    SHUTDOWN_TIMEOUT = float(os.getenv('TUNMAN_SHUTDOWN_TIMEOUT', 10))
+
 
 class ProdConfig(Config):
     """Production configuration."""
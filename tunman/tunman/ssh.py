@@ -1,62 +1,206 @@
-
 import paramiko
 import socket
 import time
-from typing import Union
+from threading import BoundedSemaphore, Condition, RLock
+from typing import Callable, List, Tuple, Union
 from traceback import format_exc
 from .logger import Logger
+from .metrics import SSH_EXEC_DURATION
 from .network.ipparser import ParsedNetworkingInformation
 
 
+class SSHSession:
+    """
+    Single, persistent SSH connection (transport) that carries multiple channels
+    """
+
+    client: paramiko.SSHClient
+    channels: int
+
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.channels = 0
+
+    def is_alive(self) -> bool:
+        transport = self.client.get_transport()
+
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
 class SSHClient:
     """
     Wrapper to a SSH client, adds timeouts, retries, error handling and the list of common commands
+
+    Keeps a pool of persistent sessions to the host, each session carries a bounded number of concurrent channels.
+    A new connection is made only when all sessions are busy, or when the transport is dead. Connecting does not
+    hold the lock of the pool.
     """
 
-    _ssh: paramiko.SSHClient
+    _sessions: List[SSHSession]
+    _slots: BoundedSemaphore
+    _lock: RLock
+    _condition: Condition
+    _is_connecting: bool
     _connection_setup: dict
     _timeout: int
+    _keepalive: int
+    _max_channels: int
+    _max_sessions: int
+    _retries: int
     _ip_route: Union[ParsedNetworkingInformation, None]
 
-    def __init__(self, host: str, port: int, user: str, key: str, password: str, passphrase: str, timeout: int = 15):
+    def __init__(self, host: str, port: int, user: str, key: str, password: str, passphrase: str, timeout: int = 15,
+                 keepalive: int = 15, max_sessions: int = 2, max_channels: int = 8, retries: int = 3):
         self._ip_route = None
         self._timeout = timeout
+        self._keepalive = keepalive
+        self._max_sessions = max_sessions
+        self._max_channels = max_channels
+        self._retries = retries
+        self._sessions = []
+        self._slots = BoundedSemaphore(max_sessions * max_channels)
+        self._lock = RLock()
+        self._condition = Condition(self._lock)
+        self._is_connecting = False
         self._connection_setup = {
             'hostname': host, 'port': port, 'username': user,
             'key_filename': key, 'password': password,
-            'passphrase': passphrase, 'look_for_keys': False
+            'passphrase': passphrase, 'look_for_keys': False,
+            'timeout': timeout
         }
 
-        self._connect()
-
-    def _connect(self):
+    def _connect(self) -> SSHSession:
         Logger.info('SSH internal connection is starting')
-        self._ssh = paramiko.SSHClient()
-        self._ssh.load_system_host_keys()
-        self._ssh.connect(**self._connection_setup)
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.connect(**self._connection_setup)
+        client.get_transport().set_keepalive(self._keepalive)
+
+        return SSHSession(client)
+
+    def _acquire_session(self) -> SSHSession:
+        """
+        Takes a channel of a live session. When all sessions are busy, a new one is connected - the handshake
+        is made outside of the lock, so the other commands could use sessions released meanwhile
+        """
+
+        with self._condition:
+            while True:
+                for session in self._sessions.copy():
+                    if not session.is_alive():
+                        Logger.warning('SSH internal connection is dead, dropping it')
+                        session.close()
+                        self._sessions.remove(session)
+
+                available = [session for session in self._sessions if session.channels < self._max_channels]
+
+                if available:
+                    session = min(available, key=lambda s: s.channels)
+                    session.channels += 1
+
+                    return session
+
+                # one handshake at a time, its session will most likely have a free channel for us
+                if not self._is_connecting:
+                    self._is_connecting = True
+                    break
+
+                self._condition.wait()
+
+        session = None
 
-    def raw_exec_command(self, command: str, env: dict = None, retries: int = 3) -> tuple:
         try:
-            stdin, stdout, stderr = self._ssh.exec_command(command, environment=env, timeout=self._timeout)
-        except (socket.timeout, paramiko.ssh_exception.SSHException):
-            Logger.warning('SSH command failed due to timeout, retrying')
-            self._connect()
-            return self.raw_exec_command(command, env, retries - 1)
-        except:
-            Logger.warning('SSH command not possible to execute')
-            Logger.warning(format_exc())
-
-            time.sleep(1)
-            self._connect()
-            return self.raw_exec_command(command, env, retries - 1)
-
-        return stdin, stdout, stderr
-
-    def exec(self, cmd: str, env: dict = None) -> str:
+            session = self._connect()
+        finally:
+            with self._condition:
+                self._is_connecting = False
+
+                if session:
+                    session.channels += 1
+                    self._sessions.append(session)
+
+                self._condition.notify_all()
+
+        return session
+
+    def _release_session(self, session: SSHSession):
+        with self._condition:
+            session.channels -= 1
+            self._condition.notify_all()
+
+    def raw_exec_command(self, command: str, env: dict = None, retries: int = None, timeout: float = None,
+                         on_line: Callable[[str], None] = None) -> Tuple[str, str]:
+        """
+        Executes a command on a channel of a pooled session, retries with an exponential back-off
+
+        :param retries: Number of retries, defaults to the retries of the client
+        :param timeout: Time the channel could stay silent, defaults to the timeout of the client
+        :param on_line: Receives each line of stdout as soon as it is printed, the lines received before a failure
+                        stay delivered
+        :return: stdout, stderr
+        """
+
+        retries = self._retries if retries is None else retries
+        timeout = self._timeout if timeout is None else timeout
+        attempt = 0
+
+        while True:
+            with self._slots:
+                session = None
+
+                try:
+                    session = self._acquire_session()
+                    started_at = time.monotonic()
+                    stdin, stdout, stderr = session.client.exec_command(command, environment=env, timeout=timeout)
+                    stdout_content = self._read_lines(stdout, on_line) if on_line else stdout.read().decode('utf-8')
+                    output = stdout_content, stderr.read().decode('utf-8')
+
+                    SSH_EXEC_DURATION.observe(time.monotonic() - started_at, host=self._connection_setup['hostname'])
+
+                    return output
+
+                except (socket.timeout, paramiko.ssh_exception.SSHException) as e:
+                    Logger.warning('SSH command failed due to timeout or SSH error, retrying. %s' % str(e))
+                    error = e
+
+                except Exception as e:
+                    Logger.warning('SSH command not possible to execute')
+                    Logger.warning(format_exc())
+                    error = e
+
+                finally:
+                    if session:
+                        self._release_session(session)
+
+            if attempt >= retries:
+                raise error
+
+            time.sleep(min(2 ** attempt * 0.5, 10))
+            attempt += 1
+
+    @staticmethod
+    def _read_lines(stdout, on_line: Callable[[str], None]) -> str:
+        content = ''
+
+        for line in stdout:
+            line = line.decode('utf-8') if isinstance(line, bytes) else line
+            content += line
+            on_line(line.rstrip("\n"))
+
+        return content
+
+    def exec(self, cmd: str, env: dict = None, retries: int = None, timeout: float = None,
+             on_line: Callable[[str], None] = None) -> str:
         Logger.debug('SSH cmd: %s' % cmd)
-        stdin, stdout, stderr = self.raw_exec_command(cmd, env=env)
-        stderr_content = stderr.read().decode('utf-8')
-        stdout_content = stdout.read().decode('utf-8').strip()
+        stdout_content, stderr_content = self.raw_exec_command(cmd, env=env, retries=retries, timeout=timeout,
+                                                               on_line=on_line)
+        stdout_content = stdout_content.strip()
 
         if stderr_content:
             Logger.warning('SSH stderr: %s' % stderr_content)
@@ -66,14 +210,21 @@ class SSHClient:
         return stdout_content
 
     def kill_all_sessions(self):
-        """ Kill all SSH sessions on the remote, then reconnect """
+        """ Kill all SSH sessions on the remote, our sessions will be reconnected on next use """
 
         try:
             self.exec('killall sshd || true')
-        except paramiko.ssh_exception.SSHException:
+        except (paramiko.ssh_exception.SSHException, socket.error):
             pass
 
-        self._connect()
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+
+            self._sessions = []
 
     def get_interface_ip(self, name: str) -> str:
         return self._get_parsed_ip_route().get_interface_ip(name)
@@ -84,6 +235,11 @@ class SSHClient:
     def get_route_gateway(self) -> str:
         return self._get_parsed_ip_route().gateway_interface_ip
 
+    def forget_ip_route(self):
+        """ The next call will execute "ip route" on the host again """
+
+        self._ip_route = None
+
     def _get_parsed_ip_route(self) -> ParsedNetworkingInformation:
         if self._ip_route is None:
             self._ip_route = ParsedNetworkingInformation(self.exec('ip route'))
@@ -0,0 +1,219 @@
+from collections import deque
+from threading import RLock
+from time import monotonic
+from typing import Callable, Deque, Dict, List, Tuple, Union
+from .model import Forwarding
+from .logger import Logger
+
+EVENT_REGISTERED = 'registered'
+EVENT_REMOVED = 'removed'
+EVENT_UP = 'up'
+EVENT_DOWN = 'down'
+EVENT_RESTART = 'restart'
+EVENT_PID_CHANGED = 'pid'
+
+
+class StatusBoard:
+    """
+    Incrementally updated status of all forwardings
+
+    The supervisor pushes state changes (spawned, alive, down), readers get a ready snapshot without touching
+    the processes. Anything rendered from the snapshot is memoized until the next change.
+
+    Health check statistics change with almost every probe, so they are not a change of the state - they are
+    published to the snapshot at most every "health_refresh_interval" seconds.
+
+    State transitions are published as numbered events to subscribers, a bounded history of events allows
+    a subscriber to resume from a sequence number.
+    """
+
+    _entries: Dict[str, dict]
+    _order: List[str]
+    _rendered: Dict[str, str]
+    _events: Deque[dict]
+    _subscribers: List[Callable[[dict], None]]
+    _health: Dict[str, dict]
+    _health_refresh_interval: float
+    _health_refreshed_at: float
+    _lock: RLock
+    version: int
+    sequence: int
+
+    def __init__(self, history_size: int = 1000, health_refresh_interval: float = 10):
+        self._entries = {}
+        self._order = []
+        self._rendered = {}
+        self._events = deque(maxlen=history_size)
+        self._subscribers = []
+        self._health = {}
+        self._health_refresh_interval = health_refresh_interval
+        self._health_refreshed_at = monotonic()
+        self._lock = RLock()
+        self.version = 0
+        self.sequence = 0
+
+    def register(self, forwarding: Forwarding, signature: str = ''):
+        with self._lock:
+            if forwarding.ident not in self._entries:
+                self._order.append(forwarding.ident)
+                self._entries[forwarding.ident] = {
+                    'is_alive': False,
+                    'current_pid': '',
+                    'ident': forwarding.ident,
+                    'signature': signature,
+                    'restarts_count': 0,
+                    'health_check': {}
+                }
+                self._changed()
+                self._publish(EVENT_REGISTERED, forwarding.ident)
+
+            if signature:
+                self._update(forwarding.ident, signature=signature)
+
+    def unregister(self, forwarding: Forwarding):
+        with self._lock:
+            entry = self._entries.pop(forwarding.ident, None)
+            self._health.pop(forwarding.ident, None)
+
+            if entry:
+                self._order.remove(forwarding.ident)
+                self._changed()
+                self._publish(EVENT_REMOVED, forwarding.ident, entry)
+
+    def on_started(self, forwarding: Forwarding):
+        self._update(forwarding.ident, restarts_count=forwarding.current_restart_count)
+
+    def on_alive(self, forwarding: Forwarding, pid: int):
+        self._update(forwarding.ident, is_alive=True, current_pid=pid)
+
+    def on_down(self, forwarding: Forwarding):
+        self._update(forwarding.ident, is_alive=False, current_pid='')
+
+    def on_health_check(self, forwarding: Forwarding, summary: dict):
+        """ Health check latency percentiles per sliding window, does not emit any event nor change the version """
+
+        with self._lock:
+            if forwarding.ident in self._entries:
+                self._health[forwarding.ident] = summary
+
+    def get_snapshot(self) -> dict:
+        with self._lock:
+            self._refresh_health()
+
+            return {
+                'forwardings': [dict(self._entries[ident]) for ident in self._order]
+            }
+
+    def subscribe(self, listener: Callable[[dict], None], since: Union[int, None] = None) \
+            -> Tuple[Union[List[dict], None], dict]:
+        """
+        Registers a listener of state transitions
+
+        :param listener: Called with each event, from the thread that changed the state
+        :param since: Sequence number of the last event the subscriber has seen
+        :return: Events after "since" (None if those are no longer in the history), and the current snapshot
+        """
+
+        with self._lock:
+            self._subscribers.append(listener)
+
+            snapshot = self.get_snapshot()
+            snapshot['seq'] = self.sequence
+
+            return self.events_since(since), snapshot
+
+    def unsubscribe(self, listener: Callable[[dict], None]):
+        with self._lock:
+            if listener in self._subscribers:
+                self._subscribers.remove(listener)
+
+    def events_since(self, since: Union[int, None]) -> Union[List[dict], None]:
+        with self._lock:
+            if since is None or since > self.sequence:
+                return None
+
+            if since == self.sequence:
+                return []
+
+            if not self._events or self._events[0]['seq'] > since + 1:
+                return None
+
+            return [event for event in self._events if event['seq'] > since]
+
+    def render(self, name: str, renderer: Callable[[dict], str]) -> str:
+        """ Renders the snapshot once per version """
+
+        with self._lock:
+            self._refresh_health()
+
+            if name not in self._rendered:
+                self._rendered[name] = renderer(self.get_snapshot())
+
+            return self._rendered[name]
+
+    def _update(self, ident: str, **values):
+        with self._lock:
+            entry = self._entries.get(ident)
+
+            if entry is None:
+                return
+
+            changed = {key: value for key, value in values.items() if entry.get(key) != value}
+
+            if changed:
+                entry.update(changed)
+                self._changed()
+
+                for event_type in self._get_transitions(changed, entry):
+                    self._publish(event_type, ident)
+
+    def _refresh_health(self):
+        """ Publishes the health check statistics collected since the last refresh """
+
+        if monotonic() - self._health_refreshed_at < self._health_refresh_interval:
+            return
+
+        self._health_refreshed_at = monotonic()
+        health, self._health = self._health, {}
+
+        for ident, summary in health.items():
+            entry = self._entries.get(ident)
+
+            if entry and entry['health_check'] != summary:
+                entry['health_check'] = summary
+                self._rendered = {}
+
+    def _changed(self):
+        self.version += 1
+        self._rendered = {}
+
+    @staticmethod
+    def _get_transitions(changed: dict, entry: dict) -> List[str]:
+        transitions = []
+
+        if 'is_alive' in changed:
+            transitions.append(EVENT_UP if entry['is_alive'] else EVENT_DOWN)
+        elif 'current_pid' in changed and entry['is_alive']:
+            transitions.append(EVENT_PID_CHANGED)
+
+        if 'restarts_count' in changed:
+            transitions.append(EVENT_RESTART)
+
+        return transitions
+
+    def _publish(self, event_type: str, ident: str, entry: dict = None):
+        self.sequence += 1
+        event = {
+            'seq': self.sequence,
+            'type': event_type,
+            'ident': ident,
+            'forwarding': dict(entry if entry else self._entries[ident])
+        }
+
+        self._events.append(event)
+
+        for listener in self._subscribers:
+            try:
+                listener(event)
+            except Exception as e:
+                Logger.warning('Status event listener failed: %s' % str(e))
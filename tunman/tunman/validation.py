@@ -1,15 +1,32 @@
 
 import psutil
-import socket
-from typing import Callable
+from concurrent.futures import Future
+from time import monotonic
+from typing import Callable, Union
 from .model import Forwarding, HostTunnelDefinitions
 from .logger import Logger
+from .manager.registry import ProcessRegistry
+from .network.portcheck import PortCheckEngine
+from .network.remotecheck import RemotePortCheckBatcher
+from .metrics import HEALTH_CHECK_DURATION
+
+DEFAULT_CONNECT_TIMEOUT = 15
 
 
-# @todo: Add connection timeouts
 class Validation:
+    port_checker: PortCheckEngine = PortCheckEngine()
+    remote_port_checker: RemotePortCheckBatcher = RemotePortCheckBatcher()
+
     @staticmethod
     def check_tunnel_alive(definition: Forwarding, configuration: HostTunnelDefinitions) -> bool:
+        started_at = monotonic()
+        result = Validation._run_health_check(definition, configuration)
+        Validation.record_health_check(definition, configuration, started_at, result)
+
+        return result
+
+    @staticmethod
+    def _run_health_check(definition: Forwarding, configuration: HostTunnelDefinitions) -> bool:
         validation = definition.validate.method
 
         try:
@@ -19,13 +36,15 @@ class Validation:
             if validation == 'local_port_ping':
                 return Validation.check_port_responding(
                     definition.local.get_host_as_ip_address(),
-                    definition.local.port
+                    definition.local.get_port(),
+                    Validation.get_connect_timeout(definition)
                 )
             elif validation == 'remote_port_ping':
                 return Validation.check_remote_port_responding(
                     definition.remote.get_host_as_ip_address(),
-                    definition.remote.port,
-                    configuration
+                    definition.remote.get_port(),
+                    configuration,
+                    Validation.get_connect_timeout(definition)
                 )
 
         except Exception as e:
@@ -36,7 +55,10 @@ class Validation:
         return True
 
     @staticmethod
-    def is_process_alive(signature: str) -> bool:
+    def is_process_alive(signature: str, registry: ProcessRegistry = None) -> bool:
+        if registry is not None:
+            return registry.find(signature) is not None
+
         for proc in psutil.process_iter():
             cmdline = " ".join(proc.cmdline())
 
@@ -46,17 +68,66 @@ class Validation:
         return False
 
     @staticmethod
-    def check_port_responding(host: str, port: int) -> bool:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(15)
+    def submit_health_check(definition: Forwarding, configuration: HostTunnelDefinitions) -> Union[Future, None]:
+        """
+        Starts a non-blocking "local_port_ping" or "remote_port_ping" health check
+
+        :return: Future resolved with the check result, None when the forwarding uses other health check method
+        """
+
+        validation = definition.validate.method
+        started_at = monotonic()
+        future = None
 
         try:
-            return sock.connect_ex((host, port)) == 0
-        finally:
-            sock.close()
+            if validation == 'local_port_ping':
+                future = Validation.port_checker.submit(
+                    definition.local.get_host_as_ip_address(),
+                    definition.local.get_port(),
+                    Validation.get_connect_timeout(definition)
+                )
+            elif validation == 'remote_port_ping':
+                future = Validation.remote_port_checker.submit(
+                    configuration,
+                    definition.remote.get_host_as_ip_address(),
+                    definition.remote.get_port(),
+                    Validation.get_connect_timeout(definition)
+                )
+
+        except Exception as e:
+            Logger.error('Validation error:' + str(e))
+
+            future = Future()
+            future.set_result(False)
+
+        if future is not None:
+            future.add_done_callback(
+                lambda done: Validation.record_health_check(definition, configuration, started_at, done.result()))
+
+        return future
+
+    @staticmethod
+    def record_health_check(definition: Forwarding, configuration: HostTunnelDefinitions, started_at: float,
+                            result: bool):
+        rtt = monotonic() - started_at
+
+        definition.health_history.record(rtt, result)
+        HEALTH_CHECK_DURATION.observe(rtt, forwarding=definition.ident,
+                                      host=configuration.ident, result='ok' if result else 'failed')
+
+    @staticmethod
+    def get_connect_timeout(definition: Forwarding) -> int:
+        timeout = definition.health_check_connect_timeout
+
+        return timeout if timeout and timeout > 0 else DEFAULT_CONNECT_TIMEOUT
+
+    @staticmethod
+    def check_port_responding(host: str, port: int, timeout: int = DEFAULT_CONNECT_TIMEOUT) -> bool:
+        return Validation.port_checker.check(host, port, timeout)
 
     @staticmethod
-    def check_remote_port_responding(host: str, port: int, configuration: HostTunnelDefinitions) -> bool:
-        exit_code = int(configuration.exec_ssh('nc -zw15 %s %i 1>&2; echo $?' % (host, port)).strip())
+    def check_remote_port_responding(host: str, port: int, configuration: HostTunnelDefinitions,
+                                     timeout: int = DEFAULT_CONNECT_TIMEOUT) -> bool:
+        """ Checks of the same host are batched into one SSH command """
 
-        return exit_code == 0
+        return Validation.remote_port_checker.check(configuration, host, port, timeout)
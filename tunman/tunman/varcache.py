@@ -0,0 +1,84 @@
+import json
+import os
+from threading import Lock
+from time import time
+from typing import Dict, Union
+from .logger import Logger
+
+
+class VariablesCache(object):
+    """
+    Resolved template variables of all hosts, persisted in a JSON file between restarts of the application
+
+    {
+        "user@host:22": {"saved_at": 1700000000.0, "values": {"get_remote_gateway": "192.168.1.2", ...}},
+        ...
+    }
+
+    Entries older than "ttl" seconds are not restored.
+    """
+
+    _path: str
+    _ttl: float
+    _entries: Union[Dict[str, dict], None]
+    _lock: Lock
+
+    def __init__(self, path: str, ttl: float = 86400):
+        self._path = path
+        self._ttl = ttl
+        self._entries = None
+        self._lock = Lock()
+
+    def load(self, ident: str) -> dict:
+        """
+        :param ident: ConfigurationInterface.ident
+        :return: Values of the HostTunnelDefinitions cache, empty when nothing fresh enough was saved
+        """
+
+        with self._lock:
+            entry = self._get_entries().get(ident)
+
+        if not entry or time() - entry.get('saved_at', 0) > self._ttl:
+            return {}
+
+        return dict(entry.get('values', {}))
+
+    def save(self, ident: str, values: dict):
+        with self._lock:
+            entries = self._get_entries()
+            entries[ident] = {'saved_at': time(), 'values': values}
+
+            self._write(entries)
+
+    def _get_entries(self) -> Dict[str, dict]:
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+
+        if not os.path.isfile(self._path):
+            return self._entries
+
+        try:
+            with open(self._path, 'rb') as f:
+                self._entries = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            Logger.warning('Variables cache at %s is not readable, starting with an empty one: %s'
+                           % (self._path, str(e)))
+
+        return self._entries
+
+    def _write(self, entries: Dict[str, dict]):
+        # written to a temporary file first, so a crash never leaves a half-written cache
+        tmp_path = self._path + '.tmp'
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            os.makedirs(directory, exist_ok=True)
+
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(json.dumps(entries, indent=4, sort_keys=True).encode('utf-8'))
+
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            Logger.warning('Cannot save the variables cache at %s: %s' % (self._path, str(e)))
@@ -1,66 +1,49 @@
 
 import os
 import json
-from typing import Optional, Awaitable
+from datetime import timedelta
+from typing import Optional, Awaitable, Union
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.queues import Queue, QueueFull
+from tornado.util import TimeoutError
 from tornado.web import RequestHandler
-from jinja2 import Environment, FileSystemLoader
-from typing import List
+from jinja2 import Environment, FileSystemLoader, Template
 from .app import TunManApplication
-from .model import Forwarding
+from .exceptions import ConfigurationError
+from .metrics import REGISTRY
 
 
 class ServeStatusHandler(RequestHandler):
     app: TunManApplication = None
+    template: Union[Template, None] = None
 
     def data_received(self, chunk: bytes) -> Optional[Awaitable[None]]:
         pass
 
     def get(self):
-        loader = FileSystemLoader(os.path.dirname(os.path.abspath(__file__)) + '/templates')
-        tpl = Environment(loader=loader, autoescape=False).get_template('status.html.j2')
-
-        self.write(tpl.render(**self._get_data()))
-
-    def _get_data(self) -> dict:
-        all_forwardings = self._get_forwardings()
-        stats = self.app.tun_manager.get_stats(all_forwardings)
-        data = {
-            'forwardings': []
-        }
-
-        for definition in all_forwardings:
-            forwarding = {
-                'is_alive': False,
-                'current_pid': '',
-                'ident': definition.ident,
-                'signature': definition.create_ssh_forwarding_signature(),
-                'restarts_count': 0
-            }
-
-            if definition in stats['status']:
-                forwarding['is_alive'] = stats['status'][definition]['is_alive']
-                forwarding['current_pid'] = stats['status'][definition]['pid']
-                forwarding['restarts_count'] = stats['status'][definition]['restarts_count']
-
-            data['forwardings'].append(forwarding)
+        self.write(self.app.tun_manager.status.render('html', lambda data: self._get_template().render(**data)))
 
-        return data
+    @staticmethod
+    def _get_template() -> Template:
+        """ The template is compiled once per application lifetime """
 
-    def _get_forwardings(self) -> List[Forwarding]:
-        all_definitions = []
+        if ServeStatusHandler.template is None:
+            loader = FileSystemLoader(os.path.dirname(os.path.abspath(__file__)) + '/templates')
+            ServeStatusHandler.template = Environment(loader=loader, autoescape=False).get_template('status.html.j2')
 
-        for host_tunnels in self.app.config.provide_all_configurations():
-            for tunnel in host_tunnels.forward:
-                all_definitions.append(tunnel)
-
-        return all_definitions
+        return ServeStatusHandler.template
 
 
 class ServeJsonStatus(ServeStatusHandler):
     def get(self):
         """ Returns a JSON formatted status page """
 
-        data = self._get_data()
+        self.add_header('Content-Type', 'application/json')
+        self.write(self.app.tun_manager.status.render('json', self._render_json))
+
+    @staticmethod
+    def _render_json(data: dict) -> str:
         tunnels = {}
         global_status = True
 
@@ -70,17 +53,121 @@ class ServeJsonStatus(ServeStatusHandler):
 
             tunnels[forwarding['ident']] = {
                 'ok': forwarding['is_alive'],
-                'ident': forwarding['ident'] + '=' + str(forwarding['is_alive'])
+                'ident': forwarding['ident'] + '=' + str(forwarding['is_alive']),
+                'health_check': forwarding['health_check']
             }
 
+        return json.dumps({
+            'status': {
+                'tunnels': tunnels,
+                'ident': 'global_status=' + str(global_status),
+                'ok': global_status
+            },
+            'data': data
+        }, indent=4)
+
+
+class ServeMetrics(ServeStatusHandler):
+    def get(self):
+        """ Returns metrics in Prometheus text exposition format """
+
+        self.app.tun_manager.collect_metrics()
+
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(REGISTRY.render())
+
+
+class ServeReload(ServeStatusHandler):
+    async def post(self):
+        """ Reloads the configuration, responds with forwardings that were added, removed and restarted """
+
         self.add_header('Content-Type', 'application/json')
-        self.write(
-            json.dumps({
-                'status': {
-                    'tunnels': tunnels,
-                    'ident': 'global_status=' + str(global_status),
-                    'ok': global_status
-                },
-                'data': data
-            }, indent=4)
-        )
+
+        try:
+            plan = await IOLoop.current().run_in_executor(None, self.app.reload)
+        except ConfigurationError as e:
+            self.set_status(400)
+            self.write(json.dumps({'ok': False, 'error': str(e)}, indent=4))
+            return
+
+        self.write(json.dumps(dict(plan.to_dict(), ok=True), indent=4))
+
+
+class ServeEventStream(ServeStatusHandler):
+    """
+    Server-Sent Events stream of tunnel state transitions (up, down, restart, pid)
+
+    Starts with a full snapshot, or - when the client sends "Last-Event-ID" header (or "?since=" argument)
+    that is still in the history - with the events it has missed.
+    """
+
+    keepalive_interval = 15
+    max_queued_events = 1000
+
+    _queue: Queue
+    _is_finished: bool
+
+    async def get(self):
+        board = self.app.tun_manager.status
+        loop = IOLoop.current()
+        self._queue = Queue(maxsize=self.max_queued_events)
+        self._is_finished = False
+
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+
+        listener = lambda event: loop.add_callback(self._push, event)
+        missed_events, snapshot = board.subscribe(listener, since=self._get_last_event_id())
+
+        try:
+            if missed_events is None:
+                self._write_event(snapshot['seq'], 'snapshot', snapshot)
+            else:
+                for event in missed_events:
+                    self._write_event(event['seq'], event['type'], event)
+
+            await self.flush()
+
+            while not self._is_finished:
+                try:
+                    event = await self._queue.get(timeout=timedelta(seconds=self.keepalive_interval))
+
+                    if event is None:
+                        break
+
+                    self._write_event(event['seq'], event['type'], event)
+                except TimeoutError:
+                    self.write(': keepalive\n\n')
+
+                await self.flush()
+
+        except StreamClosedError:
+            pass
+
+        finally:
+            board.unsubscribe(listener)
+
+    def _push(self, event: Union[dict, None]):
+        if not hasattr(self, '_queue'):
+            return
+
+        try:
+            self._queue.put_nowait(event)
+        except QueueFull:
+            # the client is too slow, it will reconnect and resume from its last event id
+            self._is_finished = True
+
+    def on_connection_close(self):
+        self._is_finished = True
+
+        # wake up the waiting stream
+        self._push(None)
+
+    def _write_event(self, seq: int, event_type: str, data: dict):
+        self.write('id: %i\nevent: %s\ndata: %s\n\n' % (seq, event_type, json.dumps(data)))
+
+    def _get_last_event_id(self) -> Union[int, None]:
+        last_id = self.request.headers.get('Last-Event-ID', self.get_argument('since', ''))
+
+        return int(last_id) if last_id.isdigit() else None
+